@@ -0,0 +1,420 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import click
+from rich import print
+from rich.table import Table
+
+from benchmarks.stub_servers import StubSettings, serve_stubs
+
+MiB = 1024 * 1024
+
+LAG_INTERVAL = 0.05
+""" 事件循环延迟的采样间隔（秒） """
+RSS_INTERVAL = 0.2
+""" RSS 的采样间隔（秒） """
+
+BILIBILI_HOSTS = ("api.bilibili.com", "www.bilibili.com")
+IA_HOSTS = ("archive.org", "s3.us.archive.org")
+
+
+@dataclass
+class StageResult:
+    stage: str
+    bvs: int
+    parts: int
+    seconds: float
+    bytes: int
+    peak_rss: int
+    loop_lag_p99: Optional[float] = None
+    loop_lag_max: Optional[float] = None
+
+    @property
+    def bvs_per_second(self) -> float:
+        return self.bvs / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / MiB / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class BenchmarkReport:
+    settings: Dict
+    bvs: int
+    results: List[StageResult] = field(default_factory=list)
+
+
+def install_redirects(hosts: Dict[str, int]):
+    """
+    把发往 B 站和 IA 的请求改写到本地替身（http://127.0.0.1:port，路径不变）。
+    改写发生在 httpx / requests 的传输层，所以限速器等按 URL 分类的逻辑看到的仍是原始 host
+    """
+    import httpx
+    import requests.adapters
+
+    def redirect(url: str) -> str:
+        parts = urlsplit(url)
+        port = hosts.get(parts.hostname or "")
+        if port is None:
+            return url
+        return urlunsplit(("http", f"127.0.0.1:{port}", parts.path, parts.query, parts.fragment))
+
+    def redirect_httpx(request: httpx.Request):
+        port = hosts.get(request.url.host)
+        if port is not None:
+            request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=port)
+
+    async_handle = httpx.AsyncHTTPTransport.handle_async_request
+    sync_handle = httpx.HTTPTransport.handle_request
+    requests_send = requests.adapters.HTTPAdapter.send
+
+    async def handle_async_request(self, request):
+        redirect_httpx(request)
+        return await async_handle(self, request)
+
+    def handle_request(self, request):
+        redirect_httpx(request)
+        return sync_handle(self, request)
+
+    def send(self, request, *args, **kwargs):
+        request.url = redirect(request.url)
+        return requests_send(self, request, *args, **kwargs)
+
+    httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+    httpx.HTTPTransport.handle_request = handle_request
+    requests.adapters.HTTPAdapter.send = send
+
+
+def install_concat_merge():
+    """ 替身媒体流不是真的音视频，用拼接代替 ffmpeg 合并（也不再要求安装 ffmpeg） """
+    from bilix import ffmpeg
+
+    import biliarchiver.archive_bvid  # noqa: F401  先让它包装好 ffmpeg.combine
+    from biliarchiver.cli_tools import bili_archive_bvids
+    from biliarchiver.utils.tracing import traced
+
+    async def concat_files(path_lst, output_path, remove=True):
+        def concat():
+            with open(output_path, "wb") as out:
+                for path in path_lst:
+                    with open(path, "rb") as f:
+                        shutil.copyfileobj(f, out, 1024 * 1024)
+            if remove:
+                for path in path_lst:
+                    os.remove(path)
+
+        await asyncio.get_running_loop().run_in_executor(None, concat)
+
+    ffmpeg.combine = traced("down.merge")(concat_files)
+    ffmpeg.concat = traced("down.merge")(concat_files)
+    bili_archive_bvids.check_ffmpeg = lambda: True
+
+
+def _current_rss() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # 非 Linux：只有整个进程的峰值，单位 macOS 为字节、其他为 KiB
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+
+
+class RSSSampler:
+    """ 后台线程定时采样 RSS，记录各阶段内的峰值 """
+
+    def __init__(self, interval: float = RSS_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss_sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss())
+
+
+async def _monitor_loop_lag(samples: List[float]):
+    """ 每隔 LAG_INTERVAL 醒一次，记录实际多睡了多久 """
+    while True:
+        begin = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(time.perf_counter() - begin - LAG_INTERVAL)
+
+
+def _count_finished(bvids: List[str], mark: str) -> Tuple[int, int]:
+    """ 返回 (所有分P都带 mark 的 BV 数, 带 mark 的分P数) """
+    from biliarchiver.config import config
+    from biliarchiver.utils.identifier import human_readable_upper_part_map
+
+    bvs = parts = 0
+    for bvid in bvids:
+        videos_basepath = (
+            config.storage_home_dir / "videos" / f"{bvid}-{human_readable_upper_part_map(string=bvid, backward=True)}"
+        )
+        part_dirs = [p for p in videos_basepath.glob("*/") if p.is_dir() and not p.name.startswith("_")]
+        finished = [p for p in part_dirs if (p / mark).exists()]
+        parts += len(finished)
+        bvs += bool(part_dirs) and len(finished) == len(part_dirs)
+    return bvs, parts
+
+
+def run_down(bvids: List[str]) -> StageResult:
+    from biliarchiver.cli_tools.bili_archive_bvids import _down
+    from biliarchiver.config import config
+    from biliarchiver.utils.storage import get_dir_size
+    from biliarchiver.utils.tracing import percentile
+
+    lag_samples: List[float] = []
+
+    async def main():
+        monitor = asyncio.create_task(_monitor_loop_lag(lag_samples))
+        try:
+            await _down(
+                " ".join(bvids),
+                skip_ia_check=False,
+                from_browser=None,
+                min_free_space_gb=0,
+                skip_to=0,
+                disable_version_check=True,
+            )
+        finally:
+            monitor.cancel()
+
+    with RSSSampler() as rss:
+        begin = time.perf_counter()
+        asyncio.run(main())
+        seconds = time.perf_counter() - begin
+    bvs, parts = _count_finished(bvids, "_downloaded.mark")
+    lag_samples.sort()
+    return StageResult(
+        stage="down",
+        bvs=bvs,
+        parts=parts,
+        seconds=seconds,
+        bytes=get_dir_size(config.storage_home_dir / "videos"),
+        peak_rss=rss.peak,
+        loop_lag_p99=percentile(lag_samples, 99),
+        loop_lag_max=lag_samples[-1] if lag_samples else None,
+    )
+
+
+def run_up(bvids: List[str]) -> StageResult:
+    from biliarchiver._biliarchiver_upload_bvid import upload_bvid
+    from biliarchiver.cli_tools.up_command import DEFAULT_COLLECTION
+    from biliarchiver.config import config
+    from biliarchiver.utils.storage import get_dir_size
+
+    nbytes = get_dir_size(config.storage_home_dir / "videos")
+    with RSSSampler() as rss:
+        begin = time.perf_counter()
+        for bvid in bvids:
+            try:
+                upload_bvid(bvid, collection=DEFAULT_COLLECTION)
+            except Exception as e:
+                print(f"{bvid}: {e}")
+        seconds = time.perf_counter() - begin
+    bvs, parts = _count_finished(bvids, "_uploaded.mark")
+    return StageResult(stage="up", bvs=bvs, parts=parts, seconds=seconds, bytes=nbytes, peak_rss=rss.peak)
+
+
+def run_run(bvids: List[str]) -> StageResult:
+    """ biliarchiver run：下载和上传流水线式进行，和 down + up 的总耗时比较 """
+    from biliarchiver.cli_tools.up_command import DEFAULT_COLLECTION
+    from biliarchiver.config import config
+    from biliarchiver.pipeline import run_pipeline
+    from biliarchiver.utils.storage import get_dir_size
+    from biliarchiver.utils.tracing import percentile
+
+    lag_samples: List[float] = []
+
+    async def main():
+        monitor = asyncio.create_task(_monitor_loop_lag(lag_samples))
+        try:
+            await run_pipeline(
+                collection=DEFAULT_COLLECTION,
+                delete_after_upload=False,
+                bvids=" ".join(bvids),
+                skip_ia_check=False,
+                from_browser=None,
+                min_free_space_gb=0,
+                skip_to=0,
+                disable_version_check=True,
+            )
+        finally:
+            monitor.cancel()
+
+    with RSSSampler() as rss:
+        begin = time.perf_counter()
+        asyncio.run(main())
+        seconds = time.perf_counter() - begin
+    bvs, parts = _count_finished(bvids, "_uploaded.mark")
+    lag_samples.sort()
+    return StageResult(
+        stage="run",
+        bvs=bvs,
+        parts=parts,
+        seconds=seconds,
+        bytes=get_dir_size(config.storage_home_dir / "videos"),
+        peak_rss=rss.peak,
+        loop_lag_p99=percentile(lag_samples, 99),
+        loop_lag_max=lag_samples[-1] if lag_samples else None,
+    )
+
+
+def prepare_workdir(workdir: Path, api_rate: float):
+    """ 在 workdir 里初始化一个 biliarchiver 工作目录，写好假的 cookies 和 IA keys """
+    from biliarchiver.config import config
+    from biliarchiver.utils.ratelimit import DEFAULT_RATES
+
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+    Path("biliarchiver.home").touch()
+    cookies_file = workdir / "cookies.txt"
+    cookies_file.write_text(
+        "# Netscape HTTP Cookie File\n"
+        ".bilibili.com\tTRUE\t/\tFALSE\t0\tSESSDATA\tbenchmark\n",
+        encoding="utf-8",
+    )
+    ia_key_file = workdir / "ia_keys.txt"
+    ia_key_file.write_text("benchmark-access\nbenchmark-secret\n", encoding="utf-8")
+
+    config.storage_home_dir = workdir / "bilibili_archive_dir"
+    config.cookies_file = cookies_file
+    config.cookies_pool = None
+    config.ia_key_file = ia_key_file
+    # 默认速率是按真实 B 站风控定的，基准里不放宽的话测到的只是限速器
+    config.rate_limits = {endpoint_class: api_rate for endpoint_class in DEFAULT_RATES}
+    config.save()
+
+
+def print_report(report: BenchmarkReport):
+    table = Table(title=f"{report.bvs} BV × {report.settings['parts']} P")
+    for column in ("stage", "BV", "P", "seconds", "BV/s", "MB/s", "peak RSS MiB", "loop lag p99 ms", "loop lag max ms"):
+        table.add_column(column, justify="left" if column == "stage" else "right")
+    for r in report.results:
+        table.add_row(
+            r.stage,
+            str(r.bvs),
+            str(r.parts),
+            f"{r.seconds:.1f}",
+            f"{r.bvs_per_second:.2f}",
+            f"{r.mb_per_second:.1f}",
+            f"{r.peak_rss / MiB:.0f}",
+            f"{r.loop_lag_p99 * 1000:.1f}" if r.loop_lag_p99 is not None else "",
+            f"{r.loop_lag_max * 1000:.1f}" if r.loop_lag_max is not None else "",
+        )
+    print(table)
+
+
+@click.command(help="端到端吞吐基准（本地替身服务器）")
+@click.option("--bvs", type=int, default=20, show_default=True, help="合成的 BV 数")
+@click.option("--parts", type=int, default=2, show_default=True, help="每个 BV 的分P数")
+@click.option("--video-mib", type=float, default=8, show_default=True, help="每个分P的视频流大小 (MiB)")
+@click.option("--audio-mib", type=float, default=1, show_default=True, help="每个分P的音频流大小 (MiB)")
+@click.option("--danmaku", type=int, default=200, show_default=True, help="每个分P的弹幕条数")
+@click.option("--latency-ms", type=float, default=20, show_default=True, help="替身服务器每个响应前的延迟")
+@click.option("--cdn-mbps", type=float, default=0, show_default=True, help="base_url 单连接带宽 (MiB/s)，0 为不限")
+@click.option("--backup-mbps", type=float, default=None, help="backup_url 单连接带宽 (MiB/s)，默认同 --cdn-mbps")
+@click.option("--ia-mbps", type=float, default=0, show_default=True, help="IA S3 单连接带宽 (MiB/s)，0 为不限")
+@click.option("--api-rate", type=float, default=1000, show_default=True, help="B 站 API 各端点类别的限速 (请求/秒)")
+@click.option(
+    "--stages",
+    type=click.Choice(["down", "up", "both", "run"]),
+    default="both",
+    show_default=True,
+    help="跑哪些阶段（只跑 up 时需要 --workdir 指向已经 down 过的目录；run 为下载上传流水线）",
+)
+@click.option("--workdir", type=click.Path(file_okay=False, path_type=Path), default=None, help="工作目录，默认用临时目录")
+@click.option("--keep", is_flag=True, default=False, help="结束后保留临时工作目录")
+@click.option("--output", type=click.Path(dir_okay=False, path_type=Path), default=None, help="把结果写入 JSON 文件")
+def main(
+    bvs, parts, video_mib, audio_mib, danmaku, latency_ms, cdn_mbps, backup_mbps, ia_mbps,
+    api_rate, stages, workdir, keep, output,
+):
+    from biliarchiver.utils.avbv import av2bv
+
+    settings = StubSettings(
+        parts=parts,
+        video_bytes=int(video_mib * MiB),
+        audio_bytes=int(audio_mib * MiB),
+        danmaku=danmaku,
+        latency=latency_ms / 1000,
+        cdn_bandwidth=cdn_mbps * MiB,
+        backup_bandwidth=(cdn_mbps if backup_mbps is None else backup_mbps) * MiB,
+        ia_bandwidth=ia_mbps * MiB,
+    )
+    output = output.resolve() if output else None
+    temporary = workdir is None
+    workdir = Path(tempfile.mkdtemp(prefix="biliarchiver-bench-")) if temporary else workdir.resolve()
+
+    # spawn：替身进程不继承本进程之后打的补丁，也不和它抢 GIL
+    context = multiprocessing.get_context("spawn")
+    ports_queue = context.Queue()
+    stub_process = context.Process(target=serve_stubs, args=(asdict(settings), ports_queue), daemon=True)
+    stub_process.start()
+    try:
+        bilibili_port, ia_port = ports_queue.get(timeout=30)
+        install_redirects(
+            {**{host: bilibili_port for host in BILIBILI_HOSTS}, **{host: ia_port for host in IA_HOSTS}}
+        )
+        install_concat_merge()
+        prepare_workdir(workdir, api_rate)
+        print(f"workdir: {workdir}")
+
+        bvids = [av2bv(170001 + i) for i in range(bvs)]
+        report = BenchmarkReport(settings=asdict(settings), bvs=bvs)
+        if stages in ("down", "both"):
+            report.results.append(run_down(bvids))
+        if stages in ("up", "both"):
+            report.results.append(run_up(bvids))
+        if stages == "run":
+            report.results.append(run_run(bvids))
+    finally:
+        stub_process.terminate()
+        stub_process.join()
+        if temporary and not keep:
+            os.chdir(tempfile.gettempdir())
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "settings": report.settings,
+                    "bvs": report.bvs,
+                    "results": [
+                        dict(asdict(r), bvs_per_second=r.bvs_per_second, mb_per_second=r.mb_per_second)
+                        for r in report.results
+                    ],
+                },
+                f,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+from biliarchiver.utils.avbv import bv2av
+
+CHUNK_SIZE = 64 * 1024
+""" 限速发送 / 接收的粒度 """
+_BLOCK = random.Random(0).randbytes(1024 * 1024)
+""" 合成媒体流的内容：这 1 MiB 随机字节循环铺满整个文件，支持任意 Range """
+
+STUB_UPLOADER = "benchmark@example.org"
+""" IA-S3 check_auth 返回的用户名，也是替身 item 的 uploader """
+WBI_IMG = {
+    "img_url": "https://i0.hdslb.com/bfs/wbi/7cd084941338484aae1ad9425b84077c.png",
+    "sub_url": "https://i0.hdslb.com/bfs/wbi/4932caff0ff746eab6f01bf08b70ac45.png",
+}
+
+
+@dataclass
+class StubSettings:
+    parts: int = 2
+    """ 每个 BV 的分P数 """
+    video_bytes: int = 8 * 1024 * 1024
+    audio_bytes: int = 1024 * 1024
+    duration: int = 60
+    """ 每个分P的时长（秒），只影响体积估算 """
+    danmaku: int = 200
+    """ 每个分P的弹幕条数 """
+    latency: float = 0.02
+    """ 每个响应（API、媒体流首字节、IA）前的延迟（秒） """
+    cdn_bandwidth: float = 0
+    """ base_url（127.0.0.1）单连接带宽（字节/秒），0 为不限 """
+    backup_bandwidth: float = 0
+    """ backup_url（localhost）单连接带宽，0 为不限 """
+    ia_bandwidth: float = 0
+    """ IA S3 接收上传的单连接带宽，0 为不限 """
+
+
+def _throttled(chunks: Iterator[bytes], bandwidth: float) -> Iterator[bytes]:
+    """ 按 bandwidth 字节/秒的速度放出 chunks """
+    begin = time.monotonic()
+    sent = 0
+    for chunk in chunks:
+        yield chunk
+        sent += len(chunk)
+        if bandwidth:
+            delay = begin + sent / bandwidth - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def _media_chunks(start: int, end: int) -> Iterator[bytes]:
+    """ 合成流中 [start, end] 的字节 """
+    offset = start
+    while offset <= end:
+        block_offset = offset % len(_BLOCK)
+        size = min(CHUNK_SIZE, len(_BLOCK) - block_offset, end - offset + 1)
+        yield _BLOCK[block_offset : block_offset + size]
+        offset += size
+
+
+def _parse_range(header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    if not header or not header.startswith("bytes="):
+        return None
+    first, _sep, last = header[len("bytes=") :].split(",")[0].partition("-")
+    start = int(first) if first else max(0, total - int(last))
+    end = min(int(last), total - 1) if first and last else total - 1
+    return start, end
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive，和真实服务器一样复用连接
+    # 响应头和响应体是分两次写的，复用连接时 Nagle + 延迟 ACK 会让每个响应多等 40ms（真实服务器不会）
+    disable_nagle_algorithm = True
+
+    @property
+    def settings(self) -> StubSettings:
+        return self.server.settings  # type: ignore
+
+    def send_body(self, body: bytes, content_type="application/json", status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, obj, status=200):
+        self.send_body(json.dumps(obj, ensure_ascii=False).encode("utf-8"), status=status)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BilibiliStubHandler(_StubHandler):
+    """
+    B 站 API 和 dash CDN 的替身，数据由 bvid 确定性地生成。
+    媒体流在 /media/ 下，同一个流的 base_url 指向 127.0.0.1、backup_url 指向 localhost，
+    两个 host 的单连接带宽分别可调，用来观察 CDN 镜像的挑选与切换。
+    """
+
+    def do_GET(self):
+        time.sleep(self.settings.latency)
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path.startswith("/media/"):
+            return self.send_media(int(query["size"]))
+        if url.path.startswith("/cover/"):
+            return self.send_body(_BLOCK[:32 * 1024], content_type="image/jpeg")
+        routes = {
+            "/x/member/web/account": lambda: {"code": 0, "data": {"mid": 1, "uname": "bench"}},
+            "/x/web-interface/nav": lambda: {"code": 0, "data": {"isLogin": True, "wbi_img": WBI_IMG}},
+            "/x/web-interface/view": lambda: {"code": 0, "data": self.view(query["bvid"])},
+            "/x/web-interface/view/detail": lambda: {
+                "code": 0,
+                "data": {"View": self.view(query["bvid"]), "Tags": [{"tag_name": "benchmark"}]},
+            },
+            "/x/player/playurl": lambda: {
+                "code": 0,
+                "data": self.playurl(query["bvid"], int(query["cid"])),
+            },
+            "/x/player/wbi/v2": lambda: {"code": 0, "data": {"subtitle": {"subtitles": []}}},
+            "/x/v2/reply": lambda: {"code": 0, "data": {"replies": self.replies(int(query["oid"]))}},
+        }
+        if url.path in routes:
+            return self.send_json(routes[url.path]())
+        if url.path == "/x/v2/dm/web/view":
+            return self.send_body(self.dm_view(), content_type="application/octet-stream")
+        if url.path == "/x/v2/dm/web/seg.so":
+            return self.send_body(self.dm_seg(int(query["oid"])), content_type="application/octet-stream")
+        self.send_json({"code": -404, "message": "啥都木有"}, status=404)
+
+    def view(self, bvid: str) -> dict:
+        aid = bv2av(bvid)
+        host = f"http://127.0.0.1:{self.server.server_port}"
+        return {
+            "bvid": bvid,
+            "aid": aid,
+            "title": f"benchmark {bvid}",
+            "desc": "synthetic video for biliarchiver benchmarks",
+            "pic": f"{host}/cover/{bvid}.jpg",
+            "pubdate": 1700000000,
+            "owner": {"mid": 1, "name": "bench"},
+            "stat": {"view": 1, "danmaku": 1, "coin": 0, "like": 0, "reply": 1, "favorite": 0, "share": 0},
+            "pages": [
+                {"page": p, "cid": aid * 100 + p, "part": f"part {p}", "duration": self.settings.duration}
+                for p in range(1, self.settings.parts + 1)
+            ],
+        }
+
+    def playurl(self, bvid: str, cid: int) -> dict:
+        port = self.server.server_port
+        duration = self.settings.duration
+
+        def stream(kind: str, size: int, **extra) -> dict:
+            path = f"/media/{bvid}/{cid}/{kind}.m4s?size={size}"
+            return {
+                "base_url": f"http://127.0.0.1:{port}{path}",
+                "backup_url": [f"http://localhost:{port}{path}"],
+                "bandwidth": size * 8 // duration,
+                **extra,
+            }
+
+        return {
+            "support_formats": [{"quality": 80, "new_description": "1080P 高清"}],
+            "dash": {
+                "duration": duration,
+                "video": [
+                    stream("avc", self.settings.video_bytes, id=80, codecs="avc1.640032", width=1920, height=1080),
+                    stream("hevc", self.settings.video_bytes * 2 // 3, id=80, codecs="hev1.1.6.L150.90000000",
+                           width=1920, height=1080),
+                ],
+                "audio": [stream("audio", self.settings.audio_bytes, id=30280, codecs="mp4a.40.2")],
+                "dolby": {"type": 0},
+            },
+        }
+
+    def replies(self, aid: int) -> list:
+        return [
+            {"rpid": aid * 100 + i, "mid": 1, "like": 20 - i, "content": {"message": f"reply {i}"}}
+            for i in range(20)
+        ]
+
+    def dm_view(self) -> bytes:
+        from danmakuC.bilibili import BiliViewProto
+
+        view = BiliViewProto()
+        view.dmSge.total = 1
+        return view.SerializeToString()
+
+    def dm_seg(self, cid: int) -> bytes:
+        from danmakuC.bilibili import BiliCommentProto
+
+        seg = BiliCommentProto()
+        for i in range(self.settings.danmaku):
+            elem = seg.elems.add()
+            elem.id = cid * 10000 + i
+            elem.idStr = str(elem.id)
+            elem.progress = i * self.settings.duration * 1000 // max(1, self.settings.danmaku)
+            elem.mode = 1
+            elem.fontsize = 25
+            elem.color = 0xFFFFFF
+            elem.content = f"弹幕 {i}"
+            elem.ctime = 1700000000
+        return seg.SerializeToString()
+
+    def send_media(self, total: int):
+        byte_range = _parse_range(self.headers.get("Range"), total)
+        start, end = byte_range if byte_range else (0, total - 1)
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(end - start + 1))
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+        self.end_headers()
+        host = (self.headers.get("Host") or "").split(":")[0]
+        bandwidth = self.settings.backup_bandwidth if host == "localhost" else self.settings.cdn_bandwidth
+        try:
+            for chunk in _throttled(_media_chunks(start, end), bandwidth):
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端切换镜像时会中途断开
+
+
+class IAStubHandler(_StubHandler):
+    """
+    IA 的 Metadata API、IA-S3 和 check_identifier.php 的替身。
+    item 只保存在内存里：PUT 第一个文件时创建，文件内容读完即丢弃，只记录大小。
+    """
+
+    def do_GET(self):
+        time.sleep(self.settings.latency)
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path.startswith("/metadata/"):
+            return self.send_json(self.server.items.get(unquote(url.path[len("/metadata/") :]), {}))  # type: ignore
+        if url.path == "/services/check_identifier.php":
+            exists = query["identifier"] in self.server.items  # type: ignore
+            return self.send_json({"type": "success", "code": "not_available" if exists else "available"})
+        if "check_limit" in query:
+            return self.send_json({"over_limit": 0})
+        if "check_auth" in query:
+            return self.send_json({"success": True, "username": STUB_UPLOADER})
+        self.send_json({}, status=404)
+
+    def do_POST(self):
+        """ modify_metadata：只处理 add / replace / remove 三种 patch """
+        time.sleep(self.settings.latency)
+        identifier = unquote(urlparse(self.path).path[len("/metadata/") :])
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+        item = self.server.items.get(identifier)  # type: ignore
+        if item is None:
+            return self.send_json({"success": False, "error": "item not found"}, status=404)
+        with self.server.lock:  # type: ignore
+            for op in json.loads(form.get("-patch", ["[]"])[0]):
+                key = op["path"].strip("/").split("/")[0]
+                if op["op"] == "remove":
+                    item["metadata"].pop(key, None)
+                else:
+                    item["metadata"][key] = op["value"]
+        self.send_json({"success": True, "task_id": 1})
+
+    def do_PUT(self):
+        time.sleep(self.settings.latency)
+        identifier, _sep, name = unquote(urlparse(self.path).path.lstrip("/")).partition("/")
+        remaining = int(self.headers.get("Content-Length", 0))
+
+        def received() -> Iterator[bytes]:
+            nonlocal remaining
+            while remaining > 0:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+        md5 = hashlib.md5()
+        size = 0
+        for chunk in _throttled(received(), self.settings.ia_bandwidth):
+            md5.update(chunk)
+            size += len(chunk)
+        expected_md5 = self.headers.get("Content-MD5")
+        if expected_md5 and expected_md5 != md5.hexdigest():
+            # 和 IA-S3 一样拒绝内容与 Content-MD5 不符的上传
+            return self.send_body(b"<Error><Code>BadDigest</Code></Error>", content_type="application/xml", status=400)
+        metadata = {
+            key[len("x-archive-meta-") :]: value
+            for key, value in self.headers.items()
+            if key.lower().startswith("x-archive-meta-")
+        }
+        with self.server.lock:  # type: ignore
+            item = self.server.items.setdefault(  # type: ignore
+                identifier,
+                {
+                    "created": int(time.time()),
+                    "metadata": {"identifier": identifier, "uploader": STUB_UPLOADER},
+                    "files": [],
+                },
+            )
+            item["metadata"].update(metadata)
+            item["files"].append({"name": name, "size": str(size), "md5": md5.hexdigest(), "source": "original"})
+            self.server.received_bytes += size  # type: ignore
+        self.send_body(b"")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, settings: StubSettings, addr: str = "127.0.0.1", port: int = 0):
+        super().__init__((addr, port), handler)
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.items: Dict[str, dict] = {}
+        self.received_bytes = 0
+
+
+def serve_stubs(settings: dict, ports_queue):
+    """
+    在独立进程里运行两个替身服务器，避免它们和被测的事件循环抢 GIL。
+    启动后把 (bilibili 端口, IA 端口) 放进 ports_queue，然后一直运行到进程被终止。
+    """
+    stub_settings = StubSettings(**settings)
+    bilibili = StubServer(BilibiliStubHandler, stub_settings)
+    ia = StubServer(IAStubHandler, stub_settings)
+    threading.Thread(target=ia.serve_forever, daemon=True).start()
+    ports_queue.put((bilibili.server_port, ia.server_port))
+    bilibili.serve_forever()
+
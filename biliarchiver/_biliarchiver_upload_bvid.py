@@ -1,10 +1,13 @@
+import contextvars
 import json
 import os
 from pathlib import Path, PurePath
+import threading
 import time
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from enum import Enum
+from typing import List, Optional
 from urllib.parse import urlparse
-from internetarchive import get_item, get_username
 from requests import Response, HTTPError
 from rich import print
 from pathlib import Path
@@ -16,21 +19,53 @@ from biliarchiver.exception import (
     VideosNotFinishedDownloadError,
 )
 
+from biliarchiver.utils import metrics
+from biliarchiver.utils.danmaku import DANMAKU_PENDING_FILENAME
+from biliarchiver.utils.ia_session import IASession, get_ia_session
 from biliarchiver.utils.identifier import human_readable_upper_part_map
+from biliarchiver.utils.manifest import PartManifest
 from biliarchiver.config import BILIBILI_IDENTIFIER_PERFIX, config
+from biliarchiver.utils.blobs import get_blob_store
 from biliarchiver.utils.dirLock import UploadLock, AlreadyRunningError
+from biliarchiver.utils.state_db import PartState, get_state_db
+from biliarchiver.utils.tracing import span
 from biliarchiver.utils.xml_chars import xml_chars_legalize
 from biliarchiver.version import BILI_ARCHIVER_VERSION
 from biliarchiver.i18n import _
 
 
+_upload_slots: Optional[threading.BoundedSemaphore] = None
+_upload_slots_lock = threading.Lock()
+
+
+def get_upload_slots() -> threading.BoundedSemaphore:
+    """
+    进程内所有分P共享的上传名额（config.upload_concurrency 个），只在 item.upload 期间占用。
+    等 IA 建好 item、改元数据等不占上行带宽的步骤不拿名额，所以多个 BV / 分P并发时同时进行的 PUT 数也不会超过它
+    """
+    global _upload_slots
+    with _upload_slots_lock:
+        if _upload_slots is None:
+            _upload_slots = threading.BoundedSemaphore(max(1, config.upload_concurrency))
+        return _upload_slots
+
+
+class UploadResult(str, Enum):
+    uploaded = "uploaded"
+    """ 所有分P都已上传 """
+    skipped = "skipped"
+    """ 没有上传：被标记为垃圾、已有进程在上传、文件夹不存在或还没下载完 """
+    deferred = "deferred"
+    """ 有分P还不能上传（如弹幕还没生成），之后需要重试 """
+
+
 def upload_bvid(
     bvid: str,
     *,
     update_existing: bool = False,
     collection: str,
     delete_after_upload: bool = False,
-):
+) -> UploadResult:
     try:
         lock_dir = config.storage_home_dir / ".locks" / bvid
         lock_dir.mkdir(parents=True, exist_ok=True)
@@ -41,21 +76,33 @@ def upload_bvid(
         )
         if os.path.exists(videos_basepath / "_spam.mark"):
             print(_("{} 被标记为垃圾内容，跳过").format(bvid))
-            return
-        with UploadLock(lock_dir):  # type: ignore
-            _upload_bvid(
+            metrics.BVS.labels(stage="up", result="skipped").inc()
+            return UploadResult.skipped
+        with UploadLock(lock_dir), span("up.bv", bvid=bvid):  # type: ignore
+            result = _upload_bvid(
                 bvid,
                 update_existing=update_existing,
                 collection=collection,
                 delete_after_upload=delete_after_upload,
             )
+        metrics.BVS.labels(
+            stage="up", result="ok" if result is UploadResult.uploaded else "deferred"
+        ).inc()
+        return result
     except AlreadyRunningError:
+        metrics.BVS.labels(stage="up", result="skipped").inc()
         print(_("已经有一个上传 {} 的进程在运行，跳过".format(bvid)))
+        return UploadResult.skipped
     except VideosBasePathNotFoundError:
+        metrics.BVS.labels(stage="up", result="skipped").inc()
         print(_("没有找到 {} 对应的文件夹。可能是因已存在 IA item 而跳过了下载，或者你传入了错误的 bvid".format(bvid)))
+        return UploadResult.skipped
     except VideosNotFinishedDownloadError:
+        metrics.BVS.labels(stage="up", result="skipped").inc()
         print(_("{} 的视频还没有下载完成，跳过".format(bvid)))
+        return UploadResult.skipped
     except Exception as e:
+        metrics.BVS.labels(stage="up", result="failed").inc()
         print(_("上传 {} 时出错：".format(bvid)))
         error_msg = str(e)
         is_rate_limit = any(kw in error_msg.lower() for kw in ["slow down", "rate limit", "429 client error", "503 server error"])
@@ -69,6 +116,7 @@ def upload_bvid(
             if videos_basepath.exists():
                 with open(videos_basepath / "_spam.mark", "w", encoding="utf-8") as f:
                     f.write(error_msg)
+                get_state_db().set_bv_spam(bvid)
 
         raise e
 
@@ -79,8 +127,9 @@ def _upload_bvid(
     update_existing: bool = False,
     collection: str,
     delete_after_upload: bool = False,
-):
-    access_key, secret_key = read_ia_keys(config.ia_key_file)
+) -> UploadResult:
+    # 所有分P共用一个带连接池的 session，用户名、item 元数据有缓存
+    ia = get_ia_session()
 
     # identifier format: BiliBili-{bvid}_p{pid}-{upper_part}
     upper_part = human_readable_upper_part_map(string=bvid, backward=True)
@@ -93,297 +142,394 @@ def _upload_bvid(
         raise VideosNotFinishedDownloadError(f"{videos_basepath}")
 
     local_identifiers = [f.name for f in videos_basepath.iterdir() if f.is_dir()]
-    for local_identifier in local_identifiers:
-        remote_identifier = f"{local_identifier}-{upper_part}"
-        if (
-            os.path.exists(f"{videos_basepath}/{local_identifier}/_uploaded.mark")
-            and not update_existing
-        ):
-            print(
-                _("{} => {} 已经上传过了(_uploaded.mark)").format(
-                    local_identifier, remote_identifier
-                )
+    # 各分P是独立的 IA item，用线程池同时上传，一个慢的 S3 PUT 不会挡住其他分P。
+    # 真正占用上行带宽的 item.upload 还要拿全局的上传名额（见 get_upload_slots）
+    finished = True
+    with ThreadPoolExecutor(
+        max_workers=max(1, config.upload_concurrency), thread_name_prefix=f"upload_{bvid}"
+    ) as executor:
+        futures = [
+            # 每个任务复制一份 contextvars，分P的 span 挂在 up.bv 下面
+            executor.submit(
+                contextvars.copy_context().run,
+                _upload_part,
+                bvid,
+                local_identifier,
+                videos_basepath=videos_basepath,
+                upper_part=upper_part,
+                ia=ia,
+                update_existing=update_existing,
+                collection=collection,
             )
-            continue
-        if os.path.exists(f"{videos_basepath}/{local_identifier}/_spam.mark"):
-            print(_("{} 被标记为垃圾内容，跳过").format(local_identifier))
-            continue
-        if local_identifier.startswith("_"):
-            print(_("跳过带 _ 前缀的 local_identifier: {}").format(local_identifier))
-            continue
-        if not local_identifier.startswith(BILIBILI_IDENTIFIER_PERFIX):
-            print(
-                _("{} 不是以 {} 开头的正确 local_identifier").format(
-                    local_identifier, BILIBILI_IDENTIFIER_PERFIX
-                )
+            for local_identifier in local_identifiers
+        ]
+        error: Optional[BaseException] = None
+        for future in as_completed(futures):
+            try:
+                finished = future.result() and finished
+            except Exception as e:
+                if error is None:
+                    error = e
+                    # 和以前逐个上传时一样，出错后不再开始新的分P；已经在传的让它们传完
+                    for pending in futures:
+                        pending.cancel()
+                else:
+                    print(_("{}: 另一个分P也上传失败：{}").format(bvid, e))
+        if error is not None:
+            raise error
+
+    if delete_after_upload and finished and len(local_identifiers) > 0:
+        delete_uploaded_parts(bvid, videos_basepath, local_identifiers)
+    return UploadResult.uploaded if finished else UploadResult.deferred
+
+
+def delete_uploaded_parts(bvid: str, videos_basepath: Path, local_identifiers: List[str]):
+    try:
+        state_db = get_state_db()
+        for local_identifier in local_identifiers:
+            # 封面、详情、评论是硬链接到 blob 仓库的，删掉分P后没人引用的 blob 也一起删。
+            # 按清单里的所有文件释放，而不只是这次上传的文件
+            blob_sha1s = PartManifest(videos_basepath / local_identifier).blob_sha1s()
+            rmtree(f"{videos_basepath}/{local_identifier}")
+            get_blob_store().release(blob_sha1s)
+            pid = local_identifier.split("_")[-1][1:]
+            if pid.isdigit():
+                state_db.set_part_state(bvid, int(pid), PartState.deleted)
+        print(
+            "[yellow]"
+            + _("已删除视频文件夹 {}").format(", ".join(local_identifiers))
+            + "[/yellow]"
+        )
+    except Exception as e:
+        print(e)
+
+def _upload_part(
+    bvid: str,
+    local_identifier: str,
+    *,
+    videos_basepath: Path,
+    upper_part: str,
+    ia: IASession,
+    update_existing: bool,
+    collection: str,
+) -> bool:
+    """
+    上传单个分P（一个 IA item）。在 _upload_bvid 的线程池里运行，可与同一 BV 的其他分P并发。
+    返回 False 表示这个分P没有上传完整（item 不是我们的、不能更新，或弹幕还没生成），_upload_bvid 不应删除本地文件
+    """
+    if (videos_basepath / "_spam.mark").exists():
+        # 其他分P上传时可能刚发现整个 BV 被判为垃圾内容
+        print(_("{} 被标记为垃圾内容，跳过").format(local_identifier))
+        return True
+    remote_identifier = f"{local_identifier}-{upper_part}"
+    if (
+        os.path.exists(f"{videos_basepath}/{local_identifier}/_uploaded.mark")
+        and not update_existing
+    ):
+        print(
+            _("{} => {} 已经上传过了(_uploaded.mark)").format(
+                local_identifier, remote_identifier
+            )
+        )
+        return True
+    if os.path.exists(f"{videos_basepath}/{local_identifier}/_spam.mark"):
+        print(_("{} 被标记为垃圾内容，跳过").format(local_identifier))
+        return True
+    if local_identifier.startswith("_"):
+        print(_("跳过带 _ 前缀的 local_identifier: {}").format(local_identifier))
+        return True
+    if not local_identifier.startswith(BILIBILI_IDENTIFIER_PERFIX):
+        print(
+            _("{} 不是以 {} 开头的正确 local_identifier").format(
+                local_identifier, BILIBILI_IDENTIFIER_PERFIX
+            )
+        )
+        return True
+    if not os.path.exists(f"{videos_basepath}/{local_identifier}/_downloaded.mark"):
+        print(local_identifier, _("没有下载完成"))
+        return True
+    if os.path.exists(f"{videos_basepath}/{local_identifier}/{DANMAKU_PENDING_FILENAME}"):
+        # down --defer-danmaku 留下的，ass 还没生成，先上传就会缺弹幕，而且上传后可能被删掉
+        print(
+            _("{} 的弹幕还没有生成，跳过（请先运行 biliarchiver danmaku）").format(
+                local_identifier
             )
-            continue
-        if not os.path.exists(f"{videos_basepath}/{local_identifier}/_downloaded.mark"):
-            print(local_identifier, _("没有下载完成"))
-            continue
-
-        pid = local_identifier.split("_")[-1][1:]
-        file_basename = local_identifier[len(BILIBILI_IDENTIFIER_PERFIX) + 1 :]
-
-        print("=== " + _('开始上传') + f" {local_identifier} => {remote_identifier} ===")
-        item = get_item(remote_identifier)
-        if item.exists and not update_existing:
-            print(_("{} 已存在，跳过 (item.exists)").format(remote_identifier))
-
-            # check if the user is the same
-            if item.metadata.get("uploader") != get_username(access_key=access_key, secret_key=secret_key):
-                print(f"{remote_identifier} "+ _('不是你上传的，跳过') + " (item.metadata.uploader)")
-                mark_uploaded(videos_basepath, local_identifier)
+        )
+        return False
+
+    pid = local_identifier.split("_")[-1][1:]
+    file_basename = local_identifier[len(BILIBILI_IDENTIFIER_PERFIX) + 1 :]
+
+    print("=== " + _('开始上传') + f" {local_identifier} => {remote_identifier} ===")
+    part_begin = time.monotonic()
+    access_key, secret_key = ia.access_key, ia.secret_key
+    item = ia.get_item(remote_identifier)
+    if item.exists and not update_existing:
+        print(_("{} 已存在，跳过 (item.exists)").format(remote_identifier))
+
+        # check if the user is the same
+        if item.metadata.get("uploader") != ia.username():
+            print(f"{remote_identifier} "+ _('不是你上传的，跳过') + " (item.metadata.uploader)")
+            mark_uploaded(videos_basepath, local_identifier)
+            return True
+
+        if item.metadata.get("upload-state") == "uploaded":
+            print(f"{remote_identifier} " + _('已经上传过了，跳过') + " (item.metadata.uploaded)")
+            mark_uploaded(videos_basepath, local_identifier)
+            return True
+    with open(
+        f"{videos_basepath}/{local_identifier}/extra/{file_basename}.info.json",
+        "r",
+        encoding="utf-8",
+    ) as f:
+        bv_info = json.load(f)
+
+    cover_url: str = bv_info["data"]["View"]["pic"]
+    cover_suffix = PurePath(urlparse(cover_url).path).suffix
+
+    filedict = {}  # "remote filename": "local filename"
+    for filename in os.listdir(f"{videos_basepath}/{local_identifier}/extra"):
+        file = f"{videos_basepath}/{local_identifier}/extra/{filename}"
+        if os.path.isfile(file):
+            if file.startswith("_"):
                 continue
+            filedict[filename] = file
+
+            # 复制一份 cover 作为 itemimage
+            if filename == f"{bvid}_p{pid}{cover_suffix}":
+                filedict[f"{bvid}_p{pid}_itemimage{cover_suffix}"] = file
 
-            if item.metadata.get("upload-state") == "uploaded":
-                print(f"{remote_identifier} " + _('已经上传过了，跳过') + " (item.metadata.uploaded)")
-                mark_uploaded(videos_basepath, local_identifier)
+    for filename in os.listdir(f"{videos_basepath}/{local_identifier}"):
+        file = f"{videos_basepath}/{local_identifier}/{filename}"
+        if os.path.isfile(file):
+            if os.path.basename(file).startswith("_"):
                 continue
-        with open(
-            f"{videos_basepath}/{local_identifier}/extra/{file_basename}.info.json",
-            "r",
-            encoding="utf-8",
-        ) as f:
-            bv_info = json.load(f)
-
-        cover_url: str = bv_info["data"]["View"]["pic"]
-        cover_suffix = PurePath(urlparse(cover_url).path).suffix
-
-        filedict = {}  # "remote filename": "local filename"
-        for filename in os.listdir(f"{videos_basepath}/{local_identifier}/extra"):
-            file = f"{videos_basepath}/{local_identifier}/extra/{filename}"
-            if os.path.isfile(file):
-                if file.startswith("_"):
-                    continue
-                filedict[filename] = file
+            if not os.path.isfile(file):
+                continue
+            filedict[filename] = file
 
-                # 复制一份 cover 作为 itemimage
-                if filename == f"{bvid}_p{pid}{cover_suffix}":
-                    filedict[f"{bvid}_p{pid}_itemimage{cover_suffix}"] = file
+    assert (f"{file_basename}.mp4" in filedict) or (
+        f"{file_basename}.flv" in filedict
+    )
 
-        for filename in os.listdir(f"{videos_basepath}/{local_identifier}"):
-            file = f"{videos_basepath}/{local_identifier}/{filename}"
-            if os.path.isfile(file):
-                if os.path.basename(file).startswith("_"):
-                    continue
-                if not os.path.isfile(file):
-                    continue
-                filedict[filename] = file
+    # IA 去重
+    for file_in_item in item.files:
+        if file_in_item["name"] in filedict:
+            filedict.pop(file_in_item["name"])
+            print(
+                f"File {file_in_item['name']} already exists in {remote_identifier}."
+            )
 
-        assert (f"{file_basename}.mp4" in filedict) or (
-            f"{file_basename}.flv" in filedict
-        )
+    # with open(f'{videos_basepath}/_videos_info.json', 'r', encoding='utf-8') as f:
+    #     videos_info = json.load(f)
+
+    tags = ["BiliBili", "video"]
+    for tag in bv_info["data"]["Tags"]:
+        tags.append(tag["tag_name"])
+    pubdate = bv_info["data"]["View"]["pubdate"]
+    cid = None
+    p_part = None
+    for page in bv_info["data"]["View"]["pages"]:
+        if page["page"] == int(pid):
+            cid = page["cid"]
+            p_part = page["part"]
+            break
+
+    assert cid is not None
+    assert p_part is not None
+
+    aid = bv_info["data"]["View"]["aid"]
+    owner_mid = bv_info["data"]["View"]["owner"]["mid"]
+    owner_creator: str = bv_info["data"]["View"]["owner"]["name"]  # UP 主
+
+    mids: List[int] = [owner_mid]
+    creators: List[str] = [owner_creator]
+    if bv_info["data"]["View"].get("staff") is not None:
+        mids = []  # owner_mid 在 staff 也有
+        creators = []
+        for staff in bv_info["data"]["View"]["staff"]:
+            mids.append(staff["mid"]) if staff["mid"] not in mids else None
+            creators.append(staff["name"]) if staff[
+                "name"
+            ] not in creators else None
+    external_identifier = [
+        f"urn:bilibili:video:aid:{aid}",
+        f"urn:bilibili:video:bvid:{bvid}",
+        f"urn:bilibili:video:cid:{cid}",
+    ]
+    for mid in mids:
+        external_identifier.append(f"urn:bilibili:video:mid:{mid}")
+
+    md = {
+        "mediatype": "movies",
+        "collection": collection,
+        "title": bv_info["data"]["View"]["title"] + f" P{pid} " + p_part,
+        "description": remote_identifier + " uploading...",
+        "creator": creators
+        if len(creators) > 1
+        else owner_creator,  # type: list[str] | str
+        # UTC time
+        "date": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(pubdate)),
+        # 'aid': aid,
+        # 'bvid': bvid,
+        # 'cid': cid,
+        # 'mid': mid,
+        "external-identifier": external_identifier,
+        "subject": "; ".join(
+            tags
+        ),  # Keywords should be separated by ; but it doesn't matter much; the alternative is to set one per field with subject[0], subject[1], ...
+        "upload-state": "uploading",
+        "originalurl": f"https://www.bilibili.com/video/{bvid}/?p={pid}",
+        "scanner": f"biliarchiver v{BILI_ARCHIVER_VERSION} (dev)",
+    }
+
+    print(filedict)
+    print(md)
+
+    # remove XML illegal characters
+    _md_before = hash(json.dumps(md))
+    md = xml_chars_legalize(obj=md)
+    assert isinstance(md, dict)
+    if hash(json.dumps(md)) != _md_before:
+        print("Removed XML illegal characters from metadata, cleaned metadata:")
+        print(md)
 
-        # IA 去重
-        for file_in_item in item.files:
-            if file_in_item["name"] in filedict:
-                filedict.pop(file_in_item["name"])
-                print(
-                    f"File {file_in_item['name']} already exists in {remote_identifier}."
-                )
-
-        # with open(f'{videos_basepath}/_videos_info.json', 'r', encoding='utf-8') as f:
-        #     videos_info = json.load(f)
-
-        tags = ["BiliBili", "video"]
-        for tag in bv_info["data"]["Tags"]:
-            tags.append(tag["tag_name"])
-        pubdate = bv_info["data"]["View"]["pubdate"]
-        cid = None
-        p_part = None
-        for page in bv_info["data"]["View"]["pages"]:
-            if page["page"] == int(pid):
-                cid = page["cid"]
-                p_part = page["part"]
+    upload_bytes = sum(os.path.getsize(file) for file in filedict.values())
+    if filedict:
+        # 下载时写文件顺带算好的摘要记在 _manifest.json，这里只读记录，不再读文件；
+        # 没有记录的文件（如 ffmpeg 合并出的 mp4）不带 Content-MD5
+        manifest = PartManifest(videos_basepath / local_identifier)
+        digests = {name: manifest.cached(file) for name, file in filedict.items()}
+        # 逐个文件上传，有摘要的带上 Content-MD5 让 IA 校验；
+        # 重试时只传还没传完的文件
+        pending = dict(filedict)
+        upload_retry = 5
+        while upload_retry >= 0:
+            try:
+                with span("up.ia_upload", pid=pid, bytes=upload_bytes):
+                    for name, file in list(pending.items()):
+                        with get_upload_slots():
+                            r = item.upload(
+                                files={name: file},
+                                metadata=md,
+                                headers={"Content-MD5": digests[name].md5} if digests[name] else {},
+                                access_key=access_key,
+                                secret_key=secret_key,
+                                verbose=True,
+                                queue_derive=len(pending) == 1,  # 传完最后一个文件再 derive
+                                retries=5,
+                            )
+                        pending.pop(name)
                 break
+            except Exception as e:
+                error_msg_lower = str(e).lower()
+                is_rate_limit = any(kw in error_msg_lower for kw in ["slow down", "rate limit", "429 client error", "503 server error"])
+                if "EOF" in error_msg_lower or "ssl" in error_msg_lower or is_rate_limit:
+                    upload_retry -= 1
+                    print(e)
+                    if upload_retry < 0:
+                        raise e
+                    print(f"Upload failed (network or rate limit), retrying ({upload_retry}) ...")
+                    time.sleep(min(60 * (6 - upload_retry), 300))
+                    continue
+                if "appears to be spam" in str(e) and not is_rate_limit:
+                    print(_("{} 被标记为垃圾内容，创建标记文件").format(bvid))
+                    with open(
+                        videos_basepath / "_spam.mark", "w", encoding="utf-8"
+                    ) as f:
+                        f.write(str(e))
+                    get_state_db().set_bv_spam(bvid)
+                    raise e
+                else:
+                    raise e
+    tries = 100
+    with span("up.ia_wait", pid=pid):
+        item = ia.get_item(remote_identifier, fresh=True)  # refresh item
+        while not item.exists and tries > 0:
+            print(f"Waiting for item to be created ({tries})  ...", end="\r")
+            time.sleep(30)
+            item = ia.get_item(remote_identifier, fresh=True)
+            tries -= 1
 
-        assert cid is not None
-        assert p_part is not None
-
-        aid = bv_info["data"]["View"]["aid"]
-        owner_mid = bv_info["data"]["View"]["owner"]["mid"]
-        owner_creator: str = bv_info["data"]["View"]["owner"]["name"]  # UP 主
-
-        mids: List[int] = [owner_mid]
-        creators: List[str] = [owner_creator]
-        if bv_info["data"]["View"].get("staff") is not None:
-            mids = []  # owner_mid 在 staff 也有
-            creators = []
-            for staff in bv_info["data"]["View"]["staff"]:
-                mids.append(staff["mid"]) if staff["mid"] not in mids else None
-                creators.append(staff["name"]) if staff[
-                    "name"
-                ] not in creators else None
-        external_identifier = [
-            f"urn:bilibili:video:aid:{aid}",
-            f"urn:bilibili:video:bvid:{bvid}",
-            f"urn:bilibili:video:cid:{cid}",
-        ]
-        for mid in mids:
-            external_identifier.append(f"urn:bilibili:video:mid:{mid}")
-
-        md = {
-            "mediatype": "movies",
-            "collection": collection,
-            "title": bv_info["data"]["View"]["title"] + f" P{pid} " + p_part,
-            "description": remote_identifier + " uploading...",
-            "creator": creators
-            if len(creators) > 1
-            else owner_creator,  # type: list[str] | str
-            # UTC time
-            "date": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(pubdate)),
-            # 'aid': aid,
-            # 'bvid': bvid,
-            # 'cid': cid,
-            # 'mid': mid,
-            "external-identifier": external_identifier,
-            "subject": "; ".join(
-                tags
-            ),  # Keywords should be separated by ; but it doesn't matter much; the alternative is to set one per field with subject[0], subject[1], ...
-            "upload-state": "uploading",
-            "originalurl": f"https://www.bilibili.com/video/{bvid}/?p={pid}",
-            "scanner": f"biliarchiver v{BILI_ARCHIVER_VERSION} (dev)",
-        }
-
-        print(filedict)
-        print(md)
+    new_md = {}
+    if item.metadata.get("upload-state") != "uploaded":
+        new_md["upload-state"] = "uploaded"
+    if item.metadata.get("creator") != md["creator"]:
+        new_md["creator"] = md["creator"]
+    if item.metadata.get("description", "") != bv_info["data"]["View"]["desc"]:
+        new_md["description"] = bv_info["data"]["View"]["desc"]
+    if item.metadata.get("scanner") != md["scanner"]:
+        new_md["scanner"] = md["scanner"]
+    if item.metadata.get("external-identifier") != md["external-identifier"]:
+        new_md["external-identifier"] = md["external-identifier"]
+    if new_md:
+        print("Updating metadata:")
+        print(new_md)
 
         # remove XML illegal characters
-        _md_before = hash(json.dumps(md))
-        md = xml_chars_legalize(obj=md)
-        assert isinstance(md, dict)
-        if hash(json.dumps(md)) != _md_before:
+        _md_before = hash(json.dumps(new_md))
+        new_md = xml_chars_legalize(obj=new_md)
+        assert isinstance(new_md, dict)
+        if hash(json.dumps(new_md)) != _md_before:
             print("Removed XML illegal characters from metadata, cleaned metadata:")
-            print(md)
+            print(new_md)
 
-        if filedict:
-            upload_retry = 5
-            while upload_retry >= 0:
+        try:
+            r = item.modify_metadata(
+                metadata=new_md,
+                access_key=access_key,
+                secret_key=secret_key,
+            )
+            assert isinstance(r, Response)
+            r.raise_for_status()
+        except HTTPError as e:
+            if e.response.status_code == 400:
+                print(f"400 Bad Request error encountered for {remote_identifier}. No more retries will be attempted.")
+                print(f"Error message: {e.response.text}")
+                if item.metadata.get("uploader") != ia.username():
+                    print(_("{} 不是你上传的，跳过 (item.metadata.creator)").format(remote_identifier))
+                    return False
+            if e.response.status_code == 403:
+                print(f"403 Forbidden error encountered for {remote_identifier}. Retrying with title as description.")
+                new_md["description"] = md["title"]
                 try:
-                    r = item.upload(
-                        files=filedict,
-                        metadata=md,
+                    r = item.modify_metadata(
+                        metadata=new_md,
                         access_key=access_key,
                         secret_key=secret_key,
-                        verbose=True,
-                        queue_derive=True,
-                        retries=5,
                     )
-                    break
-                except Exception as e:
-                    error_msg_lower = str(e).lower()
-                    is_rate_limit = any(kw in error_msg_lower for kw in ["slow down", "rate limit", "429 client error", "503 server error"])
-                    if "EOF" in error_msg_lower or "ssl" in error_msg_lower or is_rate_limit:
-                        upload_retry -= 1
-                        print(e)
-                        if upload_retry < 0:
-                            raise e
-                        print(f"Upload failed (network or rate limit), retrying ({upload_retry}) ...")
-                        time.sleep(min(60 * (6 - upload_retry), 300))
-                        continue
-                    if "appears to be spam" in str(e) and not is_rate_limit:
-                        print(_("{} 被标记为垃圾内容，创建标记文件").format(bvid))
-                        with open(
-                            videos_basepath / "_spam.mark", "w", encoding="utf-8"
-                        ) as f:
-                            f.write(str(e))
-                        raise e
+                    assert isinstance(r, Response)
+                    r.raise_for_status()
+                except HTTPError as e:
+                    if e.response.status_code == 403:
+                        print(f"403 Forbidden error encountered again for {remote_identifier}. Retrying with empty description.")
+                        new_md["description"] = ""
+                        try:
+                            r = item.modify_metadata(
+                                metadata=new_md,
+                                access_key=access_key,
+                                secret_key=secret_key,
+                            )
+                            assert isinstance(r, Response)
+                            r.raise_for_status()
+                        except HTTPError as e:
+                            if e.response.status_code == 403:
+                                print(f"403 Forbidden error encountered again for {remote_identifier}. No more retries will be attempted.")
+                            else:
+                                raise e
                     else:
                         raise e
-        tries = 100
-        item = get_item(remote_identifier)  # refresh item
-        while not item.exists and tries > 0:
-            print(f"Waiting for item to be created ({tries})  ...", end="\r")
-            time.sleep(30)
-            item = get_item(remote_identifier)
-            tries -= 1
+            else:
+                raise e
 
-        new_md = {}
-        if item.metadata.get("upload-state") != "uploaded":
-            new_md["upload-state"] = "uploaded"
-        if item.metadata.get("creator") != md["creator"]:
-            new_md["creator"] = md["creator"]
-        if item.metadata.get("description", "") != bv_info["data"]["View"]["desc"]:
-            new_md["description"] = bv_info["data"]["View"]["desc"]
-        if item.metadata.get("scanner") != md["scanner"]:
-            new_md["scanner"] = md["scanner"]
-        if item.metadata.get("external-identifier") != md["external-identifier"]:
-            new_md["external-identifier"] = md["external-identifier"]
-        if new_md:
-            print("Updating metadata:")
-            print(new_md)
-
-            # remove XML illegal characters
-            _md_before = hash(json.dumps(new_md))
-            new_md = xml_chars_legalize(obj=new_md)
-            assert isinstance(new_md, dict)
-            if hash(json.dumps(new_md)) != _md_before:
-                print("Removed XML illegal characters from metadata, cleaned metadata:")
-                print(new_md)
-
-            try:
-                r = item.modify_metadata(
-                    metadata=new_md,
-                    access_key=access_key,
-                    secret_key=secret_key,
-                )
-                assert isinstance(r, Response)
-                r.raise_for_status()
-            except HTTPError as e:
-                if e.response.status_code == 400:
-                    print(f"400 Bad Request error encountered for {remote_identifier}. No more retries will be attempted.")
-                    print(f"Error message: {e.response.text}")
-                    if item.metadata.get("uploader") != get_username(access_key=access_key, secret_key=secret_key):
-                        print(_("{} 不是你上传的，跳过 (item.metadata.creator)").format(remote_identifier))
-                        return
-                if e.response.status_code == 403:
-                    print(f"403 Forbidden error encountered for {remote_identifier}. Retrying with title as description.")
-                    new_md["description"] = md["title"]
-                    try:
-                        r = item.modify_metadata(
-                            metadata=new_md,
-                            access_key=access_key,
-                            secret_key=secret_key,
-                        )
-                        assert isinstance(r, Response)
-                        r.raise_for_status()
-                    except HTTPError as e:
-                        if e.response.status_code == 403:
-                            print(f"403 Forbidden error encountered again for {remote_identifier}. Retrying with empty description.")
-                            new_md["description"] = ""
-                            try:
-                                r = item.modify_metadata(
-                                    metadata=new_md,
-                                    access_key=access_key,
-                                    secret_key=secret_key,
-                                )
-                                assert isinstance(r, Response)
-                                r.raise_for_status()
-                            except HTTPError as e:
-                                if e.response.status_code == 403:
-                                    print(f"403 Forbidden error encountered again for {remote_identifier}. No more retries will be attempted.")
-                                else:
-                                    raise e
-                        else:
-                            raise e
-                else:
-                    raise e
-
-        mark_uploaded(videos_basepath, local_identifier)
-        print(f"==== {remote_identifier} " + _('上传完成') + " ====")
-
-    if delete_after_upload and len(local_identifiers) > 0:
-        try:
-            for local_identifier in local_identifiers:
-                rmtree(f"{videos_basepath}/{local_identifier}")
-            print(
-                "[yellow]"
-                + _("已删除视频文件夹 {}").format(", ".join(local_identifiers))
-                + "[/yellow]"
-            )
-        except Exception as e:
-            print(e)
+    # 元数据刚改过，缓存作废
+    ia.invalidate(remote_identifier)
+    mark_uploaded(videos_basepath, local_identifier)
+    metrics.BYTES.labels(stage="up").inc(upload_bytes)
+    metrics.PARTS.labels(stage="up", result="ok").inc()
+    metrics.PART_SECONDS.labels(stage="up").observe(time.monotonic() - part_begin)
+    print(f"==== {remote_identifier} " + _('上传完成') + " ====")
+    return True
 
 
 def mark_uploaded(videos_basepath: Path, local_identifier: str):
@@ -393,13 +539,7 @@ def mark_uploaded(videos_basepath: Path, local_identifier: str):
         encoding="utf-8",
     ) as f:
         f.write("")
-
-def read_ia_keys(keysfile):
-    """Return: tuple(`access_key`, `secret_key`)"""
-    with open(keysfile, "r", encoding="utf-8") as f:
-        key_lines = f.readlines()
-
-    access_key = key_lines[0].strip()
-    secret_key = key_lines[1].strip()
-
-    return access_key, secret_key
+    # local_identifier: BiliBili-{bvid}_p{pid}
+    file_basename = local_identifier[len(BILIBILI_IDENTIFIER_PERFIX) + 1 :]
+    bvid, pid = file_basename.rsplit("_p", 1)
+    get_state_db().set_part_state(bvid, int(pid), PartState.uploaded)
@@ -1,14 +1,18 @@
 import asyncio
 import os
-from pathlib import Path
+from pathlib import Path, PurePath
 import re
 import traceback
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
 import aiofiles
 import httpx
 from bilix.download.utils import raise_api_error, req_retry
+from bilix.utils import legal_title
 from bilix.exception import APIError
 
+from bilix import ffmpeg
 from bilix.sites.bilibili import api
 
 from rich import print
@@ -18,24 +22,42 @@ from bilix.sites.bilibili.downloader import DownloaderBilibili
 from bilix.exception import APIResourceError
 from biliarchiver.config import BILIBILI_IDENTIFIER_PERFIX
 from biliarchiver.config import config
+from biliarchiver.utils.blobs import get_blob_store
+from biliarchiver.utils.cdn import get_file_part_mirrored, probe_media
+from biliarchiver.utils import metrics
+from biliarchiver.utils.danmaku import get_danmaku_converter, write_danmaku_pending
 from biliarchiver.utils.identifier import human_readable_upper_part_map
+from biliarchiver.utils.manifest import StreamDigest, record_digests
+from biliarchiver.utils.replies import REPLIES_SCRATCH_FILENAME, RepliesCrawler
+from biliarchiver.utils.resume import clean_unfinished_outputs, get_file_resumable
+from biliarchiver.utils.state_db import BVState, PartState, get_state_db
+from biliarchiver.utils.selection import SelectionPolicy
+from biliarchiver.utils.storage import InsufficientSpaceError, SpaceBudget, estimate_download_size
+from biliarchiver.utils.tracing import span, traced
 from biliarchiver.i18n import _
 
 # moneky patch
 @staticmethod
 def _dm2ass_factory(width: int, height: int):
-    import functools
-    from danmakuC.bilibili import proto2ass
     async def dm2ass(protobuf_bytes: bytes) -> bytes:
-        loop = asyncio.get_event_loop()
-        f = functools.partial(proto2ass, protobuf_bytes, width, height, font_size=width / 40, ) # type: ignore
-        print("using none")
-        content = await loop.run_in_executor(None, f) # use default executor (None) instead of bilix._process.SingletonPPE
-        return content.encode('utf-8')
+        # 在独立的进程池里转换，不和事件循环抢 GIL（见 utils/danmaku.py）
+        return await get_danmaku_converter().convert(protobuf_bytes, width, height)
 
     return dm2ass
 DownloaderBilibili._dm2ass_factory = _dm2ass_factory
 
+# bilix 的 Media 丢掉了 dash 流的 bandwidth，留着它用于估算文件大小
+api.Media.model_config["extra"] = "allow"
+for _model in (api.Media, api.Dash, api.VideoInfo):
+    _model.model_rebuild(force=True)
+# 断点续传：上游没变时复用已下载的分段，而不是删掉重下
+DownloaderBilibili.get_file = get_file_resumable
+# 分段下载按 CDN host 评分挑镜像，太慢时中途切换
+DownloaderBilibili._get_file_part = get_file_part_mirrored
+# bilix 在下载完音视频后通过 ffmpeg.combine / concat 合并（调用时才查模块属性）
+ffmpeg.combine = traced("down.merge")(ffmpeg.combine)
+ffmpeg.concat = traced("down.merge")(ffmpeg.concat)
+
 
 @raise_api_error
 async def new_get_subtitle_info(client: httpx.AsyncClient, bvid, cid):
@@ -80,7 +102,8 @@ async def new_get_video_info(client: httpx.AsyncClient, url: str):
         - 对于一些老视频， _get_video_info_from_html() 经常返回烦人且不稳定的 durl 资源。而 API 会更多请求到 dash 资源（虽然仍有少数视频只有 durl 资源）。
     """
     # print("using api")
-    return await api._get_video_info_from_api(client, url)
+    with span("down.video_info"):
+        return await api._get_video_info_from_api(client, url)
 
 
 api.get_video_info = new_get_video_info
@@ -91,200 +114,432 @@ async def archive_bvid(
     bvid: str,
     *,
     logined: bool = False,
-    semaphore: asyncio.Semaphore,
+    space_budget: Optional[SpaceBudget] = None,
+    selection_policy: Optional[SelectionPolicy] = None,
+    defer_danmaku: bool = False,
+    full_replies: bool = False,
+    on_page_downloaded: Optional[Callable[[int, Path], Awaitable[None]]] = None,
 ):
-    async with semaphore:
-        assert d.hierarchy is True, _("hierarchy 必须为 True")  # 为保持后续目录结构、文件命名的一致性
-        assert d.client.cookies.get("SESSDATA") is not None, _(
-            "sess_data 不能为空"
-        )  # 开个大会员呗，能下 4k 呢。
-        assert logined is True, _("请先检查 SESSDATA 是否过期，再将 logined 设置为 True")  # 防误操作
-        upper_part = human_readable_upper_part_map(string=bvid, backward=True)
-        videos_basepath: Path = (
-            config.storage_home_dir / "videos" / f"{bvid}-{upper_part}"
-        )
+    """ on_page_downloaded(pid, video_basepath): 每个分P写好 _downloaded.mark 后调用（biliarchiver run 用它立即开始上传） """
+    assert d.hierarchy is True, _("hierarchy 必须为 True")  # 为保持后续目录结构、文件命名的一致性
+    assert d.client.cookies.get("SESSDATA") is not None, _(
+        "sess_data 不能为空"
+    )  # 开个大会员呗，能下 4k 呢。
+    assert logined is True, _("请先检查 SESSDATA 是否过期，再将 logined 设置为 True")  # 防误操作
+    upper_part = human_readable_upper_part_map(string=bvid, backward=True)
+    videos_basepath: Path = (
+        config.storage_home_dir / "videos" / f"{bvid}-{upper_part}"
+    )
+
+    if os.path.exists(videos_basepath / "_all_downloaded.mark"):
+        # print(f"{bvid} 所有分p都已下载过了")
+        print(_("{} 所有分p都已下载过了").format(bvid))
+        return
 
-        if os.path.exists(videos_basepath / "_all_downloaded.mark"):
-            # print(f"{bvid} 所有分p都已下载过了")
-            print(_("{} 所有分p都已下载过了").format(bvid))
-            return
+    url = f"https://www.bilibili.com/video/{bvid}/"
+    # 为了获取 pages，先请求一次
+    try:
+        first_video_info = await api.get_video_info(d.client, url)
+    except APIResourceError as e:
+        print(_("{} 获取 video_info 失败，原因：{}").format(bvid, e))
+        return
 
-        url = f"https://www.bilibili.com/video/{bvid}/"
-        # 为了获取 pages，先请求一次
+    os.makedirs(videos_basepath, exist_ok=True)
+    state_db = get_state_db()
+    if state_db.bv_state(bvid) is None:
+        state_db.set_bv_state(bvid, BVState.downloading)
+
+    # 先检查一遍所有分P，缺P的话一个都不下
+    for pid, page in enumerate(first_video_info.pages, start=1):  # pid 从 1 开始
+        if not page.p_url.endswith(f"?p={pid}"):
+            raise NotImplementedError(
+                _("{} 的 P{} 不存在 (可能视频被 UP 主 / B 站删了)，请报告此问题，我们需要这个样本！").format(
+                    bvid, pid
+                )
+            )
+
+    if space_budget is None:
+        space_budget = SpaceBudget(config.storage_home_dir, min_free_bytes=0)
+    if selection_policy is None:
+        selection_policy = SelectionPolicy.from_dict(config.selection)
+
+    # 同一个 BV 内的多个分P并发下载。
+    # 真正下载媒体流的 d.get_video 会占用 d.v_sema（大小为 video_concurrency），
+    # 这个名额是所有 BV 共享的，所以分P并发不会让全局的下载数超过 video_concurrency。
+    page_semaphore = asyncio.Semaphore(max(1, config.page_concurrency))
+    # BV 级别的元数据只请求一次，各分P共享
+    metadata = BVMetadataCache(
+        d.client, bvid, first_video_info, videos_basepath, full_replies=full_replies
+    )
+
+    # 整个 BV 的体积上限按分P时长分摊
+    page_durations = (
+        await metadata.get_page_durations()
+        if selection_policy.max_bytes_per_bv is not None
+        else None
+    )
+    page_byte_caps = selection_policy.page_byte_caps(
+        len(first_video_info.pages), page_durations
+    )
+
+    async def _archive_page_with_semaphore(pid: int, page):
+        with span("down.page_wait", bvid=bvid, pid=pid):
+            await page_semaphore.acquire()
         try:
-            first_video_info = await api.get_video_info(d.client, url)
-        except APIResourceError as e:
-            print(_("{} 获取 video_info 失败，原因：{}").format(bvid, e))
-            return
+            with metrics.PART_SECONDS.labels(stage="down").time(), span(
+                "down.page", bvid=bvid, pid=pid
+            ):
+                await archive_page(
+                    d, bvid, pid, page, videos_basepath, metadata, space_budget,
+                    selection_policy, page_byte_caps[pid - 1], defer_danmaku,
+                )
+        except Exception:
+            metrics.PARTS.labels(stage="down", result="failed").inc()
+            raise
+        else:
+            metrics.PARTS.labels(stage="down", result="ok").inc()
+        finally:
+            page_semaphore.release()
+        if on_page_downloaded is not None:
+            # 在释放分P名额之后调用，回调阻塞（下游队列满）时不占着下载名额
+            await on_page_downloaded(
+                pid, videos_basepath / f"{BILIBILI_IDENTIFIER_PERFIX}-{bvid}_p{pid}"
+            )
 
-        os.makedirs(videos_basepath, exist_ok=True)
+    tasks = [
+        asyncio.create_task(
+            _archive_page_with_semaphore(pid, page),
+            name=f"archive_page({bvid}_p{pid})",
+        )
+        for pid, page in enumerate(first_video_info.pages, start=1)
+    ]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        print(_("{}: 有分P下载出错，其他分P完成后将抛出异常...").format(bvid))
+        for error in errors:
+            traceback.print_exception(error)
+        # 空间不足要让调用方停止派发新的 BV，不能被其他分P的普通错误盖过
+        raise next((e for e in errors if isinstance(e, InsufficientSpaceError)), errors[0])
+
+    # bv 对应的全部 p 下好了
+    async with aiofiles.open(
+        f"{videos_basepath}/_all_downloaded.mark", "w", encoding="utf-8"
+    ) as f:
+        await f.write("")
+    state_db.set_bv_state(bvid, BVState.downloaded)
+
+
+async def archive_page(
+    d: DownloaderBilibili,
+    bvid: str,
+    pid: int,
+    page: api.Page,
+    videos_basepath: Path,
+    metadata: "BVMetadataCache",
+    space_budget: SpaceBudget,
+    selection_policy: SelectionPolicy,
+    page_byte_cap: Optional[int] = None,
+    defer_danmaku: bool = False,
+):
+    """ 下载单个分P。由 archive_bvid 调度，可与同一 BV 的其他分P并发运行。 """
+    file_basename = f"{bvid}_p{pid}"
+    video_basepath = (
+        videos_basepath / f"{BILIBILI_IDENTIFIER_PERFIX}-{file_basename}"
+    )
+    video_extrapath = video_basepath / "extra"
+    if os.path.exists(f"{video_basepath}/_downloaded.mark"):
+        print(_("{}: 已经下载过了").format(file_basename))
+        return
 
-        pid = 0
-        for page in first_video_info.pages:
-            pid += 1  # pid 从 1 开始
-            if not page.p_url.endswith(f"?p={pid}"):
-                raise NotImplementedError(
-                    _("{} 的 P{} 不存在 (可能视频被 UP 主 / B 站删了)，请报告此问题，我们需要这个样本！").format(
-                        bvid, pid
-                    )
-                )
+    # 不再清空上次未完成的下载缓存：已下载的分段会被续传（见 utils/resume.py），
+    # 只删掉合并中途被打断、只写了一半的最终文件
+    for _file in clean_unfinished_outputs(video_basepath, file_basename):
+        print(_("{}: {}，删除缓存: {}").format(file_basename, _("上次合并未完成"), _file))
+    video_info = await metadata.get_video_info(pid, page)
+    print(f"{file_basename}: {video_info.title}...")
+    os.makedirs(video_basepath, exist_ok=True)
+    os.makedirs(video_extrapath, exist_ok=True)
+
+    old_p_name = video_info.pages[video_info.p].p_name
+    old_title = video_info.title
+
+    # 在 d.hierarchy is True 且 title 超长的情况下， bilix 会将 p_name 作为文件名
+    video_info.pages[
+        video_info.p
+    ].p_name = file_basename  # 所以这里覆盖 p_name 为 file_basename
+    video_info.title = "iiiiii" * 50  # 然后假装超长标题
+    # 这样 bilix 保存的文件名就是我们想要的了（谁叫 bilix 不支持自定义文件名呢）
+    # NOTE: p_name 似乎也不宜过长，否则还是会被 bilix 截断。
+    # 但是我们以 {bvid}_p{pid} 作为文件名，这个长度是没问题的。
+
+    codec = None
+    quality = None
+    dm_size = (1920, 1080)  # 与 bilix 一致，拿不到分辨率时按 1080P 生成 ass
+    if video_info.dash:
+        # 先探测候选流是否真的存在（一些老视频缺失 hevc 资源），确定编码后再开始下载
+        with span("down.probe") as probe_span:
+            media = await selection_policy.choose_available_video(
+                video_info.dash,
+                lambda media: probe_media(d.client, media),
+                byte_cap=page_byte_cap,
+            )
+            probe_span.set(codec=media.codec if media else None)
+        assert media is not None, f"{file_basename}: " + _("没有 {} 编码的视频").format(
+            "、".join(selection_policy.codecs)
+        )
+        assert media.codec is not None and media.quality is not None
+        codec = media.codec
+        quality = media.quality
+        if media.width and media.height:
+            dm_size = (media.width, media.height)
+        print(f'{file_basename}: "{codec}" "{quality}" ...')
+    elif video_info.other:
+        # print(f"{file_basename}: 未解析到 dash 资源，交给 bilix 处理 ...")
+        print("{file_basename}: " + _("未解析到 dash 资源，交给 bilix 处理 ..."))
+        codec = ""
+        quality = 0
+    else:
+        raise APIError("{file_basename}: " + _("未解析到视频资源"), page.p_url)
+
+    assert codec is not None
+    assert isinstance(quality, (int, str))
+
+    if video_info.dash:
+        estimated_size = estimate_download_size(
+            video_info.dash.choose_quality(quality, codec), video_info.dash.duration
+        )
+    else:
+        estimated_size = estimate_download_size(video_info.other or [], 0)
+    print(_("{}: 预计占用 {} MiB").format(file_basename, estimated_size // 1024 // 1024))
+    async with space_budget.reserve(video_basepath, estimated_size):
+        await _download_page_media(
+            d, page, video_info, video_basepath, video_extrapath, file_basename,
+            codec, quality, metadata, defer_danmaku,
+        )
 
-            file_basename = f"{bvid}_p{pid}"
-            video_basepath = (
-                videos_basepath / f"{BILIBILI_IDENTIFIER_PERFIX}-{file_basename}"
+    assert os.path.exists(
+        video_basepath / f"{file_basename}.mp4"
+    ) or os.path.exists(video_basepath / f"{file_basename}.flv")
+
+    if metadata.full_replies:
+        # 全部评论和楼中楼，流式写入 JSON lines（整个 BV 只抓一次）。
+        # 可能要翻很多页，放在预留空间之外，不占着媒体的磁盘额度。
+        # 失败时抛出异常：分P不写 _downloaded.mark，BV 保持 downloading，下次 down 从断点继续抓
+        await metadata.save_full_replies(video_extrapath / f"{file_basename}.replies.jsonl")
+
+    if defer_danmaku:
+        # 只保留了 pb 弹幕，ass 留给 biliarchiver danmaku 生成
+        dm_stem = legal_title(file_basename, "弹幕")
+        if not (video_extrapath / f"{dm_stem}.ass").exists():
+            write_danmaku_pending(
+                video_basepath, f"{dm_stem}.pb", f"{dm_stem}.ass", *dm_size
             )
-            video_extrapath = video_basepath / "extra"
-            if os.path.exists(f"{video_basepath}/_downloaded.mark"):
-                print(_("{}: 已经下载过了").format(file_basename))
-                continue
-
-            def delete_cache(reason: str = ""):
-                if not os.path.exists(video_basepath):
-                    return
-                _files_in_video_basepath = os.listdir(video_basepath)
-                for _file in _files_in_video_basepath:
-                    if _file.startswith(file_basename):
-                        print(_("{}: {}，删除缓存: {}").format(file_basename, reason, _file))
-                        os.remove(video_basepath / _file)
-
-            delete_cache(_("为防出错，清空上次未完成的下载缓存"))
-            video_info = await api.get_video_info(d.client, page.p_url)
-            print(f"{file_basename}: {video_info.title}...")
-            os.makedirs(video_basepath, exist_ok=True)
-            os.makedirs(video_extrapath, exist_ok=True)
-
-            old_p_name = video_info.pages[video_info.p].p_name
-            old_title = video_info.title
-
-            # 在 d.hierarchy is True 且 title 超长的情况下， bilix 会将 p_name 作为文件名
-            video_info.pages[
-                video_info.p
-            ].p_name = file_basename  # 所以这里覆盖 p_name 为 file_basename
-            video_info.title = "iiiiii" * 50  # 然后假装超长标题
-            # 这样 bilix 保存的文件名就是我们想要的了（谁叫 bilix 不支持自定义文件名呢）
-            # NOTE: p_name 似乎也不宜过长，否则还是会被 bilix 截断。
-            # 但是我们以 {bvid}_p{pid} 作为文件名，这个长度是没问题的。
-
-            codec = None
-            quality = None
-            if video_info.dash:
-                # 选择编码 dvh->hev->avc
-                # 不选 av0 ，毕竟目前没几个设备能拖得动
-                codec_candidates = ["dvh", "hev", "avc"]
-                for codec_candidate in codec_candidates:
-                    for media in video_info.dash.videos:
-                        if media.codec.startswith(codec_candidate):
-                            codec = media.codec
-                            quality = media.quality
-                            print(f'{file_basename}: "{codec}" "{media.quality}" ...')
-                            break
-                    if codec is not None:
-                        break
-                assert (
-                    codec is not None and quality is not None
-                ), f"{file_basename}: " + _("没有 dvh、avc 或 hevc 编码的视频")
-            elif video_info.other:
-                # print(f"{file_basename}: 未解析到 dash 资源，交给 bilix 处理 ...")
-                print("{file_basename}: " + _("未解析到 dash 资源，交给 bilix 处理 ..."))
-                codec = ""
-                quality = 0
-            else:
-                raise APIError("{file_basename}: " + _("未解析到视频资源"), page.p_url)
-
-            assert codec is not None
-            assert isinstance(quality, (int, str))
-
-            cor1 = d.get_video(
+
+    # 还原为了自定义文件名而做的覆盖
+    video_info.pages[video_info.p].p_name = old_p_name
+    video_info.title = old_title
+
+    # 单 p 下好了
+    async with aiofiles.open(
+        f"{video_basepath}/_downloaded.mark", "w", encoding="utf-8"
+    ) as f:
+        await f.write("")
+    get_state_db().set_part_state(bvid, pid, PartState.downloaded)
+
+
+async def _download_page_media(
+    d: DownloaderBilibili,
+    page: api.Page,
+    video_info: api.VideoInfo,
+    video_basepath: Path,
+    video_extrapath: Path,
+    file_basename: str,
+    codec: str,
+    quality,
+    metadata: "BVMetadataCache",
+    defer_danmaku: bool,
+):
+    """ 下载分P的音视频、弹幕、封面、字幕和元数据，在 archive_page 预留的磁盘空间内进行 """
+
+    async def get_video():
+        with span("down.media", codec=codec, quality=quality) as media_span:
+            await d.get_video(
                 page.p_url,
                 video_info=video_info,
                 path=video_basepath,
-                quality=quality,  # 选择最高画质
+                quality=quality,  # 画质由选择策略决定
                 codec=codec,  # 编码
-                # 下载 ass 弹幕(bilix 会自动调用 danmukuC 将 pb 弹幕转为 ass)、封面、字幕
-                # 弹幕、封面、字幕都会被放进 extra 子目录里，所以需要 d.hierarchy is True
-                dm=True,
-                image=True,
+                # 下载 ass 弹幕(bilix 会自动调用 danmukuC 将 pb 弹幕转为 ass，defer_danmaku 时推迟生成)、字幕
+                # 弹幕、字幕都会被放进 extra 子目录里，所以需要 d.hierarchy is True
+                dm=not defer_danmaku,
+                image=False,  # 封面由 metadata.save_cover 下载，整个 BV 只下一次
                 subtitle=True,
             )
-            # 下载原始的 pb 弹幕
-            cor2 = d.get_dm(page.p_url, video_info=video_info, path=video_extrapath)
-            # 下载视频超详细信息（BV 级别，不是分 P 级别）
-            cor3 = download_bilibili_video_detail(
-                d.client, bvid, f"{video_extrapath}/{file_basename}.info.json"
-            )
-            # 下载视频评论。有些视频关闭了评论会获取不到。
-            cor4 = download_bilibili_video_replies(
-                d.client, video_info.bvid, video_info.aid,
-                f"{video_extrapath}/{file_basename}.replies.json"
-            )
-            coroutines = [cor1, cor2, cor3, cor4]
-            tasks = [asyncio.create_task(cor) for cor in coroutines]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            for result, cor in zip(results, coroutines):
-                if isinstance(result, Exception):
-                    print(_("出错，其他任务完成后将抛出异常..."))
-                    # No need to modify other code since asyncio.gather already waited for all tasks
-                    traceback.print_exception(result)
-                    raise result
-
-            if codec.startswith("hev") and not os.path.exists(
-                video_basepath / f"{file_basename}.mp4"
-            ):
-                # 如果有下载缓存文件（以 file_basename 开头的文件），说明这个 hevc 的 dash 资源存在，只是可能因为网络之类的原因下载中途失败了
-                delete_cache(_("下载出错"))
-
-                # 下载缓存文件都不存在，应该是对应的 dash 资源根本就没有，一些老视频会出现这种情况。
-                # 换 avc 编码
-                print(
-                    _("{}: 视频文件没有被下载？也许是 hevc 对应的 dash 资源不存在，尝试 avc ……").format(
-                        file_basename
-                    )
-                )
-                assert video_info.dash is not None
-                for media in video_info.dash.videos:
-                    if media.codec.startswith("avc"):
-                        codec = media.codec
-                        print(f'{file_basename}: "{codec}" "{media.quality}" ...')
-                        break
-                cor4 = d.get_video(
-                    page.p_url,
-                    video_info=video_info,
-                    path=video_basepath,
-                    quality=0,  # 选择最高画质
-                    codec=codec,  # 编码
-                    # 下载 ass 弹幕(bilix 会自动调用 danmukuC 将 pb 弹幕转为 ass)、封面、字幕
-                    # 弹幕、封面、字幕都会被放进 extra 子目录里，所以需要 d.hierarchy is True
-                    dm=True,
-                    image=True,
-                    subtitle=True,
-                )
-                await cor4
+            for suffix in (".mp4", ".flv"):
+                if (video_basepath / f"{file_basename}{suffix}").exists():
+                    media_span.set(bytes=os.path.getsize(video_basepath / f"{file_basename}{suffix}"))
+
+    cor1 = get_video()
+    # 下载原始的 pb 弹幕
+    cor2 = d.get_dm(page.p_url, video_info=video_info, path=video_extrapath)
+    # 下载视频超详细信息（BV 级别，不是分 P 级别，整个 BV 只请求一次）
+    cor3 = metadata.save_detail(f"{video_extrapath}/{file_basename}.info.json")
+    # 下载视频评论。有些视频关闭了评论会获取不到。（同样整个 BV 只请求一次）
+    cor4 = metadata.save_replies(f"{video_extrapath}/{file_basename}.replies.json")
+    # 下载封面，文件名与 bilix 的 get_static 一致：{file_basename}{url 的后缀}
+    cover_suffix = PurePath(urlparse(video_info.img_url).path).suffix
+    cor5 = metadata.save_cover(video_info.img_url, video_extrapath / f"{file_basename}{cover_suffix}")
+    coroutines = [cor1, cor2, cor3, cor4, cor5]
+    tasks = [asyncio.create_task(cor) for cor in coroutines]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result, cor in zip(results, coroutines):
+        if isinstance(result, Exception):
+            print(_("出错，其他任务完成后将抛出异常..."))
+            # No need to modify other code since asyncio.gather already waited for all tasks
+            traceback.print_exception(result)
+            raise result
+
+
+class BVMetadataCache:
+    """
+    同一个 BV 的所有分P共享的元数据缓存。
+    view/detail、第一页评论和封面都是 BV 级别的，每个 BV 只请求一次，
+    内容存进 blob 仓库（utils/blobs.py）一次，再硬链接到每个分P的 extra 目录。
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        bvid: str,
+        first_video_info: api.VideoInfo,
+        videos_basepath: Optional[Path] = None,
+        full_replies: bool = False,
+    ):
+        self.client = client
+        self.bvid = bvid
+        self.first_video_info = first_video_info
+        self.videos_basepath = videos_basepath
+        self.full_replies = full_replies
+        """ 是否抓取全部评论（包括楼中楼）到 .replies.jsonl """
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _once(self, key: str, coro_func) -> "asyncio.Future":
+        # 并发的分P共享同一个请求，失败了也共享同一个异常，不会一起重试把 API 打爆
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.ensure_future(coro_func())
+        return asyncio.shield(self._tasks[key])
+
+    async def get_video_info(self, pid: int, page: api.Page) -> api.VideoInfo:
+        if pid == 1:
+            # 获取 pages 时请求的就是 P1，不用再请求一次。
+            # 复制一份，因为 archive_page 会临时改写 title 和 p_name
+            return self.first_video_info.model_copy(deep=True)
+        return await api.get_video_info(self.client, page.p_url)
+
+    def _detail(self) -> "asyncio.Future":
+        return self._once(
+            "detail", lambda: fetch_bilibili_video_detail(self.client, self.bvid)
+        )
+
+    async def get_page_durations(self) -> Optional[List[int]]:
+        """ 各分P的时长（秒），取自 view/detail。获取失败返回 None """
+        try:
+            text = await self._detail()
+            pages = json.loads(text)["data"]["View"]["pages"]
+            return [int(page["duration"]) for page in pages]
+        except Exception as e:
+            print(_("{} 获取分P时长失败：{}").format(self.bvid, e))
+            return None
 
-            assert os.path.exists(
-                video_basepath / f"{file_basename}.mp4"
-            ) or os.path.exists(video_basepath / f"{file_basename}.flv")
+    async def _write_blob(self, data, filepath):
+        """ 同一 BV 的各分P内容相同，写进 blob 仓库一次，再硬链接到各分P """
+        await asyncio.get_running_loop().run_in_executor(
+            None, _write_blob_and_record, data, filepath
+        )
 
-            # 还原为了自定义文件名而做的覆盖
-            video_info.pages[video_info.p].p_name = old_p_name
-            video_info.title = old_title
+    async def save_detail(self, filepath):
+        if os.path.exists(filepath):
+            print(_("{} 的视频详情已存在").format(self.bvid))
+            return
+        text = await self._detail()
+        await self._write_blob(text, filepath)
+        print(_("{} 的视频详情已保存").format(self.bvid))
 
-            # 单 p 下好了
-            async with aiofiles.open(
-                f"{video_basepath}/_downloaded.mark", "w", encoding="utf-8"
-            ) as f:
-                await f.write("")
+    async def save_cover(self, url: str, filepath):
+        """ 封面是 BV 级别的，整个 BV 只下载一次 """
+        if os.path.exists(filepath):
+            return
 
-        # bv 对应的全部 p 下好了
-        async with aiofiles.open(
-            f"{videos_basepath}/_all_downloaded.mark", "w", encoding="utf-8"
-        ) as f:
-            await f.write("")
+        async def fetch():
+            r = await req_retry(self.client, url)
+            return r.content
 
+        content = await self._once(f"cover:{url}", fetch)
+        await self._write_blob(content, filepath)
 
-async def download_bilibili_video_detail(client, bvid, filepath):
-    if os.path.exists(filepath):
-        print(_("{} 的视频详情已存在").format(bvid))
-        return
+    async def save_replies(self, filepath):
+        if os.path.exists(filepath):
+            print(_("{} 的视频回复已存在").format(self.bvid))
+            return
+        text = await self._once(
+            "replies",
+            lambda: fetch_bilibili_video_replies(
+                self.client, self.bvid, self.first_video_info.aid
+            ),
+        )
+        if text is None:
+            return
+        await self._write_blob(text, filepath)
+        print(_("{} 的视频评论已保存").format(self.bvid))
+
+    async def _crawl_full_replies(self) -> Tuple[Path, StreamDigest]:
+        """
+        在 BV 目录下抓取（断点 .partial / .checkpoint.json 放在这里，中断后下次继续），
+        抓完后整个文件改名进 blob 仓库，BV 目录下不留副本
+        """
+        assert self.videos_basepath is not None
+        bv_replies_path = self.videos_basepath / REPLIES_SCRATCH_FILENAME
+        try:
+            with span("down.replies_full", bvid=self.bvid) as replies_span:
+                count = await RepliesCrawler(
+                    self.client, self.first_video_info.aid, bv_replies_path
+                ).crawl()
+                replies_span.set(count=count)
+        except Exception as e:
+            # 断点保留，下次继续
+            print(_("{} 的全部评论抓取失败：{}").format(self.bvid, e))
+            raise
+        if count >= 0:
+            print(_("{} 的全部评论已抓取，共 {} 条").format(self.bvid, count))
+        return await asyncio.get_running_loop().run_in_executor(
+            None, get_blob_store().adopt, bv_replies_path
+        )
+
+    async def save_full_replies(self, filepath):
+        """ 全部评论每个 BV 只抓一次，存进 blob 仓库后硬链接到各分P的 extra 目录 """
+        if os.path.exists(filepath):
+            print(_("{} 的全部评论已存在").format(self.bvid))
+            return
+        blob, digest = await self._once("full_replies", self._crawl_full_replies)
+        await asyncio.get_running_loop().run_in_executor(
+            None, _link_blob_and_record, blob, digest, filepath
+        )
+
+
+def _write_blob_and_record(data, filepath):
+    """ filepath 在分P的 extra 目录下，摘要记进分P的 _manifest.json """
+    filepath = Path(filepath)
+    record_digests(filepath.parent.parent, {filepath: get_blob_store().write(data, filepath)})
+
+
+def _link_blob_and_record(blob: Path, digest: StreamDigest, filepath):
+    filepath = Path(filepath)
+    get_blob_store().link(blob, filepath)
+    record_digests(filepath.parent.parent, {filepath: digest.finish(filepath)})
+
+
+async def fetch_bilibili_video_detail(client, bvid) -> str:
     # url = 'https://api.bilibili.com/x/web-interface/view'
     url = "https://api.bilibili.com/x/web-interface/view/detail"  # 超详细 API（BV 级别，不是分 P 级别）
     params = {"bvid": bvid}
@@ -292,29 +547,22 @@ async def download_bilibili_video_detail(client, bvid, filepath):
     r.raise_for_status()
     r_json = r.json()
     assert r_json["code"] == 0, _("{} 的视频详情获取失败").format(bvid)
+    return r.text
 
-    async with aiofiles.open(filepath, "w", encoding="utf-8") as f:
-        # f.write(json.dumps(r.json(), indent=4, ensure_ascii=False))
-        await f.write(r.text)
-    print(_("{} 的视频详情已保存").format(bvid))
 
-
-async def download_bilibili_video_replies(client, bvid, aid, filepath):
+async def fetch_bilibili_video_replies(client, bvid, aid) -> Optional[str]:
     for i in range(2):
         try:
-            await _download_bilibili_video_replies(client, bvid, aid, filepath)
-            return True
+            return await _fetch_bilibili_video_replies(client, bvid, aid)
         except Exception as e:
             print(e, "retrying...")
-    
+
     print(_("{} 的视频回复获取失败").format(bvid))
+    return None
 
-async def _download_bilibili_video_replies(client, bvid, aid, filepath):
-    """ 仅下载第一页，20 个热评 """
-    if os.path.exists(filepath):
-        print(_("{} 的视频回复已存在").format(bvid))
-        return
 
+async def _fetch_bilibili_video_replies(client, bvid, aid) -> str:
+    """ 仅获取第一页，20 个热评 """
     url = "https://api.bilibili.com/x/v2/reply"
     params = {
         "type": 1,
@@ -327,8 +575,4 @@ async def _download_bilibili_video_replies(client, bvid, aid, filepath):
     r.raise_for_status()
     r_json = r.json()
     assert r_json["code"] == 0, _("{} 的视频回复获取失败").format(bvid)
-
-    async with aiofiles.open(filepath, "w", encoding="utf-8") as f:
-        # f.write(json.dumps(r.json(), indent=4, ensure_ascii=False))
-        await f.write(r.text)
-    print(_("{} 的视频评论已保存").format(bvid))
+    return r.text
@@ -1,10 +1,27 @@
 import asyncio
+import functools
+import hashlib
+import itertools
 import os
+import time
+import traceback
+from collections import deque
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from bilix.sites.bilibili.downloader import DownloaderBilibili
-from httpx import AsyncClient, Client, TransportError
+from httpx import AsyncClient, Client, Limits, Response, TransportError
 from rich.traceback import install
 
 from biliarchiver.archive_bvid import archive_bvid
@@ -12,27 +29,61 @@ from biliarchiver.config import config
 from biliarchiver.config import BILIBILI_IDENTIFIER_PERFIX
 from biliarchiver.utils.http_patch import HttpOnlyCookie_Handler
 from biliarchiver.utils.version_check import check_outdated_version
-from biliarchiver.utils.storage import get_free_space
+from biliarchiver.utils.storage import InsufficientSpaceError, SpaceBudget, get_dir_size
+from biliarchiver.utils.coordinator import LeaseStatus, get_coordinator
+from biliarchiver.utils import metrics
+from biliarchiver.utils.tracing import set_trace_file, span
 from biliarchiver.utils.identifier import human_readable_upper_part_map
 from biliarchiver.utils.ffmpeg import check_ffmpeg
+from biliarchiver.utils.ia_index import get_ia_item_index
+from biliarchiver.utils.ratelimit import (
+    IntervalLimiter,
+    get_rate_limiter,
+    install_rate_limiter,
+)
+from biliarchiver.utils.selection import SelectionPolicy
+from biliarchiver.utils.state_db import get_state_db
 from biliarchiver.version import BILI_ARCHIVER_VERSION
-from biliarchiver.cli_tools.utils import read_bvids
+from biliarchiver.cli_tools.utils import (
+    BVidsCheckpoint,
+    aiter_bvids,
+    bvids_may_block,
+    iter_bvids,
+)
 from biliarchiver.i18n import _
 
 install()
 
 
-def check_ia_item_exist(client: Client, identifier: str) -> bool:
-    cache_dir = config.storage_home_dir / "ia_item_exist_cache"
-    # check_ia_item_exist_from_cache_file:
-    if (cache_dir / f"{identifier}.mark").exists():
-        # print('from cached .mark')
+IA_CHECK_CONCURRENCY = 8
+""" 同时进行的 check_identifier.php 请求数 """
+IA_CHECK_MIN_INTERVAL = 0.1
+""" 两次 check_identifier.php 请求之间的最小间隔（秒），即最多 10 req/s """
+IA_CHECK_WINDOW = 64
+""" 向前预取多少个 bvid 的检查结果 """
+IA_CHECK_API = "https://archive.org/services/check_identifier.php"
+
+
+def _ia_item_exist_cached(identifier: str) -> bool:
+    return identifier in get_ia_item_index()
+
+
+def _parse_check_identifier(identifier: str, r: Response) -> bool:
+    r.raise_for_status()
+    r_json = r.json()
+    assert r_json["type"] == "success"
+    if r_json["code"] == "available":
+        return False
+    elif r_json["code"] == "not_available":  # exists
+        get_ia_item_index().add(identifier)
         return True
+    else:
+        raise ValueError(f'Unexpected code: {r_json["code"]}')
+
 
-    def create_item_exist_cache_file(identifier: str) -> Path:
-        with open(cache_dir / f"{identifier}.mark", "w", encoding="utf-8") as f:
-            f.write("")
-        return cache_dir / f"{identifier}.mark"
+def check_ia_item_exist(client: Client, identifier: str) -> bool:
+    if _ia_item_exist_cached(identifier):
+        return True
 
     params = {
         "identifier": identifier,
@@ -42,24 +93,114 @@ def check_ia_item_exist(client: Client, identifier: str) -> bool:
     r = None
     for _ in range(3):
         try:
-            r = client.get(
-                "https://archive.org/services/check_identifier.php", params=params
-            )
+            r = client.get(IA_CHECK_API, params=params)
             break
         except TransportError as e:
             print(e, "retrying...")
     assert r is not None
-    r.raise_for_status()
-    r_json = r.json()
-    assert r_json["type"] == "success"
-    if r_json["code"] == "available":
-        return False
-    elif r_json["code"] == "not_available":  # exists
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        create_item_exist_cache_file(identifier)
-        return True
-    else:
-        raise ValueError(f'Unexpected code: {r_json["code"]}')
+    return _parse_check_identifier(identifier, r)
+
+
+T = TypeVar("T")
+
+
+class IAItemExistPrefetcher:
+    """
+    在下载之前提前检查接下来的 identifier 是否已存在于 IA。
+
+    用独立的 AsyncClient（连接池）并发请求，自带限速，不阻塞事件循环；
+    按输入顺序产出结果，下载 worker 不用等 archive.org 的延迟。
+    """
+
+    def __init__(
+        self,
+        concurrency: int = IA_CHECK_CONCURRENCY,
+        min_interval: float = IA_CHECK_MIN_INTERVAL,
+    ):
+        self.client = AsyncClient(
+            limits=Limits(
+                max_connections=concurrency, max_keepalive_connections=concurrency
+            ),
+            timeout=30,
+        )
+        self._sema = asyncio.Semaphore(concurrency)
+        self._limiter = IntervalLimiter(min_interval)
+
+    async def check(self, identifier: str) -> bool:
+        if _ia_item_exist_cached(identifier):
+            return True
+
+        params = {
+            "identifier": identifier,
+            "output": "json",
+        }
+        async with self._sema:
+            r = None
+            for _ in range(3):
+                await self._limiter.acquire()
+                try:
+                    r = await self.client.get(IA_CHECK_API, params=params)
+                    break
+                except TransportError as e:
+                    print(e, "retrying...")
+        assert r is not None
+        return _parse_check_identifier(identifier, r)
+
+    async def prefetch(
+        self,
+        items: AsyncIterable[T],
+        identifier_of: Callable[[T], str],
+        window: int = IA_CHECK_WINDOW,
+    ) -> AsyncIterator[Tuple[T, bool]]:
+        """
+        按 items 的顺序产出 (item, 是否已存在)，同时最多向前检查 window 个。
+        items 来自 stdin / FIFO 时可能迟迟没有下一条，这时不等它，先产出已经检查完的
+        """
+        in_flight: Deque[Tuple[T, "asyncio.Task[bool]"]] = deque()
+        items_iter = items.__aiter__()
+        next_item: "Optional[asyncio.Future[T]]" = None
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < window:
+                    if next_item is None:
+                        next_item = asyncio.ensure_future(items_iter.__anext__())
+                    if in_flight:
+                        await asyncio.wait(
+                            (next_item, in_flight[0][1]), return_when=asyncio.FIRST_COMPLETED
+                        )
+                        if not next_item.done():
+                            break
+                    try:
+                        item = await next_item
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    finally:
+                        if next_item.done():
+                            next_item = None
+                    in_flight.append(
+                        (item, asyncio.create_task(self.check(identifier_of(item))))
+                    )
+                if not in_flight:
+                    return
+                item, task = in_flight.popleft()
+                yield item, await task
+        finally:
+            pending = [task for _item, task in in_flight]
+            if next_item is not None:
+                pending.append(next_item)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def ia_identifier_of_bvid(bvid: str) -> str:
+    upper_part = human_readable_upper_part_map(string=bvid, backward=True)
+    return f"{BILIBILI_IDENTIFIER_PERFIX}-{bvid}_p1-{upper_part}"
 
 
 async def _down(
@@ -69,10 +210,55 @@ async def _down(
     min_free_space_gb: int,
     skip_to: int,
     disable_version_check: bool,
+    checkpoint: Optional[str] = None,
+    cookies: Optional[Tuple[str, ...]] = None,
+    codecs: Optional[str] = None,
+    max_height: Optional[int] = None,
+    max_mb_per_minute: Optional[float] = None,
+    max_gb_per_bv: Optional[float] = None,
+    defer_danmaku: Optional[bool] = None,
+    full_replies: Optional[bool] = None,
+    coordinator: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+    trace_file: Optional[str] = None,
+    on_page_downloaded: Optional[Callable[[str, int, Path], Awaitable[None]]] = None,
+    on_bv_done: Optional[Callable[[str, bool], Awaitable[None]]] = None,
 ):
+    """
+    on_page_downloaded(bvid, pid, video_basepath): 分P下载完成后调用；
+    on_bv_done(bvid, all_downloaded): BV 处理结束（下载完成、失败或之前已下载完）后调用。
+    两者都是给 biliarchiver run 的上传流水线用的，down 命令不传
+    """
     assert check_ffmpeg() is True, _("ffmpeg 未安装")
 
-    bvids_list = read_bvids(bvids)
+    selection_policy = SelectionPolicy.from_dict(config.selection).override(
+        codecs=[c.strip() for c in codecs.split(",") if c.strip()] if codecs else None,
+        max_height=max_height,
+        max_bytes_per_minute=int(max_mb_per_minute * 1024 * 1024)
+        if max_mb_per_minute is not None
+        else None,
+        max_bytes_per_bv=int(max_gb_per_bv * 1024 * 1024 * 1024)
+        if max_gb_per_bv is not None
+        else None,
+    )
+    if selection_policy != SelectionPolicy():
+        print(_("视频流选择策略: {}").format(selection_policy.to_dict()))
+
+    if defer_danmaku is None:
+        defer_danmaku = config.danmaku_defer
+    if full_replies is None:
+        full_replies = config.full_replies
+
+    bvids_checkpoint = BVidsCheckpoint(checkpoint, bvids) if checkpoint else None
+    start_offset = bvids_checkpoint.load() if bvids_checkpoint else 0
+    if start_offset:
+        print(_("从断点文件 {} 恢复，跳到第 {} 字节").format(checkpoint, start_offset))
+    bvids_iter = iter_bvids(bvids, start_offset=start_offset)
+    if skip_to > 0:
+        print(_("跳过前 {} 个 bvid").format(skip_to))
+        bvids_iter = itertools.islice(bvids_iter, skip_to, None)
+    # stdin / FIFO 的读取会阻塞，由 aiter_bvids 放到线程里读
+    bvids_aiter = aiter_bvids(bvids_iter, bvids_may_block(bvids))
 
     check_outdated_version(
         pypi_project="biliarchiver", self_version=BILI_ARCHIVER_VERSION
@@ -80,98 +266,350 @@ async def _down(
         _("pypi version check disabled")
     )
 
+    if cookies:
+        cookies_files = list(cookies)
+    elif config.cookies_pool:
+        cookies_files = list(config.cookies_pool)
+    else:
+        cookies_files = [config.cookies_file]
+    # 所有账号共用一个进度条
+    progress = None
+    accounts: List[Account] = []
+    if from_browser is not None:
+        cookies_files = [None]
+    for cookies_file in cookies_files:
+        account = build_account(
+            from_browser, cookies_file, progress, own_limiter=len(cookies_files) > 1
+        )
+        if account is None:
+            continue
+        progress = account.d.progress
+        accounts.append(account)
+    if not accounts:
+        return
+    account_pool = AccountPool(accounts)
+    if len(accounts) > 1:
+        print(_("共 {} 个可用账号，按负载分配 BV").format(len(accounts)))
+
+    # 按各分P的预计大小预留磁盘空间，放不下就等其他分P下完，而不是等磁盘满了再全部取消
+    space_budget = SpaceBudget(
+        config.storage_home_dir, min_free_bytes=min_free_space_gb * 1024 * 1024 * 1024
+    )
+
+    metrics.start_metrics_server(metrics_port)
+    set_trace_file(trace_file)
+    metrics.SPACE_RESERVED.set_function(lambda: space_budget.last_outstanding)
+
+    state_db = get_state_db()
+    # 多个 down 进程（可在不同机器上）通过协调器领取 BV，互不重复
+    lease_coordinator = get_coordinator("down", coordinator)
+    if lease_coordinator is not None:
+        # 协调器的 SQLite 事务可能等锁很久，都放到 executor 里，不卡住事件循环
+        await asyncio.get_running_loop().run_in_executor(None, lease_coordinator.start)
+        print(_("已连接协调器 {}（worker {}）").format(lease_coordinator.db_path, lease_coordinator.owner))
+    accounts[0].d.progress.start()
+
+    def entry_finished(entry_id: int):
+        if bvids_checkpoint is not None:
+            bvids_checkpoint.finished(entry_id)
+
+    def entry_skipped(entry_id: int):
+        if bvids_checkpoint is not None:
+            bvids_checkpoint.skipped(entry_id)
+
+    # 固定数量的 worker 从有界队列里取 bvid，队列满了生产者就等着，调度开销与列表长度无关
+    # 每个账号有自己的 video_concurrency 个名额
+    worker_num = config.video_concurrency * len(accounts)
+    queue: "asyncio.Queue[Optional[Tuple[str, int]]]" = asyncio.Queue(maxsize=worker_num)
+    failed_bvids: List[Tuple[str, BaseException]] = []
+    metrics.DOWN_QUEUE_DEPTH.set_function(queue.qsize)
+
+    def bv_basepath(bvid: str) -> Path:
+        return (
+            config.storage_home_dir
+            / "videos"
+            / f"{bvid}-{human_readable_upper_part_map(string=bvid, backward=True)}"
+        )
+
+    async def release_lease(bvid: str, ok: bool):
+        if lease_coordinator is None:
+            return
+        nbytes = 0
+        if ok:
+            nbytes = await asyncio.get_running_loop().run_in_executor(
+                None, get_dir_size, bv_basepath(bvid)
+            )
+        await asyncio.get_running_loop().run_in_executor(
+            None, lease_coordinator.release, bvid, ok, nbytes
+        )
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                bvid, entry_id = item
+                with span("down.account_wait", bvid=bvid):
+                    account = await account_pool.acquire()
+                try:
+                    with metrics.DOWN_WORKERS_BUSY.track_inprogress(), span("down.bv", bvid=bvid):
+                        await archive_bvid(
+                            account.d,
+                            bvid,
+                            logined=True,
+                            space_budget=space_budget,
+                            selection_policy=selection_policy,
+                            defer_danmaku=defer_danmaku,
+                            full_replies=full_replies,
+                            on_page_downloaded=functools.partial(on_page_downloaded, bvid)
+                            if on_page_downloaded is not None
+                            else None,
+                        )
+                except InsufficientSpaceError as e:
+                    print(e)
+                    raise
+                except Exception as e:
+                    metrics.BVS.labels(stage="down", result="failed").inc()
+                    account_pool.release(account)
+                    await release_lease(bvid, ok=False)
+                    traceback.print_exception(e)
+                    print(f"任务 {bvid} 出错，但其他任务将继续执行...")
+                    failed_bvids.append((bvid, e))
+                    # 失败的不算完成，重启后会从它开始重试
+                    await account_pool.check_login(account)
+                    if on_bv_done is not None:
+                        await on_bv_done(bvid, False)
+                except BaseException:
+                    account_pool.release(account)
+                    raise
+                else:
+                    metrics.BVS.labels(stage="down", result="ok").inc()
+                    account_pool.release(account)
+                    await release_lease(bvid, ok=True)
+                    entry_finished(entry_id)
+                    if on_bv_done is not None:
+                        await on_bv_done(bvid, True)
+            finally:
+                queue.task_done()
+
+    async def producer():
+        async def no_ia_check(entries):
+            async for entry in entries:
+                yield entry, False
+
+        ia_prefetcher = None if skip_ia_check else IAItemExistPrefetcher()
+        checked_entries = (
+            no_ia_check(bvids_aiter)
+            if ia_prefetcher is None
+            else ia_prefetcher.prefetch(
+                bvids_aiter, lambda entry: ia_identifier_of_bvid(entry.bvid)
+            )
+        )
+        index = skip_to - 1
+        try:
+            async for entry, ia_item_exist in checked_entries:
+                index += 1
+                bvid = entry.bvid
+                entry_id = bvids_checkpoint.dispatched(entry) if bvids_checkpoint else -1
+                if ia_item_exist:
+                    print(_("IA 上已存在 {}，跳过").format(ia_identifier_of_bvid(bvid)))
+                    metrics.BVS.labels(stage="down", result="skipped").inc()
+                    entry_finished(entry_id)
+                    continue
+
+                if state_db.is_bv_downloaded(bvid) and not (
+                    bv_basepath(bvid) / "_all_downloaded.mark"
+                ).exists():
+                    # 状态库说已下载，但文件夹被手动删掉了：忘掉它，重新下载
+                    print(_("{} 的文件夹已不存在，重新下载").format(bvid))
+                    state_db.forget_bv(bvid)
+
+                if state_db.is_bv_downloaded(bvid):
+                    print(_("{} 的所有分p都已下载过了").format(bvid))
+                    metrics.BVS.labels(stage="down", result="skipped").inc()
+                    entry_finished(entry_id)
+                    if on_bv_done is not None:
+                        # 已下载但可能还没上传
+                        await on_bv_done(bvid, True)
+                    continue
+
+                if lease_coordinator is not None:
+                    lease_status = await asyncio.get_running_loop().run_in_executor(
+                        None, lease_coordinator.acquire, bvid
+                    )
+                    if lease_status is LeaseStatus.done:
+                        print(_("{} 已由其他 worker 完成，跳过").format(bvid))
+                        metrics.BVS.labels(stage="down", result="skipped").inc()
+                        entry_finished(entry_id)
+                        continue
+                    if lease_status is LeaseStatus.held:
+                        print(_("{} 已由其他 worker 处理，跳过").format(bvid))
+                        metrics.BVS.labels(stage="down", result="skipped").inc()
+                        # 对方可能失败，断点不能越过它
+                        entry_skipped(entry_id)
+                        continue
+
+                try:
+                    await space_budget.wait_for(0)
+                except InsufficientSpaceError as e:
+                    print(e)
+                    raise
+                await queue.put((bvid, entry_id))
+                print(f"=== {bvid} ({index+1}) ===")
+        finally:
+            await checked_entries.aclose()
+            if ia_prefetcher is not None:
+                await ia_prefetcher.aclose()
+
+        if index < skip_to:
+            print(_("bvids 为空"))
+        for _i in range(worker_num):
+            await queue.put(None)
+
+    pipeline = [asyncio.create_task(producer(), name="down_producer")] + [
+        asyncio.create_task(worker(), name=f"down_worker({i})")
+        for i in range(worker_num)
+    ]
+    try:
+        done, _pending = await asyncio.wait(pipeline, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                # 剩余空间不足等，取消所有任务
+                raise task.exception()  # type: ignore
+    finally:
+        for task in pipeline:
+            task.cancel()
+        await asyncio.gather(*pipeline, return_exceptions=True)
+        if lease_coordinator is not None:
+            # 没处理完的 BV（排队中、被取消）交还给其他 worker
+            await asyncio.get_running_loop().run_in_executor(None, lease_coordinator.close)
+
+    if failed_bvids:
+        print(f"完成所有任务，但有 {len(failed_bvids)} 个任务失败")
+        raise failed_bvids[0][1]
+
+    print("DONE")
+
+
+ACCOUNT_THROTTLE_LIMIT = 3
+""" 一个 BV 下载期间遇到这么多次风控，就让该账号休息 """
+ACCOUNT_COOLDOWN = 600
+""" 账号被风控后休息多少秒 """
+
+
+class Account:
+    """ 一个 B 站账号：独立的 DownloaderBilibili / httpx client 和限速器 """
+
+    def __init__(
+        self, name: str, d: DownloaderBilibili, client: Client, limiter_key: str = ""
+    ):
+        self.name = name
+        self.d = d
+        self.client = client
+        self.limiter = get_rate_limiter(limiter_key)
+        self.active = 0
+        """ 正在下载的 BV 数 """
+        self.assigned = 0
+        """ 累计分配到的 BV 数 """
+        self.disabled = False
+        self.cooldown_until = 0.0
+        self._throttled_seen = 0
+
+    def available(self, now: float) -> bool:
+        return not self.disabled and now >= self.cooldown_until
+
+
+class AccountPool:
+    """
+    多账号下载：每个 BV 分给当前负载最小的可用账号。
+    账号登录失效时移出轮换；下载一个 BV 期间被风控太多次则休息 ACCOUNT_COOLDOWN 秒。
+    """
+
+    def __init__(self, accounts: List[Account]):
+        self.accounts = accounts
+
+    async def acquire(self) -> Account:
+        while True:
+            now = time.monotonic()
+            available = [account for account in self.accounts if account.available(now)]
+            if available:
+                account = min(available, key=lambda a: (a.active, a.assigned))
+                account.active += 1
+                account.assigned += 1
+                return account
+            resting = [a.cooldown_until for a in self.accounts if not a.disabled]
+            if not resting:
+                raise RuntimeError(_("没有可用的账号（全部登录失效）"))
+            await asyncio.sleep(max(0.0, min(resting) - now))
+
+    def release(self, account: Account):
+        account.active -= 1
+        throttled = account.limiter.throttled()
+        if throttled - account._throttled_seen >= ACCOUNT_THROTTLE_LIMIT:
+            account.cooldown_until = time.monotonic() + ACCOUNT_COOLDOWN
+            print(_("账号 {} 被风控 {} 次，休息 {} 秒").format(
+                account.name, throttled - account._throttled_seen, ACCOUNT_COOLDOWN
+            ))
+        account._throttled_seen = throttled
+
+    async def check_login(self, account: Account):
+        """ BV 下载失败时检查是不是账号登录失效了 """
+        loop = asyncio.get_running_loop()
+        try:
+            logined = await loop.run_in_executor(None, is_login, account.client)
+        except Exception as e:
+            print(_("账号 {} 登录状态检查失败：{}").format(account.name, e))
+            return
+        if not logined:
+            account.disabled = True
+            print(_("账号 {} 登录失效，已移出轮换").format(account.name))
+
+
+def account_limiter_key(cookies_file: Union[str, Path]) -> str:
+    """
+    多账号时每个账号的限速器 key（也用在共享状态的文件名 ratelimit-{key}.json 里）。
+    不同目录下的同名 cookies 文件是不同的账号，所以带上绝对路径的摘要，只用文件名会串到一起
+    """
+    resolved = str(Path(cookies_file).expanduser().resolve())
+    digest = hashlib.sha1(resolved.encode("utf-8")).hexdigest()[:8]
+    return f"{Path(cookies_file).stem}-{digest}"
+
+
+def build_account(
+    from_browser: Optional[str],
+    cookies_file: Optional[Union[str, Path]],
+    progress=None,
+    own_limiter: bool = False,
+) -> Optional[Account]:
+    """ own_limiter: 多账号时每个账号用自己的限速器，否则与 get / clean 共用进程的限速器 """
     d = DownloaderBilibili(
         hierarchy=True,
         sess_data=None,  # sess_data 将在后面装载 cookies 时装载 # type: ignore
         video_concurrency=config.video_concurrency,
         part_concurrency=config.part_concurrency,
         stream_retry=config.stream_retry,
+        progress=progress,
     )
 
     # load cookies
     if from_browser is not None:
         update_cookies_from_browser(d.client, from_browser)
+        name = from_browser
+        account_key = from_browser
     else:
-        update_cookies_from_file(d.client, config.cookies_file)
+        assert cookies_file is not None
+        update_cookies_from_file(d.client, cookies_file)
+        name = Path(cookies_file).stem
+        account_key = account_limiter_key(cookies_file)
+    # 所有 B 站 API 请求都经过按端点分类的限速器
+    limiter_key = account_key if own_limiter else ""
+    install_rate_limiter(d.client, limiter_key)
     client = Client(cookies=d.client.cookies, headers=d.client.headers)
-    logined = is_login(client)
-    if not logined:
-        return
-
-    def check_free_space():
-        if min_free_space_gb != 0:
-            if (
-                get_free_space(path=config.storage_home_dir) // 1024 // 1024 // 1024
-                <= min_free_space_gb
-            ):
-                return False  # not pass
-        return True  # pass
-
-    d.progress.start()
-    sem = asyncio.Semaphore(config.video_concurrency)
-    tasks: List[asyncio.Task] = []
-
-    def tasks_check():
-        failed_tasks = []
-        for task in tasks:
-            if task.done():
-                _task_exception = task.exception()
-                if isinstance(_task_exception, BaseException):
-                    import traceback
-                    traceback.print_exc()
-                    print(f"任务 {task} 出错，但其他任务将继续执行...")
-                    failed_tasks.append((task, _task_exception))
-                # print(f'任务 {task} 已完成')
-                tasks.remove(task)
-
-        if not check_free_space():
-            s = _("剩余空间不足 {} GiB").format(min_free_space_gb)
-            print(s)
-            for task in tasks:
-                task.cancel()
-            raise RuntimeError(s)
-
-        if failed_tasks:
-            print(f"完成所有任务，但有 {len(failed_tasks)} 个任务失败")
-            raise failed_tasks[0][1]
-
-    for index, bvid in enumerate(bvids_list):
-        if index < skip_to:
-            print(f"跳过 {bvid} ({index+1}/{len(bvids_list)})", end="\r")
-            continue
-        tasks_check()
-        if not skip_ia_check:
-            upper_part = human_readable_upper_part_map(string=bvid, backward=True)
-            remote_identifier = f"{BILIBILI_IDENTIFIER_PERFIX}-{bvid}_p1-{upper_part}"
-            if check_ia_item_exist(client, remote_identifier):
-                print(_("IA 上已存在 {}，跳过").format(remote_identifier))
-                continue
-
-        upper_part = human_readable_upper_part_map(string=bvid, backward=True)
-        videos_basepath: Path = (
-            config.storage_home_dir / "videos" / f"{bvid}-{upper_part}"
-        )
-        if os.path.exists(videos_basepath / "_all_downloaded.mark"):
-            print(_("{} 的所有分p都已下载过了").format(bvid))
-            continue
-
-        if len(tasks) >= config.video_concurrency:
-            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-            tasks_check()
-
-        print(f"=== {bvid} ({index+1}/{len(bvids_list)}) ===")
-
-        task = asyncio.create_task(
-            archive_bvid(d, bvid, logined=logined, semaphore=sem),
-            name=f"archive_bvid({bvid})",
-        )
-        tasks.append(task)
-
-    while len(tasks) > 0:
-        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-        tasks_check()
-
-    print("DONE")
+    install_rate_limiter(client, limiter_key)
+    if not is_login(client):
+        return None
+    return Account(name, d, client, limiter_key)
 
 
 def update_cookies_from_browser(client: AsyncClient, browser: str):
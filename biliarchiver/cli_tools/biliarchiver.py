@@ -6,6 +6,11 @@ from biliarchiver.cli_tools.down_command import down
 from biliarchiver.cli_tools.get_command import get
 from biliarchiver.cli_tools.conf_command import config
 from biliarchiver.cli_tools.clean_command import clean
+from biliarchiver.cli_tools.ia_index_command import ia_index
+from biliarchiver.cli_tools.danmaku_command import danmaku
+from biliarchiver.cli_tools.status_command import status
+from biliarchiver.cli_tools.trace_report_command import trace_report
+from biliarchiver.cli_tools.run_command import run
 from biliarchiver.version import BILI_ARCHIVER_VERSION
 
 
@@ -71,6 +76,11 @@ biliarchiver.add_command(down)
 biliarchiver.add_command(get)
 biliarchiver.add_command(config)
 biliarchiver.add_command(clean)
+biliarchiver.add_command(ia_index)
+biliarchiver.add_command(danmaku)
+biliarchiver.add_command(status)
+biliarchiver.add_command(trace_report)
+biliarchiver.add_command(run)
 
 
 @biliarchiver.command(help=click.style(_("配置账号信息"), fg="cyan"))
@@ -12,7 +12,11 @@ from biliarchiver.config import config
 from biliarchiver.cli_tools.bili_archive_bvids import check_ia_item_exist
 
 # from biliarchiver.config import BILIBILI_IDENTIFIER_PERFIX
+from biliarchiver.utils.danmaku import DANMAKU_PENDING_FILENAME
 from biliarchiver.utils.identifier import human_readable_upper_part_map
+from biliarchiver.utils.ratelimit import install_rate_limiter
+from biliarchiver.utils.replies import REPLIES_SCRATCH_FILENAME
+from biliarchiver.utils.state_db import BVState, PartState, get_state_db
 
 
 @click.command(help=click.style(_("清理并尝试修复未完成的任务"), fg="cyan"))
@@ -54,6 +58,12 @@ from biliarchiver.utils.identifier import human_readable_upper_part_map
     default=False,
     help=_("尝试重新上传之前被标记为垃圾视频的项"),
 )
+@click.option(
+    "--rebuild-state",
+    is_flag=True,
+    default=False,
+    help=_("从 videos 目录下的 .mark 文件重建状态库"),
+)
 def clean(
     try_upload,
     try_download,
@@ -64,12 +74,13 @@ def clean(
     min_free_space_gb,
     only_deleted,
     retry_spam,
+    rebuild_state,
 ):
     """清理命令主函数"""
     if all:
         try_upload = try_download = clean_locks = clean_uploaded = True
 
-    if not any([try_upload, try_download, clean_locks, clean_uploaded]):
+    if not any([try_upload, try_download, clean_locks, clean_uploaded, rebuild_state]):
         print(_("请指定至少一项清理操作，或使用 --all/-a 执行所有清理操作"))
         return
 
@@ -90,35 +101,27 @@ def clean(
         print(_("视频目录不存在: {}").format(videos_dir))
         return
 
+    state_db = get_state_db()
+    if rebuild_state:
+        print(_("正在从 {} 重建状态库...").format(videos_dir))
+        print(_("已导入 {} 个 BV 的状态").format(state_db.import_tree(videos_dir)))
+
     bvids_to_download = []
     videos_to_process = []  # 收集需要处理的视频信息
 
-    # 第一遍扫描，收集所有需要处理的视频
-    for video_dir in videos_dir.iterdir():
-        if not video_dir.is_dir():
-            continue
-
-        # 提取BVID
-        if "-" not in video_dir.name:
-            continue
-
-        bvid = video_dir.name.split("-")[0]
-
-        # 检查是否是有效的BVID
-        if not bvid.startswith("BV"):
-            continue
-
-        # 检查下载状态
-        if not (video_dir / "_all_downloaded.mark").exists():
-            if try_download:
-                print(_("发现未完成下载的视频: {}").format(bvid))
-                bvids_to_download.append(bvid)
+    # 第一遍，从状态库查出所有需要处理的视频（不再遍历整个 videos 目录）
+    if try_download:
+        for bvid in state_db.bvids(BVState.downloading):
+            print(_("发现未完成下载的视频: {}").format(bvid))
+            bvids_to_download.append(bvid)
+
+    # 已下载完成、且本地还有分P文件夹的视频（分P都已在上传后删除的，只剩 _all_downloaded.mark，跳过）
+    for bvid in state_db.bvids_with_local_parts():
+        video_dir = videos_dir / f"{bvid}-{human_readable_upper_part_map(string=bvid, backward=True)}"
+        if not video_dir.exists():
+            # 文件夹已被手动删除
+            state_db.forget_bv(bvid)
             continue
-        # 检查是否只有 _all_downloaded.mark 文件（说明下载有问题或内容为空）
-        video_dir_contents = list(video_dir.iterdir())
-        if len(video_dir_contents) == 1 and video_dir_contents[0].name == "_all_downloaded.mark":
-            continue
-        # 收集已下载完成的视频信息
         videos_to_process.append({"video_dir": video_dir, "bvid": bvid})
 
     # 批量并发检查B站视频状态
@@ -137,21 +140,23 @@ def clean(
 
         # 如果启用了清理已上传视频选项，检查所有分P是否已上传
         if clean_uploaded:
-            all_parts_uploaded = True
-            for part_dir in video_dir.iterdir():
-                if not part_dir.is_dir():
-                    continue
-                if not (part_dir / "_uploaded.mark").exists():
-                    all_parts_uploaded = False
-                    break
+            part_states = state_db.part_states(bvid)
+            # 没有分P记录时不能当作已全部上传（all([]) 为 True）
+            all_parts_uploaded = bool(part_states) and all(
+                part_state != PartState.downloaded for part_state in part_states.values()
+            )
 
             if all_parts_uploaded and video_dir.exists():
                 print(_("清理已上传的视频: {}").format(bvid))
                 shutil.rmtree(video_dir, ignore_errors=True)
+                state_db.forget_bv(bvid)
                 continue
 
-            # 只有当视频被删除时才检查IA
-            if not (video_dir / "_uploaded.mark").exists():
+            # 只有当视频被删除时才检查IA。
+            # 还有分P在等 biliarchiver danmaku 生成 ass 的不清理，否则 pb 弹幕会跟着删掉
+            if not (video_dir / "_uploaded.mark").exists() and not any(
+                video_dir.glob(f"*/{DANMAKU_PENDING_FILENAME}")
+            ):
                 video_deleted = bvid_status_map.get(bvid, False)
                 if video_deleted:
                     try:
@@ -172,6 +177,7 @@ def clean(
                                 ) as f:
                                     f.write(remote_identifier)
                                 shutil.rmtree(video_dir, ignore_errors=True)
+                                state_db.forget_bv(bvid)
                                 continue
                     except Exception as e:
                         print(_("检查 {} 在 IA 上的状态时出错: {}").format(bvid, e))
@@ -188,6 +194,15 @@ def clean(
             else:
                 process_finished_download(video_dir, bvid, collection, only_deleted, retry_spam=retry_spam)
 
+    if clean_uploaded:
+        clean_replies_scratch(videos_dir, set(state_db.bvids(BVState.downloading)))
+        # 分P目录删掉后，只剩 blob 仓库自己引用的封面、详情、评论也可以删了
+        from biliarchiver.utils.blobs import get_blob_store
+
+        freed = get_blob_store().gc()
+        if freed:
+            print(_("已清理不再被引用的 blob，释放 {} MiB").format(f"{freed / (1024 * 1024):.2f}"))
+
     if clean_uploaded or try_upload:
         free_space_after = get_free_space(config.storage_home_dir)
         space_freed = free_space_after - free_space_before
@@ -236,15 +251,36 @@ def clean_lock_files(config):
     )
 
 
+def clean_replies_scratch(videos_dir: Path, downloading_bvids: set):
+    """
+    清理 BV 目录下残留的全部评论抓取文件（抓完后本应已移进 blob 仓库）。
+    还在下载中的 BV 保留 .partial / .checkpoint.json，下次从断点继续
+    """
+    removed = 0
+    for path in videos_dir.glob(f"*/{REPLIES_SCRATCH_FILENAME}*"):
+        bvid = path.parent.name.split("-", 1)[0]
+        if path.name != REPLIES_SCRATCH_FILENAME and bvid in downloading_bvids:
+            continue
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        print(_("已清理 {} 个残留的评论抓取文件").format(removed))
+
+
 def process_finished_download(video_dir, bvid, collection, only_deleted, retry_spam=False):
     """处理下载完成的视频目录"""
-    if (video_dir / "_spam.mark").exists():
+    state_db = get_state_db()
+    if state_db.is_bv_spam(bvid):
         if retry_spam:
             print(_("{} 之前被标记为垃圾，开启了 --retry-spam 标志，尝试重新上传").format(bvid))
             try:
                 (video_dir / "_spam.mark").unlink()
             except:
                 pass
+            state_db.set_bv_spam(bvid, False)
         else:
             print(_("{} 被标记为垃圾内容，跳过。若要强制重试请使用 --retry-spam。").format(bvid))
             return
@@ -254,18 +290,8 @@ def process_finished_download(video_dir, bvid, collection, only_deleted, retry_s
         if not check_video_deleted(bvid):
             return
 
-    # 检查是否有分P需要上传
-    has_parts_to_upload = False
-    for part_dir in video_dir.iterdir():
-        if not part_dir.is_dir():
-            continue
-
-        # 检查该分P是否下载完成但未上传
-        if (part_dir / "_downloaded.mark").exists() and not (
-            part_dir / "_uploaded.mark"
-        ).exists():
-            has_parts_to_upload = True
-            break
+    # 检查是否有分P下载完成但未上传
+    has_parts_to_upload = PartState.downloaded in state_db.part_states(bvid).values()
 
     if has_parts_to_upload:
         print(_("尝试上传 {}").format(bvid))
@@ -285,6 +311,7 @@ def process_finished_download(video_dir, bvid, collection, only_deleted, retry_s
                 print(_("{} 被检测为真正垃圾内容，标记并跳过").format(bvid))
                 with open(video_dir / "_spam.mark", "w", encoding="utf-8") as f:
                     f.write(error_str)
+                state_db.set_bv_spam(bvid)
             else:
                 print(_("上传 {} 时出错: {}").format(bvid, e))
 
@@ -313,6 +340,7 @@ def download_unfinished_videos(config, bvids, min_free_space_gb):
         "min_free_space_gb": min_free_space_gb,
         "skip_to": 0,
         "disable_version_check": False,
+        "checkpoint": None,
     }
 
     try:
@@ -367,6 +395,7 @@ def batch_check_bilibili_status(bvids: list) -> dict:
         resources = ",".join(f"{aid}:2" for aid in batch_aids)
         batch_results = {}
         with httpx.Client(follow_redirects=True, timeout=15.0) as client:
+            install_rate_limiter(client)
             try:
                 response = client.get(
                     config.bilibili_api_base() + "/medialist/" + "gateway/base" + "/resource/" + "infos",
@@ -5,7 +5,17 @@ from biliarchiver.i18n import _
 @click.command(help=click.style(_("将传入参数写入配置文件"), fg="cyan"))
 @click.option("--video_concurrency", "-v", type=click.INT, default=None, help=_("视频下载并发数"))
 @click.option("--part_concurrency", "-p", type=click.INT, default=None, help=_("分P下载并发数"))
+@click.option("--page_concurrency", "-P", type=click.INT, default=None, help=_("单个 BV 内同时下载的分P数"))
+@click.option("--upload_concurrency", "-u", type=click.INT, default=None, help=_("同时上传的分P数"))
 @click.option("--stream_retry", "-r", type=click.INT, default=None, help=_("流下载重试次数"))
+@click.option("--danmaku_workers", "-d", type=click.INT, default=None, help=_("弹幕转 ass 的进程数，0 表示使用线程池"))
+@click.option("--rate_limit_shared", type=click.BOOL, default=None, help=_("在多个进程间共享 B 站 API 限速状态"))
+@click.option("--full_replies", type=click.BOOL, default=None, help=_("抓取全部评论（包括楼中楼）"))
+@click.option("--danmaku_defer", type=click.BOOL, default=None, help=_("下载时只保存 pb 弹幕，之后再用 danmaku 命令生成 ass"))
+@click.option("--cdn_min_speed", type=click.INT, default=None, help=_("单个连接低于多少 KiB/s 时切换到更快的 CDN 镜像，0 表示不切换"))
+@click.option("--coordinator_db", type=click.STRING, default=None, help=_("多进程/多机协调器数据库路径，空字符串表示不启用"))
+@click.option("--metrics_port", type=click.INT, default=None, help=_("以 Prometheus 格式导出指标的本地端口，0 表示不导出。只有一个进程能占用它，多个 down / up 同时运行时请用 --metrics-port 分别指定"))
+@click.option("--trace_file", type=click.STRING, default=None, help=_("各步骤耗时写入的 JSONL 文件，空字符串表示不记录"))
 @click.option("--storage_home_dir", "-s", type=click.STRING, default=None, help=_("存储目录"))
 @click.option("--ia_key_file", "-i", type=click.STRING, default=None, help=_("IA key文件"))
 @click.option("--cookies_file", "-c", type=click.STRING, default=None, help=_("cookies文件"))
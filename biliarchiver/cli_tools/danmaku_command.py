@@ -0,0 +1,58 @@
+import click
+from rich import print
+
+from biliarchiver.i18n import _
+
+
+@click.command(help=click.style(_("为推迟生成的弹幕生成 ass（配合 down --defer-danmaku）"), fg="cyan"))
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    default=None,
+    help=_("转换进程数（默认读取 config.json 的 danmaku_workers）"),
+)
+def danmaku(workers):
+    import asyncio
+
+    from biliarchiver.config import config
+    from biliarchiver.utils.danmaku import (
+        DanmakuConverter,
+        convert_pending_danmaku,
+        iter_danmaku_pending,
+    )
+
+    converter = DanmakuConverter(config.danmaku_workers if workers is None else workers)
+
+    async def main():
+        in_flight = set()
+        converted = 0
+        failed = 0
+
+        def on_done(pending_file, task: asyncio.Task):
+            nonlocal converted, failed
+            in_flight.discard(task)
+            if task.cancelled():
+                failed += 1
+            elif task.exception() is not None:
+                failed += 1
+                print(_("{} 转换失败：{}").format(pending_file.parent.name, task.exception()))
+            elif task.result():
+                converted += 1
+                print(_("{} 弹幕已生成").format(pending_file.parent.name))
+
+        for pending_file in iter_danmaku_pending(config.storage_home_dir / "videos"):
+            # 读 pb 很快，转换在进程池里排队；这里只限制同时在内存里的 pb 数量
+            while len(in_flight) >= max(1, converter.workers) * 2:
+                await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            task = asyncio.create_task(convert_pending_danmaku(pending_file, converter))
+            task.add_done_callback(lambda t, f=pending_file: on_done(f, t))
+            in_flight.add(task)
+        if in_flight:
+            await asyncio.wait(in_flight)
+        print(_("共生成 {} 个 ass 弹幕，失败 {} 个").format(converted, failed))
+
+    try:
+        asyncio.run(main())
+    finally:
+        converter.shutdown()
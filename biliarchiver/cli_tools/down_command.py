@@ -9,7 +9,7 @@ from biliarchiver.i18n import _
     "-i",
     type=click.STRING,
     required=True,
-    help=_("空白字符分隔的 bvids 列表（记得加引号），或文件路径"),
+    help=_("空白字符分隔的 bvids 列表（记得加引号），或文件路径（可以是 FIFO），或 - 表示从 stdin 读取"),
 )
 @click.option(
     "--skip-ia-check",
@@ -26,6 +26,12 @@ from biliarchiver.i18n import _
     default=None,
     help=_("从指定浏览器导入 cookies (否则导入 config.json 中的 cookies_file)"),
 )
+@click.option(
+    "--cookies",
+    type=click.Path(dir_okay=False),
+    multiple=True,
+    help=_("cookies 文件，可多次指定以多账号下载（默认读取 config.json 的 cookies_pool 或 cookies_file）"),
+)
 @click.option(
     "--min-free-space-gb",
     type=int,
@@ -36,6 +42,62 @@ from biliarchiver.i18n import _
 @click.option(
     "--skip-to", type=int, default=0, show_default=True, help=_("跳过文件开头 bvid 的个数")
 )
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help=_("断点文件路径。记录 bvids 文件处理到的位置，重启时直接从该处继续（仅对普通文件有效）"),
+)
+@click.option(
+    "--codecs",
+    type=str,
+    default=None,
+    help=_("视频编码优先级，逗号分隔，如 hev,avc（默认读取 config.json 的 selection.codecs，即 dvh,hev,avc）"),
+)
+@click.option(
+    "--max-height", type=int, default=None, help=_("最高分辨率（高度），如 1080")
+)
+@click.option(
+    "--max-mb-per-minute",
+    type=float,
+    default=None,
+    help=_("音视频合计每分钟最多多少 MiB，超过则降低画质"),
+)
+@click.option(
+    "--max-gb-per-bv",
+    type=float,
+    default=None,
+    help=_("单个 BV 的音视频合计最多多少 GiB，按分P时长分摊"),
+)
+@click.option(
+    "--defer-danmaku/--no-defer-danmaku",
+    default=None,
+    help=_("只保存 pb 弹幕，ass 之后用 biliarchiver danmaku 生成（默认读取 config.json 的 danmaku_defer）"),
+)
+@click.option(
+    "--full-replies/--no-full-replies",
+    default=None,
+    help=_("抓取全部评论（包括楼中楼）到 .replies.jsonl（默认读取 config.json 的 full_replies）"),
+)
+@click.option(
+    "--coordinator",
+    type=str,
+    default=None,
+    help=_("协调器数据库路径，多个 down 进程共用以分配 BV（默认读取 config.json 的 coordinator_db）。"
+           "跨机器共用时，所在的共享存储必须支持可靠的文件锁，很多 NFS/SMB 挂载不满足"),
+)
+@click.option(
+    "--metrics-port",
+    type=int,
+    default=None,
+    help=_("在 127.0.0.1 的该端口上以 Prometheus 格式导出本进程的指标（默认读取 config.json 的 metrics_port，0 为不导出）。同时运行多个进程时，每个进程要指定不同的端口"),
+)
+@click.option(
+    "--trace-file",
+    type=str,
+    default=None,
+    help=_("把各步骤的耗时写入该 JSONL 文件（每个进程实际写入 <文件名>.<pid>.jsonl），用 biliarchiver trace-report 汇总（默认读取 config.json 的 trace_file）"),
+)
 @click.option(
     "--disable-version-check",
     type=bool,
@@ -6,7 +6,6 @@ import time
 from pathlib import Path
 
 import click
-import requests
 from bilix.sites.bilibili import api
 from click_option_group import optgroup
 from httpx import AsyncClient
@@ -14,6 +13,7 @@ from rich import print
 
 from biliarchiver.config import config
 from biliarchiver.i18n import _, ngettext
+from biliarchiver.utils.ratelimit import get_rate_limiter, install_rate_limiter
 
 
 async def by_series(url_or_sid: str, truncate: int = int(1e10)) -> Path:
@@ -27,6 +27,7 @@ async def by_series(url_or_sid: str, truncate: int = int(1e10)) -> Path:
         else url_or_sid
     )  # type: ignore
     client = AsyncClient(**api.dft_client_settings)
+    install_rate_limiter(client)
     print(_("正在获取 {sid} 的视频列表……").format(sid=sid))
     col_name, up_name, bvids = await api.get_list_info(client, sid)
     filepath = f"bvids/by-sapce_fav_season/seriesid-{sid}-{int(time.time())}.txt"
@@ -59,6 +60,7 @@ async def by_season(url_or_sid: str, truncate: int = int(1e10)) -> Path:
         else url_or_sid
     )  # type: ignore
     client = AsyncClient(**api.dft_client_settings)
+    install_rate_limiter(client)
     print(_("正在获取 {sid} 的视频合集……").format(sid=sid))
     col_name, up_name, bvids = await api.get_collect_info(client, sid)
     filepath = f"bvids/by-sapce_fav_season/seasonid-{sid}-{int(time.time())}.txt"
@@ -84,7 +86,7 @@ def by_ranking(rid: int) -> Path:
     bilibili_ranking_api = config.bilibili_api_base() + "/x/web-interface/ranking/v2"
     bilibili_ranking_params = {"rid": rid, "type": "all"}
 
-    r = requests.get(bilibili_ranking_api, params=bilibili_ranking_params)
+    r = get_rate_limiter().requests_get(bilibili_ranking_api, params=bilibili_ranking_params)
     r.raise_for_status()
     ranking_json = json.loads(r.text)
     assert ranking_json["code"] == 0  # 0 为成功（HTTP 200 不能信）
@@ -129,14 +131,13 @@ async def by_up_videos(url_or_mid: str, truncate: int = int(1e10)) -> Path:
     assert mid.isdigit(), _("mid 应是数字字符串")
 
     client = AsyncClient(**api.dft_client_settings)
+    install_rate_limiter(client)
 
     if config.cookies_file.exists():
         from biliarchiver.cli_tools.bili_archive_bvids import update_cookies_from_file
         update_cookies_from_file(client, config.cookies_file)
-        delay = 3
     else:
         print(_("cookies 文件不存在: {}").format(config.cookies_file))
-        delay = 10
 
     ps = 30  # 每页视频数，最小 1，最大 50，默认 30
     order = "pubdate"  # 默认为pubdate 最新发布：pubdate 最多播放：click 最多收藏：stow
@@ -160,7 +161,6 @@ async def by_up_videos(url_or_mid: str, truncate: int = int(1e10)) -> Path:
     while pn < total_size / ps:
         pn += 1
         print(ngettext("获取第 {} 页", "获取第 {} 页", pn).format(pn))
-        await asyncio.sleep(delay)
         _x, _y, bv_ids_page = await api.get_up_video_info(client, mid, pn, ps, order, keyword)
         bv_ids += bv_ids_page
 
@@ -192,7 +192,7 @@ async def by_up_videos(url_or_mid: str, truncate: int = int(1e10)) -> Path:
 
 def by_popular_precious():
     API_URL = config.bilibili_api_base() + "/x/web-interface/popular/precious"
-    r = requests.get(API_URL)
+    r = get_rate_limiter().requests_get(API_URL)
     r.raise_for_status()
     popular_precious_json = json.loads(r.text)
     assert popular_precious_json["code"] == 0
@@ -216,7 +216,7 @@ def by_popular_precious():
 def by_popular_series_one(number: int):
     API_URL = config.bilibili_api_base() + "/x/web-interface/popular/series/one"
     params = {"number": number}
-    r = requests.get(API_URL, params=params)
+    r = get_rate_limiter().requests_get(API_URL, params=params)
     r.raise_for_status()
     popular_series_json = json.loads(r.text)
     assert popular_series_json["code"] == 0
@@ -245,7 +245,7 @@ def not_got_popular_series() -> list[int]:
         if filename.endswith(".txt"):
             # s{number}-{int(time.time())}.txt
             got_series.append(int(filename.split("-")[0][1:]))
-    r = requests.get(API_URL)
+    r = get_rate_limiter().requests_get(API_URL)
     r.raise_for_status()
     popular_series_json = json.loads(r.text)
     assert popular_series_json["code"] == 0
@@ -264,6 +264,7 @@ async def by_favlist(url_or_fid: str, truncate: int = int(1e10)) -> Path:
         fid = url_or_fid
 
     client = AsyncClient(**api.dft_client_settings)
+    install_rate_limiter(client)
     PAGE_SIZE = 20
     media_left = None
     total_size = None
@@ -289,7 +290,6 @@ async def by_favlist(url_or_fid: str, truncate: int = int(1e10)) -> Path:
             print("truncate at", truncate)
             break
 
-        await asyncio.sleep(2)
         page_num += 1
     await client.aclose()
     assert total_size is not None
@@ -337,7 +337,6 @@ async def main(
     if popular_series:
         if all_popular_series:
             for number in not_got_popular_series():
-                time.sleep(3)
                 by_popular_series_one(number)
         else:
             by_popular_series_one(popular_series_number)
@@ -0,0 +1,70 @@
+import click
+from rich import print
+
+from biliarchiver.i18n import _
+
+
+@click.command(
+    name="ia-index",
+    help=click.style(_("管理 IA item 存在性索引（down 用它跳过 IA 上已存在的视频）"), fg="cyan"),
+)
+@click.option(
+    "--from-file",
+    "-f",
+    "files",
+    type=click.Path(exists=True, dir_okay=False),
+    multiple=True,
+    help=_("从本地文件导入 identifier（每行一个，或 ia search 导出的 JSON lines），可多次指定"),
+)
+@click.option(
+    "--from-query",
+    "-q",
+    "queries",
+    type=str,
+    multiple=True,
+    help=_("导入 archive.org 搜索结果中的 identifier，如 'collection:bilibili_videos'，可多次指定"),
+)
+@click.option(
+    "--from-legacy-cache",
+    is_flag=True,
+    default=False,
+    help=_("导入旧版的 ia_item_exist_cache/*.mark"),
+)
+@click.option(
+    "--remove-legacy-cache",
+    is_flag=True,
+    default=False,
+    help=_("导入后删除 ia_item_exist_cache 目录"),
+)
+@click.option("--compact", is_flag=True, default=False, help=_("把追加日志合并进索引"))
+@click.option(
+    "--check", "identifiers", type=str, multiple=True, help=_("查询 identifier 是否在索引中")
+)
+def ia_index(files, queries, from_legacy_cache, remove_legacy_cache, compact, identifiers):
+    from biliarchiver.utils.ia_index import (
+        get_ia_item_index,
+        iter_identifiers_from_file,
+        iter_identifiers_from_search,
+    )
+
+    index = get_ia_item_index()
+
+    if from_legacy_cache or remove_legacy_cache:
+        count = index.import_legacy_cache(remove=remove_legacy_cache)
+        print(_("从旧版缓存导入了 {} 个 identifier").format(count))
+
+    for file in files:
+        count = index.bulk_add(iter_identifiers_from_file(file))
+        print(_("从 {} 导入了 {} 个 identifier").format(file, count))
+
+    for query in queries:
+        print(_("正在从 archive.org 导出 {} 的搜索结果……").format(query))
+        count = index.bulk_add(iter_identifiers_from_search(query))
+        print(_("从 {} 导入了 {} 个 identifier").format(query, count))
+
+    if compact:
+        count = index.compact()
+        print(_("索引共 {} 个 identifier").format(count))
+
+    for identifier in identifiers:
+        print(f"{identifier}: {identifier in index}")
@@ -0,0 +1,128 @@
+import click
+from rich.console import Console
+
+from biliarchiver.cli_tools.up_command import (
+    BILIBILI_VIDEOS_COLLECTION,
+    BILIBILI_VIDEOS_SUB_1_COLLECTION,
+    DEFAULT_COLLECTION,
+)
+from biliarchiver.i18n import _
+
+
+@click.command(
+    name="run",
+    help=click.style(_("下载并上传：每个分P下载完成后立即校验、上传（流水线）"), fg="cyan"),
+)
+@click.option(
+    "--bvids",
+    "-i",
+    type=click.STRING,
+    required=True,
+    help=_("空白字符分隔的 bvids 列表（记得加引号），或文件路径（可以是 FIFO），或 - 表示从 stdin 读取"),
+)
+@click.option(
+    "--skip-ia-check",
+    "-s",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help=_("不检查 IA 上是否已存在对应 BVID 的 item ，直接开始下载"),
+)
+@click.option(
+    "--from-browser",
+    "--fb",
+    type=str,
+    default=None,
+    help=_("从指定浏览器导入 cookies (否则导入 config.json 中的 cookies_file)"),
+)
+@click.option(
+    "--cookies",
+    type=click.Path(dir_okay=False),
+    multiple=True,
+    help=_("cookies 文件，可多次指定以多账号下载（默认读取 config.json 的 cookies_pool 或 cookies_file）"),
+)
+@click.option(
+    "--min-free-space-gb",
+    type=int,
+    default=10,
+    help=_("最小剩余空间 (GB)，用超退出"),
+    show_default=True,
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help=_("断点文件路径。记录 bvids 文件处理到的位置，重启时直接从该处继续（仅对普通文件有效）"),
+)
+@click.option(
+    "--collection",
+    "-c",
+    default=DEFAULT_COLLECTION,
+    type=click.Choice(
+        [
+            DEFAULT_COLLECTION,
+            BILIBILI_VIDEOS_COLLECTION,
+            BILIBILI_VIDEOS_SUB_1_COLLECTION,
+        ]
+    ),
+    help=_("欲上传至的 collection. (非默认值仅限 collection 管理员使用)")
+    + f" [default: {DEFAULT_COLLECTION}]",
+)
+@click.option(
+    "--delete-after-upload",
+    "-d",
+    is_flag=True,
+    default=False,
+    help=_("BV 的所有分P都上传后删除视频文件"),
+)
+@click.option(
+    "--verify-workers",
+    type=int,
+    default=2,
+    show_default=True,
+    help=_("校验阶段的 worker 数"),
+)
+@click.option(
+    "--upload-workers",
+    type=int,
+    default=None,
+    help=_("上传阶段的 worker 数（默认读取 config.json 的 upload_concurrency）"),
+)
+@click.option(
+    "--queue-size",
+    type=int,
+    default=None,
+    help=_("各阶段之间的队列长度，满了下载会等上传（默认为上传 worker 数的两倍）"),
+)
+@click.option(
+    "--metrics-port",
+    type=int,
+    default=None,
+    help=_("在 127.0.0.1 的该端口上以 Prometheus 格式导出本进程的指标（默认读取 config.json 的 metrics_port，0 为不导出）。同时运行多个进程时，每个进程要指定不同的端口"),
+)
+@click.option(
+    "--trace-file",
+    type=str,
+    default=None,
+    help=_("把各步骤的耗时写入该 JSONL 文件（每个进程实际写入 <文件名>.<pid>.jsonl），用 biliarchiver trace-report 汇总（默认读取 config.json 的 trace_file）"),
+)
+@click.option(
+    "--disable-version-check",
+    type=bool,
+    is_flag=True,
+    default=False,
+    help=_("禁用 biliarchiver 的 pypi 版本检查")
+)
+def run(**kwargs):
+    from biliarchiver.pipeline import run_pipeline
+
+    try:
+        import asyncio
+
+        asyncio.run(run_pipeline(skip_to=0, **kwargs))
+    except KeyboardInterrupt:
+        print("KeyboardInterrupt")
+    finally:
+        # 显示终端光标
+        console = Console()
+        console.show_cursor()
@@ -0,0 +1,75 @@
+import click
+from rich import print
+
+from biliarchiver.i18n import _
+
+
+@click.command(help=click.style(_("查看协调器中各 worker 的进度与集群吞吐"), fg="cyan"))
+@click.option(
+    "--coordinator",
+    type=str,
+    default=None,
+    help=_("协调器数据库路径（默认读取 config.json 的 coordinator_db）"),
+)
+@click.option(
+    "--window", "-w", type=int, default=600, show_default=True, help=_("统计吞吐的时间窗口（秒）")
+)
+@click.option("--leases", "-l", is_flag=True, default=False, help=_("列出所有租约"))
+@click.option(
+    "--reclaim", is_flag=True, default=False, help=_("删除已过期的租约和失联的 worker")
+)
+def status(coordinator, window, leases, reclaim):
+    import time
+
+    from biliarchiver.utils.coordinator import Coordinator
+
+    if not coordinator:
+        from biliarchiver.config import config
+
+        coordinator = config.coordinator_db
+    if not coordinator:
+        print(_("未设置协调器（--coordinator 或 config.json 的 coordinator_db）"))
+        return
+
+    # 只读取，不注册为 worker
+    lease_coordinator = Coordinator(coordinator, stage="status")
+    try:
+        if reclaim:
+            print(_("回收了 {} 个过期租约").format(lease_coordinator.reclaim()))
+        stats = lease_coordinator.stats(window)
+        if not stats:
+            print(_("协调器中还没有任何记录"))
+        for stage in stats:
+            print(
+                _(
+                    "{}: worker {} 个，处理中 {} 个，过期 {} 个；最近 {} 秒完成 {} 个、失败 {} 个，"
+                    "{:.1f} 个/小时，{:.2f} MiB/s"
+                ).format(
+                    stage.stage,
+                    stage.workers,
+                    stage.leased,
+                    stage.expired,
+                    window,
+                    stage.finished,
+                    stage.failed,
+                    stage.bvs_per_hour,
+                    stage.bytes_per_second / (1024 * 1024),
+                )
+            )
+        if leases:
+            now = time.time()
+            for bvid, stage, owner, acquired_at, expires_at, attempts in lease_coordinator.leases():
+                print(
+                    _("{} ({}) {}，已运行 {:.0f} 秒，{}，第 {} 次尝试").format(
+                        bvid,
+                        stage,
+                        owner,
+                        now - acquired_at,
+                        _("{:.0f} 秒后过期").format(expires_at - now)
+                        if expires_at > now
+                        else _("已过期"),
+                        attempts,
+                    )
+                )
+    finally:
+        lease_coordinator.close()
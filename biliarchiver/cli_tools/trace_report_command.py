@@ -0,0 +1,69 @@
+import click
+from rich import print
+
+from biliarchiver.i18n import _
+
+
+@click.command(
+    name="trace-report",
+    help=click.style(_("汇总 --trace-file 记录的各步骤耗时 (p50/p95)"), fg="cyan"),
+)
+@click.option(
+    "--trace-file",
+    type=str,
+    default=None,
+    help=_("JSONL 文件路径，会把各进程的文件和轮转出的旧文件一起读取（默认读取 config.json 的 trace_file）"),
+)
+@click.option("--bvid", type=str, default=None, help=_("只看某个 BV"))
+@click.option(
+    "--since-hours", type=float, default=None, help=_("只看最近多少小时内开始的 span")
+)
+def trace_report(trace_file, bvid, since_hours):
+    import time
+
+    from rich.table import Table
+
+    from biliarchiver.utils.tracing import iter_spans, summarize, trace_files
+
+    if not trace_file:
+        from biliarchiver.config import config
+
+        trace_file = config.trace_file
+    if not trace_file:
+        print(_("未设置 trace 文件（--trace-file 或 config.json 的 trace_file）"))
+        return
+    paths = trace_files(trace_file)
+    if not paths:
+        print(_("{} 不存在").format(trace_file))
+        return
+
+    since = time.time() - since_hours * 3600 if since_hours is not None else None
+
+    def selected(spans):
+        for s in spans:
+            if since is not None and s["ts"] < since:
+                continue
+            if bvid is not None and (s.get("attrs") or {}).get("bvid") != bvid:
+                continue
+            yield s
+
+    summary = summarize(selected(iter_spans(paths)))
+    if not summary:
+        print(_("没有符合条件的 span"))
+        return
+
+    table = Table(title=_("各步骤耗时（秒），按总耗时排序"))
+    for column in ("stage", "count", "errors", "p50", "p95", "max", "total", "MiB"):
+        table.add_column(column, justify="left" if column == "stage" else "right")
+    for name, row in sorted(summary.items(), key=lambda item: -item[1]["total"]):
+        table.add_row(
+            name,
+            str(row["count"]),
+            str(row["errors"]),
+            f"{row['p50']:.2f}",
+            f"{row['p95']:.2f}",
+            f"{row['max']:.2f}",
+            f"{row['total']:.1f}",
+            f"{row['bytes'] / (1024 * 1024):.1f}" if row["bytes"] else "",
+        )
+    print(table)
@@ -1,6 +1,5 @@
 from io import TextIOWrapper
 import click
-import os
 
 from biliarchiver.cli_tools.utils import read_bvids
 from biliarchiver.i18n import _
@@ -58,31 +57,93 @@ BILIBILI_VIDEOS_SUB_1_COLLECTION = "bilibili_videos_sub_1"
     default=False,
     help=_("上传后删除视频文件"),
 )
+@click.option(
+    "--coordinator",
+    type=str,
+    default=None,
+    help=_("协调器数据库路径，多个 up 进程共用以分配 BV（默认读取 config.json 的 coordinator_db）"),
+)
+@click.option(
+    "--metrics-port",
+    type=int,
+    default=None,
+    help=_("在 127.0.0.1 的该端口上以 Prometheus 格式导出本进程的指标（默认读取 config.json 的 metrics_port，0 为不导出）。同时运行多个进程时，每个进程要指定不同的端口"),
+)
+@click.option(
+    "--trace-file",
+    type=str,
+    default=None,
+    help=_("把各步骤的耗时写入该 JSONL 文件（每个进程实际写入 <文件名>.<pid>.jsonl），用 biliarchiver trace-report 汇总（默认读取 config.json 的 trace_file）"),
+)
 def up(
     bvids: TextIOWrapper,
     by_storage_home_dir: bool,
     update_existing: bool,
     collection: str,
     delete_after_upload: bool,
+    coordinator: str,
+    metrics_port: int,
+    trace_file: str,
 ):
     from biliarchiver._biliarchiver_upload_bvid import upload_bvid
     from biliarchiver.config import config
+    from biliarchiver.utils.coordinator import LeaseStatus, get_coordinator
+    from biliarchiver.utils.metrics import start_metrics_server
+    from biliarchiver.utils.tracing import set_trace_file
+    from biliarchiver.utils.identifier import human_readable_upper_part_map
+    from biliarchiver.utils.storage import get_dir_size
+
+    start_metrics_server(metrics_port)
+    set_trace_file(trace_file)
 
     ids = []
 
     if by_storage_home_dir:
-        for bvid_with_upper_part in os.listdir(config.storage_home_dir / "videos"):
-            bvid = bvid_with_upper_part
-            if "-" in bvid_with_upper_part:
-                bvid = bvid_with_upper_part.split("-")[0]
-            ids.append(bvid)
+        from biliarchiver.utils.state_db import BVState, get_state_db
+
+        state_db = get_state_db()
+        if update_existing:
+            ids = state_db.bvids(BVState.downloaded)
+        else:
+            # 只挑出已下载完成、还有分P没上传的 BV
+            ids = state_db.bvids_pending_upload()
     elif bvids:
         ids = read_bvids(bvids)
 
-    for id in ids:
-        upload_bvid(
-            id,
-            update_existing=update_existing,
-            collection=collection,
-            delete_after_upload=delete_after_upload,
-        )
+    lease_coordinator = get_coordinator("up", coordinator)
+    if lease_coordinator is not None:
+        lease_coordinator.start()
+        print(_("已连接协调器 {}（worker {}）").format(lease_coordinator.db_path, lease_coordinator.owner))
+
+    try:
+        for id in ids:
+            if (
+                lease_coordinator is not None
+                and lease_coordinator.acquire(id) is not LeaseStatus.acquired
+            ):
+                print(_("{} 已由其他 worker 处理，跳过").format(id))
+                continue
+            nbytes = 0
+            if lease_coordinator is not None:
+                # 上传后可能被删除，先统计大小
+                nbytes = get_dir_size(
+                    config.storage_home_dir
+                    / "videos"
+                    / f"{id}-{human_readable_upper_part_map(string=id, backward=True)}"
+                )
+            ok = False
+            try:
+                upload_bvid(
+                    id,
+                    update_existing=update_existing,
+                    collection=collection,
+                    delete_after_upload=delete_after_upload,
+                )
+                ok = True
+            finally:
+                if lease_coordinator is not None:
+                    # 是否已上传由 state_db / IA 判断，租约只防止多个进程同时上传同一个 BV
+                    lease_coordinator.release(id, ok, nbytes, done=False)
+    finally:
+        if lease_coordinator is not None:
+            lease_coordinator.close()
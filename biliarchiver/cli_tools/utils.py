@@ -1,5 +1,11 @@
+import asyncio
+import json
+import os
+import stat
+import sys
+import threading
 from pathlib import Path
-from typing import List, Union
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
 from biliarchiver.utils.identifier import is_bvid
 from biliarchiver.i18n import _
 
@@ -30,3 +36,204 @@ def read_bvids_from_txt(txt_path: Union[Path,str]) -> List[str]:
     with open(txt_path, "r", encoding="utf-8") as f:
         bvids = [line.strip() for line in f if line.strip().startswith("BV")]
     return bvids
+
+
+class BVidEntry(NamedTuple):
+    bvid: str
+    offset: int
+    """ 该 bvid 所在行的起始字节偏移。从这里重新读，不会漏掉它 """
+    end_offset: int
+    """ 该 bvid 所在行的结束字节偏移 """
+
+
+def _is_file_path(file: Path) -> bool:
+    try:
+        return file.exists() and not file.is_dir()
+    except OSError:  # 很长的 bvids 列表会被当成路径，ENAMETOOLONG
+        return False
+
+
+def _is_seekable_file(file: Path) -> bool:
+    try:
+        return stat.S_ISREG(os.stat(file).st_mode)
+    except OSError:
+        return False
+
+
+def iter_bvids(bvids: str, start_offset: int = 0) -> Iterator[BVidEntry]:
+    """
+    惰性读取 bvids，边读边校验，内存占用与列表长度无关。
+
+    bvids 可以是：
+        - "-"：从 stdin 读取
+        - 文件路径（普通文件或 FIFO）
+        - 空白字符分隔的 bvids 列表
+    start_offset：仅对普通文件有效，从该字节偏移处开始读（用于断点续跑）
+    """
+    if bvids == "-":
+        yield from _iter_bvids_from_binary(sys.stdin.buffer, 0)
+        return
+
+    file = Path(bvids)
+    if _is_file_path(file):
+        with open(file, "rb") as f:
+            if start_offset and _is_seekable_file(file):
+                f.seek(start_offset)
+            else:
+                start_offset = 0
+            yield from _iter_bvids_from_binary(f, start_offset)
+        return
+
+    for bvid in bvids.split():
+        if not is_bvid(bvid):
+            print(_("bvid {} 不合法").format(bvid) + _("，跳过"))
+            continue
+        yield BVidEntry(bvid, 0, 0)
+
+
+BVIDS_READ_AHEAD = 1024
+""" 从 stdin / FIFO 读 bvids 时，读线程最多领先消费者多少条 """
+
+
+def bvids_may_block(bvids: str) -> bool:
+    """ stdin 和 FIFO 读的时候会一直阻塞到有新行，不能在事件循环里直接读 """
+    if bvids == "-":
+        return True
+    file = Path(bvids)
+    return _is_file_path(file) and not _is_seekable_file(file)
+
+
+async def aiter_bvids(
+    entries: Iterable[BVidEntry], may_block: bool, read_ahead: int = BVIDS_READ_AHEAD
+) -> AsyncIterator[BVidEntry]:
+    """
+    在异步代码里消费 iter_bvids 的结果。
+    may_block（见 bvids_may_block）时由一个守护线程去读，事件循环不会被 stdin / FIFO 卡住；
+    程序退出时也不用等这个线程读完。普通文件和命令行列表直接读。
+    """
+    if not may_block:
+        for entry in entries:
+            yield entry
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[object]" = asyncio.Queue(maxsize=max(1, read_ahead))
+    done = object()
+    stopped = threading.Event()
+
+    def put(item):
+        # 队列满时阻塞读线程，形成背压
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def reader():
+        try:
+            for entry in entries:
+                if stopped.is_set():
+                    return
+                put(entry)
+            put(done)
+        except RuntimeError:  # 事件循环已关闭
+            pass
+        except BaseException as e:
+            try:
+                put(e)
+            except RuntimeError:
+                pass
+
+    threading.Thread(target=reader, name="read_bvids", daemon=True).start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item  # type: ignore[misc]
+    finally:
+        stopped.set()
+        # 腾出队列，让可能卡在 put 上的读线程看到 stopped 后退出
+        while not queue.empty():
+            queue.get_nowait()
+
+
+def _iter_bvids_from_binary(f, offset: int) -> Iterator[BVidEntry]:
+    for raw_line in f:
+        line_start = offset
+        offset += len(raw_line)
+        for token in raw_line.split():
+            bvid = token.decode("utf-8", errors="replace")
+            if not is_bvid(bvid):
+                print(_("bvid {} 不合法").format(bvid) + _("，跳过"))
+                continue
+            yield BVidEntry(bvid, line_start, offset)
+
+
+class BVidsCheckpoint:
+    """
+    记录 bvids 文件读到了哪里。
+
+    任务是并发、乱序完成的，所以只记录“最早的未完成 bvid 所在行”的偏移：
+    重启时从这里 seek，之前的行都已完成，之后已完成的 bvid 会被状态库快速跳过。
+    失败的 bvid 不会被标记为完成，重启后会重试。
+    由其他 worker 处理（见 utils/coordinator.py）而跳过的 bvid 用 skipped 记录，断点同样不会越过它。
+    """
+
+    def __init__(self, checkpoint_file: Union[Path, str], bvids: str):
+        self.checkpoint_file = Path(checkpoint_file)
+        self.source = os.path.abspath(bvids) if _is_file_path(Path(bvids)) else None
+        self._pending: Dict[int, BVidEntry] = {}
+        """ 已派发但未完成的条目，key 为派发序号 """
+        self._next_id = 0
+        self._last_end_offset: Optional[int] = None
+        self._skipped_offset: Optional[int] = None
+        """ skipped 的条目里最小的偏移。只记一个数，跳过再多也不占内存 """
+
+    def load(self) -> int:
+        """ 返回上次保存的偏移（来源文件不同则为 0） """
+        if self.source is None:
+            return 0
+        try:
+            with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+        if data.get("source") != self.source:
+            print(_("断点文件 {} 不属于 {}，从头开始").format(self.checkpoint_file, self.source))
+            return 0
+        return int(data.get("offset", 0))
+
+    def dispatched(self, entry: BVidEntry) -> int:
+        entry_id = self._next_id
+        self._next_id += 1
+        self._pending[entry_id] = entry
+        return entry_id
+
+    def finished(self, entry_id: int):
+        entry = self._pending.pop(entry_id)
+        if self._last_end_offset is None or entry.end_offset > self._last_end_offset:
+            self._last_end_offset = entry.end_offset
+        self.save()
+
+    def skipped(self, entry_id: int):
+        """ 这次不处理、但也还没完成的条目（如其他 worker 正在处理，可能失败） """
+        entry = self._pending.pop(entry_id)
+        if self._skipped_offset is None or entry.offset < self._skipped_offset:
+            self._skipped_offset = entry.offset
+        self.save()
+
+    def offset(self) -> int:
+        if self._pending:
+            offset = min(entry.offset for entry in self._pending.values())
+        else:
+            offset = self._last_end_offset or 0
+        if self._skipped_offset is not None:
+            offset = min(offset, self._skipped_offset)
+        return offset
+
+    def save(self):
+        if self.source is None:
+            return
+        tmp = self.checkpoint_file.with_name(self.checkpoint_file.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"source": self.source, "offset": self.offset()}, f)
+        os.replace(tmp, self.checkpoint_file)
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 import os
 import json
 from pathlib import Path
@@ -22,11 +23,36 @@ class singleton(type):
 class _Config(metaclass=singleton):
     video_concurrency: int = 3
     part_concurrency: int = 10
+    page_concurrency: int = 3
+    upload_concurrency: int = 3
+    """ 同时上传的分P（IA item）数，也是整个进程同时进行的 item.upload 数 """
     stream_retry: int = 20
+    danmaku_workers: int = 2
+    """ 弹幕转 ass 的进程数，0 表示使用线程池 """
+    danmaku_defer: bool = False
+    """ 下载时只保存 pb 弹幕，ass 之后用 biliarchiver danmaku 生成 """
+    full_replies: bool = False
+    """ 抓取全部评论（包括楼中楼）到 .replies.jsonl """
     storage_home_dir: Path = Path("bilibili_archive_dir/").expanduser()
     ia_key_file: Path = Path("~/.bili_ia_keys.txt").expanduser()
     cookies_file: Path = Path("~/.cookies.txt").expanduser()
+    cookies_pool: Optional[list] = None
+    """ 多账号下载时的 cookies 文件列表，设置后 down 不再使用 cookies_file """
     bilibili_api_proxy: str = ""
+    rate_limits: Optional[dict] = None
+    """ B 站 API 各端点类别的初始速率（请求/秒），见 biliarchiver.utils.ratelimit.DEFAULT_RATES """
+    rate_limit_shared: bool = False
+    """ 是否通过 storage_home_dir/ratelimit.json 在多个进程间共享限速状态 """
+    selection: Optional[dict] = None
+    """ dash 视频流选择策略，见 biliarchiver.utils.selection.SelectionPolicy """
+    cdn_min_speed: int = 256
+    """ 单个连接低于多少 KiB/s 且有快得多的 CDN 镜像时中途切换，0 表示不切换 """
+    coordinator_db: str = ""
+    """ 多个 down / up 进程共用的协调器数据库路径（放在共享存储上），为空则不启用 """
+    metrics_port: int = 0
+    """ 在 127.0.0.1 的这个端口上以 Prometheus 格式导出指标，0 表示不导出 """
+    trace_file: str = ""
+    """ 各步骤耗时（span）写入的 JSONL 文件，为空则不记录 """
 
     def __init__(self):
         self.is_right_pwd()
@@ -39,12 +65,25 @@ class _Config(metaclass=singleton):
 
         self.video_concurrency: int = config_file["video_concurrency"]
         self.part_concurrency: int = config_file["part_concurrency"]
+        self.page_concurrency: int = config_file.get("page_concurrency", 3)
+        self.upload_concurrency: int = config_file.get("upload_concurrency", 3)
         self.stream_retry: int = config_file["stream_retry"]
+        self.danmaku_workers: int = config_file.get("danmaku_workers", 2)
+        self.danmaku_defer: bool = config_file.get("danmaku_defer", False)
+        self.full_replies: bool = config_file.get("full_replies", False)
 
         self.storage_home_dir: Path = Path(config_file["storage_home_dir"]).expanduser()
         self.ia_key_file: Path = Path(config_file["ia_key_file"]).expanduser()
         self.cookies_file: Path = Path(config_file["cookies_file"]).expanduser()
+        self.cookies_pool: Optional[list] = config_file.get("cookies_pool", None)
         self.bilibili_api_proxy: str = config_file.get("bilibili_api_proxy", "")
+        self.rate_limits: Optional[dict] = config_file.get("rate_limits", None)
+        self.rate_limit_shared: bool = config_file.get("rate_limit_shared", False)
+        self.selection: Optional[dict] = config_file.get("selection", None)
+        self.cdn_min_speed: int = config_file.get("cdn_min_speed", 256)
+        self.coordinator_db: str = config_file.get("coordinator_db", "")
+        self.metrics_port: int = config_file.get("metrics_port", 0)
+        self.trace_file: str = config_file.get("trace_file", "")
 
     def bilibili_api_base(self) -> str:
         if self.bilibili_api_proxy:
@@ -57,11 +96,24 @@ class _Config(metaclass=singleton):
                 {
                     "video_concurrency": self.video_concurrency,
                     "part_concurrency": self.part_concurrency,
+                    "page_concurrency": self.page_concurrency,
+                    "upload_concurrency": self.upload_concurrency,
                     "stream_retry": self.stream_retry,
+                    "danmaku_workers": self.danmaku_workers,
+                    "danmaku_defer": self.danmaku_defer,
+                    "full_replies": self.full_replies,
                     "storage_home_dir": str(self.storage_home_dir),
                     "ia_key_file": str(self.ia_key_file),
                     "cookies_file": str(self.cookies_file),
+                    "cookies_pool": self.cookies_pool or [],
                     "bilibili_api_proxy": self.bilibili_api_proxy,
+                    "rate_limits": self.rate_limits or {},
+                    "rate_limit_shared": self.rate_limit_shared,
+                    "selection": self.selection or {},
+                    "cdn_min_speed": self.cdn_min_speed,
+                    "coordinator_db": self.coordinator_db,
+                    "metrics_port": self.metrics_port,
+                    "trace_file": self.trace_file,
                 },
                 f,
                 ensure_ascii=False,
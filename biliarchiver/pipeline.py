@@ -0,0 +1,339 @@
+import asyncio
+import contextvars
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from rich import print
+
+from biliarchiver._biliarchiver_upload_bvid import _upload_part, delete_uploaded_parts
+from biliarchiver.config import BILIBILI_IDENTIFIER_PERFIX, config
+from biliarchiver.i18n import _
+from biliarchiver.utils import metrics
+from biliarchiver.utils.dirLock import AlreadyRunningError, UploadLock
+from biliarchiver.utils.ia_session import get_ia_session
+from biliarchiver.utils.identifier import human_readable_upper_part_map
+from biliarchiver.utils.manifest import verify_part
+from biliarchiver.utils.tracing import span
+
+
+@dataclass
+class PipelinePart:
+    bvid: str
+    pid: int
+    video_basepath: Path
+    downloaded_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def local_identifier(self) -> str:
+        return self.video_basepath.name
+
+
+@dataclass
+class _PipelineBV:
+    bvid: str
+    videos_basepath: Path
+    parts: Dict[str, Optional[bool]] = field(default_factory=dict)
+    """ local_identifier -> None（处理中）/ 是否上传成功 """
+    download_done: bool = False
+    all_downloaded: bool = False
+    lock: Any = None
+    """ 第一个分P开始上传时拿到的 UploadLock，finalize 时释放 """
+    lock_failed: bool = False
+    finalized: bool = False
+
+    def outstanding(self) -> int:
+        return sum(1 for ok in self.parts.values() if ok is None)
+
+
+class UploadPipeline:
+    """
+    biliarchiver run 中下载之后的几个阶段：verify → upload → finalize。
+
+    下载阶段（_down：resolve / metadata / media / merge，沿用 video_concurrency、page_concurrency 等配置）
+    每写好一个分P的 _downloaded.mark 就把它放进 verify 队列，不用等整个 BV 下完、也不用再跑一次 up。
+    各阶段之间是有界队列，各有自己的 worker 数；上传跟不上时队列会满，下载随之放慢，本地堆积的分P数有上限。
+
+    - verify: 检查分P的文件，补算摘要（线程池）
+    - upload: _upload_part，同时占用全局上传名额（见 get_upload_slots）
+    - finalize: BV 的下载结束且所有分P都处理完后，按需删除本地文件、释放上传锁
+    """
+
+    def __init__(
+        self,
+        *,
+        collection: str,
+        update_existing: bool = False,
+        delete_after_upload: bool = False,
+        verify_workers: int = 2,
+        upload_workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+    ):
+        self.collection = collection
+        self.update_existing = update_existing
+        self.delete_after_upload = delete_after_upload
+        self.verify_workers = max(1, verify_workers)
+        self.upload_workers = max(1, upload_workers or config.upload_concurrency)
+        queue_size = max(1, queue_size or self.upload_workers * 2)
+        self.verify_queue: "asyncio.Queue[Optional[PipelinePart]]" = asyncio.Queue(maxsize=queue_size)
+        self.upload_queue: "asyncio.Queue[Optional[PipelinePart]]" = asyncio.Queue(maxsize=queue_size)
+        self.finalize_queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        metrics.PIPELINE_QUEUE_DEPTH.labels(stage="verify").set_function(self.verify_queue.qsize)
+        metrics.PIPELINE_QUEUE_DEPTH.labels(stage="upload").set_function(self.upload_queue.qsize)
+        metrics.PIPELINE_QUEUE_DEPTH.labels(stage="finalize").set_function(self.finalize_queue.qsize)
+
+        self._bvs: Dict[str, _PipelineBV] = {}
+        self._failed: List[str] = []
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.verify_workers + self.upload_workers + 1,
+            thread_name_prefix="pipeline",
+        )
+        self._ia = get_ia_session()
+        self._tasks: Dict[str, List[asyncio.Task]] = {}
+
+    def start(self):
+        self._tasks = {
+            "verify": [
+                asyncio.create_task(self._verify_worker(), name=f"pipeline_verify({i})")
+                for i in range(self.verify_workers)
+            ],
+            "upload": [
+                asyncio.create_task(self._upload_worker(), name=f"pipeline_upload({i})")
+                for i in range(self.upload_workers)
+            ],
+            "finalize": [asyncio.create_task(self._finalize_worker(), name="pipeline_finalize")],
+        }
+
+    def _bv(self, bvid: str) -> _PipelineBV:
+        if bvid not in self._bvs:
+            upper_part = human_readable_upper_part_map(string=bvid, backward=True)
+            self._bvs[bvid] = _PipelineBV(
+                bvid, config.storage_home_dir / "videos" / f"{bvid}-{upper_part}"
+            )
+        return self._bvs[bvid]
+
+    async def _run_in_executor(self, func, *args):
+        # 复制当前 contextvars，线程里的 span 挂在当前 span 下面
+        ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, ctx.run, func, *args
+        )
+
+    # ---- 下载阶段的回调（见 _down 的 on_page_downloaded / on_bv_done） ----
+
+    async def page_downloaded(self, bvid: str, pid: int, video_basepath: Path):
+        bv = self._bv(bvid)
+        if video_basepath.name in bv.parts:
+            return
+        bv.parts[video_basepath.name] = None
+        await self.verify_queue.put(PipelinePart(bvid, pid, video_basepath))
+
+    async def bv_done(self, bvid: str, all_downloaded: bool):
+        bv = self._bv(bvid)
+        # 之前已下载完（或上次 run 中断）的分P不会经过 page_downloaded，在这里补上
+        if bv.videos_basepath.is_dir():
+            for video_basepath in sorted(bv.videos_basepath.iterdir()):
+                if not video_basepath.name.startswith(f"{BILIBILI_IDENTIFIER_PERFIX}-"):
+                    continue
+                if not (video_basepath / "_downloaded.mark").exists():
+                    continue
+                pid = video_basepath.name.rsplit("_p", 1)[-1]
+                if pid.isdigit():
+                    await self.page_downloaded(bvid, int(pid), video_basepath)
+        bv.download_done = True
+        bv.all_downloaded = all_downloaded
+        self._maybe_finalize(bv)
+
+    # ---- 各阶段 ----
+
+    def _part_finished(self, part: PipelinePart, ok: bool):
+        bv = self._bv(part.bvid)
+        bv.parts[part.local_identifier] = ok
+        metrics.PIPELINE_RESIDENCY_SECONDS.observe(time.monotonic() - part.downloaded_at)
+        self._maybe_finalize(bv)
+
+    def _maybe_finalize(self, bv: _PipelineBV):
+        if bv.download_done and not bv.finalized and bv.outstanding() == 0:
+            bv.finalized = True
+            self.finalize_queue.put_nowait(bv.bvid)
+
+    async def _verify_worker(self):
+        while True:
+            part = await self.verify_queue.get()
+            try:
+                if part is None:
+                    return
+                with span("run.verify", bvid=part.bvid, pid=part.pid):
+                    problem = await self._run_in_executor(verify_part, part.video_basepath)
+                if problem is not None:
+                    print(_("{} 校验失败，不上传：{}").format(part.local_identifier, problem))
+                    self._part_finished(part, False)
+                    continue
+                await self.upload_queue.put(part)
+            except Exception as e:
+                traceback.print_exception(e)
+                self._part_finished(part, False)
+            finally:
+                self.verify_queue.task_done()
+
+    def _acquire_lock(self, bv: _PipelineBV) -> bool:
+        """ 和 up 一样，同一个 BV 同时只能有一个进程上传 """
+        if bv.lock is None and not bv.lock_failed:
+            lock_dir = config.storage_home_dir / ".locks" / bv.bvid
+            lock_dir.mkdir(parents=True, exist_ok=True)
+            lock = UploadLock(lock_dir)
+            try:
+                lock.__enter__()
+                bv.lock = lock
+            except AlreadyRunningError:
+                bv.lock_failed = True
+                print(_("已经有一个上传 {} 的进程在运行，跳过".format(bv.bvid)))
+        return bv.lock is not None
+
+    def _release_lock(self, bv: _PipelineBV):
+        if bv.lock is not None:
+            bv.lock.__exit__(None, None, None)
+            bv.lock = None
+
+    async def _upload_worker(self):
+        while True:
+            part = await self.upload_queue.get()
+            try:
+                if part is None:
+                    return
+                bv = self._bv(part.bvid)
+                if not self._acquire_lock(bv):
+                    self._part_finished(part, False)
+                    continue
+                with span("run.upload", bvid=part.bvid, pid=part.pid):
+                    ok = await self._run_in_executor(
+                        self._upload_part, part, bv.videos_basepath
+                    )
+                self._part_finished(part, ok)
+            except Exception as e:
+                # spam 标记已由 _upload_part 写好，同一 BV 的其他分P会跳过
+                metrics.PARTS.labels(stage="up", result="failed").inc()
+                print(_("上传 {} 时出错：").format(part.local_identifier))
+                traceback.print_exception(e)
+                self._part_finished(part, False)
+            finally:
+                self.upload_queue.task_done()
+
+    def _upload_part(self, part: PipelinePart, videos_basepath: Path) -> bool:
+        return _upload_part(
+            part.bvid,
+            part.local_identifier,
+            videos_basepath=videos_basepath,
+            upper_part=human_readable_upper_part_map(string=part.bvid, backward=True),
+            ia=self._ia,
+            update_existing=self.update_existing,
+            collection=self.collection,
+        ) and (part.video_basepath / "_uploaded.mark").exists()
+
+    async def _finalize_worker(self):
+        while True:
+            bvid = await self.finalize_queue.get()
+            try:
+                if bvid is None:
+                    return
+                bv = self._bvs[bvid]
+                with span("run.finalize", bvid=bvid):
+                    await self._run_in_executor(self._finalize, bv)
+            except Exception as e:
+                traceback.print_exception(e)
+            finally:
+                self.finalize_queue.task_done()
+
+    def _finalize(self, bv: _PipelineBV):
+        try:
+            uploaded = [name for name, ok in bv.parts.items() if ok]
+            if not bv.parts:
+                return
+            if len(uploaded) < len(bv.parts) or bv.lock_failed:
+                metrics.BVS.labels(stage="up", result="failed").inc()
+                self._failed.append(bv.bvid)
+                print(
+                    _("{}: {}/{} 个分P上传完成，保留本地文件").format(
+                        bv.bvid, len(uploaded), len(bv.parts)
+                    )
+                )
+                return
+            metrics.BVS.labels(stage="up", result="ok").inc()
+            # 只有整个 BV 都下载完、所有分P都确实上传了（有 _uploaded.mark）才删除
+            if self.delete_after_upload and bv.all_downloaded:
+                delete_uploaded_parts(bv.bvid, bv.videos_basepath, sorted(uploaded))
+        finally:
+            self._release_lock(bv)
+
+    async def join(self) -> List[str]:
+        """ 下载阶段结束后调用：按顺序关闭各阶段，等队列里的分P处理完。返回没有全部上传成功的 BV """
+        for stage, queue in (
+            ("verify", self.verify_queue),
+            ("upload", self.upload_queue),
+            ("finalize", self.finalize_queue),
+        ):
+            for _task in self._tasks[stage]:
+                await queue.put(None)
+            await asyncio.gather(*self._tasks[stage])
+        return list(self._failed)
+
+    async def aclose(self):
+        for tasks in self._tasks.values():
+            for task in tasks:
+                task.cancel()
+        await asyncio.gather(
+            *(task for tasks in self._tasks.values() for task in tasks),
+            return_exceptions=True,
+        )
+        # 正在上传的线程无法中断，不等它们（Ctrl-C 后尽快退出）；未开始的直接取消
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for bv in self._bvs.values():
+            self._release_lock(bv)
+
+
+async def run_pipeline(
+    *,
+    collection: str,
+    delete_after_upload: bool,
+    update_existing: bool = False,
+    verify_workers: int = 2,
+    upload_workers: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    **down_kwargs,
+):
+    """ biliarchiver run：下载和上传在同一个事件循环里流水线式进行 """
+    from biliarchiver.cli_tools.bili_archive_bvids import _down
+
+    pipeline = UploadPipeline(
+        collection=collection,
+        update_existing=update_existing,
+        delete_after_upload=delete_after_upload,
+        verify_workers=verify_workers,
+        upload_workers=upload_workers,
+        queue_size=queue_size,
+    )
+    pipeline.start()
+    down_error: Optional[BaseException] = None
+    try:
+        try:
+            await _down(
+                **down_kwargs,
+                # 上传时 ass 必须已经生成
+                defer_danmaku=False,
+                on_page_downloaded=pipeline.page_downloaded,
+                on_bv_done=pipeline.bv_done,
+            )
+        except Exception as e:
+            # 部分 BV 下载失败：已下载好的分P照样传完
+            down_error = e
+        failed = await pipeline.join()
+    finally:
+        await pipeline.aclose()
+    if failed:
+        print(_("有 {} 个 BV 没有全部上传成功：{}").format(len(failed), ", ".join(failed)))
+    if down_error is not None:
+        raise down_error
+    print("DONE")
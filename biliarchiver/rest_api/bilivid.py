@@ -55,26 +55,23 @@ class BiliVideo:
                 print("download terminated: (finally)")
 
     async def up(self) -> int:
-        from asyncio import subprocess
-        from shlex import quote
-
-        cmd = ["biliarchiver", "up", "-i", quote(self.bvid), "-d"]
+        # 在本进程的线程里上传，而不是起 biliarchiver up 子进程：
+        # 所有视频共用 IA 连接池和用户名、item 元数据缓存（见 biliarchiver.utils.ia_session）
+        from biliarchiver._biliarchiver_upload_bvid import UploadResult, upload_bvid
+        from biliarchiver.cli_tools.up_command import DEFAULT_COLLECTION
 
-        process: Optional[subprocess.Process] = None
         try:
-            process = await subprocess.create_subprocess_exec(*cmd)
-            retcode = await process.wait()
-            process = None
-        except (KeyboardInterrupt, SystemExit, Exception) as e:
-            if process:
-                process.terminate()
-                await process.wait()
-                print("upload terminated", e)
-            return -1
-        else:
-            return retcode
-        finally:
-            if process:
-                process.terminate()
-                await process.wait()
-                print("upload terminated: (finally)")
+            result = await asyncio.to_thread(
+                upload_bvid,
+                self.bvid,
+                collection=DEFAULT_COLLECTION,
+                delete_after_upload=True,
+            )
+        except Exception as e:
+            print("upload failed:", e)
+            return 1
+        if result is not UploadResult.uploaded:
+            # 跳过（如另一个进程在传）或推迟（如弹幕还没生成）的都没传完，让调度器重试
+            print(f"upload {result.value}: {self.bvid}")
+            return 2
+        return 0
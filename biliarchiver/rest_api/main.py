@@ -3,12 +3,14 @@ from contextlib import asynccontextmanager
 from datetime import datetime
 import os
 from pathlib import Path
+import time
 from typing import List
 
 from biliarchiver.cli_tools.utils import read_bvids_from_txt
 
 try:
     from fastapi import FastAPI, HTTPException
+    from fastapi.responses import PlainTextResponse
 except ImportError:
     print("Please install fastapi")
     print("`pip install fastapi`")
@@ -17,6 +19,7 @@ except ImportError:
 
 from biliarchiver.cli_tools.get_command import by_favlist, by_series, by_up_videos, by_season
 from biliarchiver.rest_api.bilivid import BiliVideo, VideoStatus
+from biliarchiver.utils import metrics
 from biliarchiver.version import BILI_ARCHIVER_VERSION
 
 
@@ -28,6 +31,7 @@ async def lifespan(app: FastAPI):
     print("Loading queue...")
     load_queue()
     print("Queue loaded")
+    metrics.SCHEDULER_PENDING.set_function(pending_queue.qsize)
     _video_scheduler = asyncio.create_task(video_scheduler())
     yield
     print("Shutting down...")
@@ -73,6 +77,12 @@ async def root():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # 只有 API 进程自己的指标；down 在子进程里运行，它的指标要靠各自的 --metrics-port 采集
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.put("/archive/{vid}")
 @app.post("/archive/{vid}")
 async def add(vid: str):
@@ -162,6 +172,7 @@ async def video_scheduler():
         video.status = VideoStatus.downloading
         await other_queue.put(video)
         downloaded = False
+        down_begin = time.monotonic()
         for _ in range(2):
             try:
                 if retcode := await video.down():
@@ -172,12 +183,15 @@ async def video_scheduler():
                 print(e)
                 print(f"(down) Retrying {video}...")
                 await asyncio.sleep(5)
+        metrics.SCHEDULER_STAGE_SECONDS.labels(stage="down").observe(time.monotonic() - down_begin)
         if not downloaded:
+            metrics.SCHEDULER_VIDEOS.labels(result="down_failed").inc()
             await other_queue.change_status(video, VideoStatus.failed)
             print(f"Failed to download {video}")
             continue
 
         if video.download_only:
+            metrics.SCHEDULER_VIDEOS.labels(result="finished").inc()
             await other_queue.change_status(video, VideoStatus.finished)
             print(f"Finished (download only) {video}")
             continue
@@ -185,22 +199,26 @@ async def video_scheduler():
         print(f"Start uploading {video}")
         await other_queue.change_status(video, VideoStatus.uploading)
         uploaded = False
+        up_begin = time.monotonic()
         for _ in range(3):
             try:
                 retcode = await video.up()
-                uploaded = True
                 if retcode != 0:
                     raise Exception(f"Upload failed with retcode {retcode}")
+                uploaded = True
                 break
             except Exception as e:
                 print(e)
                 print(f"(up) Retrying {video}...")
                 await asyncio.sleep(10)
+        metrics.SCHEDULER_STAGE_SECONDS.labels(stage="up").observe(time.monotonic() - up_begin)
         if not uploaded:
+            metrics.SCHEDULER_VIDEOS.labels(result="up_failed").inc()
             await other_queue.change_status(video, VideoStatus.failed)
             print(f"Failed to upload {video}")
             continue
 
+        metrics.SCHEDULER_VIDEOS.labels(result="finished").inc()
         await other_queue.change_status(video, VideoStatus.finished)
         print(f"Finished {video}")
 
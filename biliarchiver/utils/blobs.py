@@ -0,0 +1,133 @@
+import errno
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from biliarchiver.utils.manifest import FileDigest, StreamDigest
+
+BLOBS_DIRNAME = "blobs"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """
+    storage_home_dir/blobs 下按内容寻址（sha1）的文件仓库。
+
+    多P视频的每个分P都要在 extra/ 下放一份封面、视频详情和评论，内容完全相同。
+    每份内容只在这里写一次，再硬链接到各分P的 extra/ 目录；跨文件系统或硬链接数达到上限时退回复制。
+    用 sha1 作为键，和 _manifest.json、IA 文件列表里的 sha1 一致，删除分P后可以据此找到不再被引用的 blob。
+
+    blob 写入后不会再被修改（各处都是写新文件），所以共享 inode 是安全的。
+    """
+
+    def __init__(self, root: Union[Path, str]):
+        self.root = Path(root)
+
+    def path_of(self, sha1: str) -> Path:
+        return self.root / sha1[:2] / sha1
+
+    def put_bytes(self, data: bytes) -> Tuple[Path, StreamDigest]:
+        digest = StreamDigest()
+        digest.update(data)
+        sha1 = digest.sha1.hexdigest()
+        path = self.path_of(sha1)
+        if path.exists():
+            return path, digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{sha1}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)  # 并发写入同一内容时，谁后改名都一样
+        finally:
+            if tmp_path.exists():
+                os.remove(tmp_path)
+        return path, digest
+
+    def adopt(self, src: Union[Path, str]) -> Tuple[Path, StreamDigest]:
+        """ 把已经写完、不再需要的 src 改名进仓库（不复制），只读一遍算摘要 """
+        digest = StreamDigest()
+        with open(src, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        sha1 = digest.sha1.hexdigest()
+        path = self.path_of(sha1)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            os.remove(src)
+        else:
+            os.replace(src, path)  # 仓库和 videos 在同一个 storage_home_dir 下
+        return path, digest
+
+    def link(self, blob: Path, dest: Union[Path, str]):
+        """ 把 blob 放到 dest：优先硬链接，跨文件系统 / 硬链接数满 / 文件系统不支持时复制 """
+        dest = Path(dest)
+        if dest.exists():
+            os.remove(dest)
+        try:
+            os.link(blob, dest)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.ENOTSUP):
+                raise
+            shutil.copyfile(blob, dest)
+
+    def write(self, data: Union[bytes, str], dest: Union[Path, str]) -> FileDigest:
+        """ 返回 dest 的摘要，供调用方记进分P的 _manifest.json """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        for _attempt in range(3):
+            blob, digest = self.put_bytes(data)
+            try:
+                self.link(blob, dest)
+                return digest.finish(dest)
+            except FileNotFoundError:
+                continue  # 刚写入的 blob 被并发的 release / gc 删掉了，重新写
+        raise FileNotFoundError(dest)
+
+    def release(self, sha1s: Iterable[str]) -> int:
+        """ 删掉这些 blob 中已经没有分P引用的（硬链接数只剩仓库自己） """
+        removed = 0
+        for sha1 in set(sha1s):
+            path = self.path_of(sha1)
+            try:
+                if os.stat(path).st_nlink <= 1:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def gc(self) -> int:
+        """ 扫描整个仓库，删掉没有分P引用的 blob，返回释放的字节数 """
+        freed = 0
+        if not self.root.exists():
+            return 0
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue  # 正在写入
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_nlink <= 1:
+                        os.remove(path)
+                        freed += stat.st_size
+                except FileNotFoundError:
+                    pass
+        return freed
+
+
+_blob_stores: Dict[Path, BlobStore] = {}
+
+
+def get_blob_store(storage_home_dir: Optional[Path] = None) -> BlobStore:
+    if storage_home_dir is None:
+        from biliarchiver.config import config
+
+        storage_home_dir = config.storage_home_dir
+    root = Path(storage_home_dir) / BLOBS_DIRNAME
+    if root not in _blob_stores:
+        _blob_stores[root] = BlobStore(root)
+    return _blob_stores[root]
+
@@ -0,0 +1,282 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiofiles
+import httpx
+from bilix.download.utils import path_check
+from bilix.sites.bilibili import api
+
+from biliarchiver.i18n import _
+from biliarchiver.utils import metrics
+
+PROBE_TIMEOUT = 10
+""" 探测单个 URL 的超时（秒） """
+
+EWMA_ALPHA = 0.3
+""" 新样本在滚动评分中的权重 """
+SCORE_TTL = 300
+""" 评分超过这么多秒没有更新，下次遇到大文件时重新赛跑 """
+RACE_MIN_BYTES = 32 * 1024 * 1024
+""" 大于这个大小的流在开始下载前让各镜像赛跑 """
+RACE_BYTES = 256 * 1024
+""" 赛跑时每个镜像下载的字节数 """
+RACE_TIMEOUT = 5
+SWITCH_CHECK_INTERVAL = 5
+""" 下载中每隔多少秒检查一次当前连接的速度 """
+SWITCH_MIN_GAIN = 2
+""" 其他镜像的预期速度至少是当前速度的这么多倍才切换，避免来回切 """
+MAX_SWITCHES = 3
+""" 每个分段最多因为慢而切换镜像的次数 """
+
+
+async def probe_url(client: httpx.AsyncClient, url: str) -> bool:
+    """
+    用 Range: bytes=0-1 的 GET 探测资源是否存在（upos 对 HEAD 的支持不稳定）。
+    只读响应头，不下载正文
+    """
+    try:
+        async with client.stream(
+            "GET",
+            url,
+            headers={"Range": "bytes=0-1"},
+            timeout=PROBE_TIMEOUT,
+            follow_redirects=True,
+        ) as r:
+            return r.status_code in (200, 206)
+    except httpx.HTTPError:
+        return False
+
+
+async def probe_media(client: httpx.AsyncClient, media: api.Media) -> bool:
+    """ base_url 和 backup_url 中任意一个可用即可，bilix 下载时会在它们之间切换 """
+    for url in media.urls:
+        if await probe_url(client, url):
+            return True
+    return False
+
+
+def host_of(url) -> str:
+    return urlparse(str(url)).hostname or ""
+
+
+@dataclass
+class HostScore:
+    ttfb: Optional[float] = None
+    """ 首字节时间（秒）的滚动平均 """
+    throughput: Optional[float] = None
+    """ 单连接吞吐（字节/秒）的滚动平均 """
+    failures: int = 0
+    updated_at: float = 0.0
+
+
+class HostScoreboard:
+    """
+    每个 CDN host 的滚动评分（首字节时间和单连接吞吐的 EWMA），进程内所有下载共享。
+    dash 流的 base_url 和 backup_url 通常在不同的 upos host 上，下载分段时挑预期最快的那个。
+    """
+
+    def __init__(self, alpha: float = EWMA_ALPHA):
+        self.alpha = alpha
+        self.hosts: Dict[str, HostScore] = {}
+
+    def _score(self, host: str) -> HostScore:
+        return self.hosts.setdefault(host, HostScore())
+
+    def _ewma(self, old: Optional[float], new: float) -> float:
+        return new if old is None else old + self.alpha * (new - old)
+
+    def record_ttfb(self, host: str, seconds: float):
+        score = self._score(host)
+        score.ttfb = self._ewma(score.ttfb, seconds)
+        score.updated_at = time.time()
+
+    def record_throughput(self, host: str, bytes_per_second: float):
+        score = self._score(host)
+        score.throughput = self._ewma(score.throughput, bytes_per_second)
+        score.updated_at = time.time()
+
+    def record_failure(self, host: str):
+        score = self._score(host)
+        score.failures += 1
+        if score.throughput is not None:
+            score.throughput /= 2
+        score.updated_at = time.time()
+
+    def expected_throughput(self, host: str) -> Optional[float]:
+        score = self.hosts.get(host)
+        return score.throughput if score is not None else None
+
+    def is_fresh(self, host: str) -> bool:
+        score = self.hosts.get(host)
+        return (
+            score is not None
+            and score.throughput is not None
+            and time.time() - score.updated_at < SCORE_TTL
+        )
+
+    def rank(self, urls: List[str]) -> List[int]:
+        """
+        按预期吞吐从高到低排列 urls 的下标。
+        没有数据的 host 视为和已知最快的一样快（让它有机会被测到），同分时保持原顺序
+        """
+        known = [t for t in (self.expected_throughput(host_of(url)) for url in urls) if t is not None]
+        optimistic = max(known) if known else 0.0
+
+        def expected(i: int) -> float:
+            throughput = self.expected_throughput(host_of(urls[i]))
+            return optimistic if throughput is None else throughput
+
+        return sorted(range(len(urls)), key=lambda i: -expected(i))
+
+    def best(self, urls: List[str], exclude: Optional[int] = None) -> Optional[int]:
+        for i in self.rank(urls):
+            if i != exclude:
+                return i
+        return None
+
+
+_scoreboard = HostScoreboard()
+
+
+def get_host_scoreboard() -> HostScoreboard:
+    return _scoreboard
+
+
+async def _race_one(client: httpx.AsyncClient, url: str, scoreboard: HostScoreboard):
+    host = host_of(url)
+    begin = time.monotonic()
+    try:
+        async with client.stream(
+            "GET",
+            url,
+            follow_redirects=True,
+            headers={"Range": f"bytes=0-{RACE_BYTES - 1}"},
+            timeout=RACE_TIMEOUT,
+        ) as r:
+            r.raise_for_status()
+            first_byte = time.monotonic()
+            scoreboard.record_ttfb(host, first_byte - begin)
+            received = 0
+            async for chunk in r.aiter_bytes():
+                received += len(chunk)
+                if received >= RACE_BYTES or time.monotonic() - first_byte > RACE_TIMEOUT:
+                    break
+            elapsed = max(time.monotonic() - first_byte, 1e-3)
+            scoreboard.record_throughput(host, received / elapsed)
+    except httpx.HTTPError:
+        scoreboard.record_failure(host)
+
+
+async def race_mirrors(client: httpx.AsyncClient, urls: List[str]):
+    """
+    大文件开始下载前，让还没有新鲜评分的 host 各下载 RACE_BYTES 字节，结果记入评分表。
+    同一个 host 只测一次；所有 host 都有新鲜评分时什么也不做
+    """
+    scoreboard = get_host_scoreboard()
+    by_host: Dict[str, str] = {}
+    for url in urls:
+        by_host.setdefault(host_of(url), url)
+    if len(by_host) < 2:
+        return
+    stale = [url for host, url in by_host.items() if not scoreboard.is_fresh(host)]
+    if stale:
+        await asyncio.gather(*(_race_one(client, url, scoreboard) for url in stale))
+
+
+async def get_file_part_mirrored(
+    self, urls: List[str], path: Path, part_range: Tuple[int, int], task_id
+) -> Path:
+    """
+    替换 bilix 的 BaseDownloaderPart._get_file_part：
+    bilix 随机挑一个镜像，出错也一直重试同一个。这里按评分挑最快的 host，
+    出错时换下一个；下载中速度低于 config.cdn_min_speed 且有预期快得多的镜像时，
+    断开当前连接，从已下载的位置在新镜像上继续（分段文件是追加写入的）。
+    """
+    from biliarchiver.config import config
+
+    scoreboard = get_host_scoreboard()
+    min_speed = config.cdn_min_speed * 1024
+    start, end = part_range
+    part_path = path.with_name(f"{path.name}.{part_range[0]}-{part_range[1]}")
+    exist, part_path = path_check(part_path)
+    if exist:
+        downloaded = os.path.getsize(part_path)
+        if downloaded > end - start + 1:
+            # 比范围还长，内容不可信（见 ResumeRecord.validate），重新下载
+            os.remove(part_path)
+            downloaded = 0
+        start += downloaded
+        await self.progress.update(task_id, advance=downloaded)
+    if start > end:
+        return part_path  # skip already finished
+
+    url_idx = scoreboard.best(urls)
+    assert url_idx is not None
+    downloaded_bytes = metrics.BYTES.labels(stage="down")
+    times = 0
+    switches = 0
+    while True:
+        host = host_of(urls[url_idx])
+        switch_to: Optional[int] = None
+        try:
+            begin = time.monotonic()
+            async with self.client.stream(
+                "GET", urls[url_idx], follow_redirects=True, headers={"Range": f"bytes={start}-{end}"}
+            ) as r, self._stream_context(times), aiofiles.open(part_path, "ab") as f:
+                r.raise_for_status()
+                if r.history:  # avoid twice redirect
+                    urls[url_idx] = str(r.url)
+                scoreboard.record_ttfb(host, time.monotonic() - begin)
+                host_bytes = metrics.CDN_BYTES.labels(host=host)
+                window_start = time.monotonic()
+                window_bytes = 0
+                async for chunk in r.aiter_bytes(chunk_size=self.chunk_size):
+                    await f.write(chunk)
+                    start += len(chunk)
+                    window_bytes += len(chunk)
+                    host_bytes.inc(len(chunk))
+                    downloaded_bytes.inc(len(chunk))
+                    await self.progress.update(task_id, advance=len(chunk))
+                    await self._check_speed(len(chunk))
+                    elapsed = time.monotonic() - window_start
+                    if elapsed < SWITCH_CHECK_INTERVAL:
+                        continue
+                    speed = window_bytes / elapsed
+                    scoreboard.record_throughput(host, speed)
+                    window_start = time.monotonic()
+                    window_bytes = 0
+                    if min_speed and speed < min_speed and switches < MAX_SWITCHES:
+                        alternative = scoreboard.best(urls, exclude=url_idx)
+                        expected = (
+                            scoreboard.expected_throughput(host_of(urls[alternative]))
+                            if alternative is not None
+                            else None
+                        )
+                        if expected is not None and expected >= speed * SWITCH_MIN_GAIN:
+                            switch_to = alternative
+                            break
+                if switch_to is None and window_bytes and time.monotonic() - window_start > 0.5:
+                    scoreboard.record_throughput(host, window_bytes / (time.monotonic() - window_start))
+        except (httpx.HTTPStatusError, httpx.TransportError):
+            scoreboard.record_failure(host)
+            times += 1
+            if times > self.stream_retry:
+                raise Exception(f"STREAM 超过重复次数 {part_path.name}")
+            url_idx = scoreboard.best(urls, exclude=url_idx if len(urls) > 1 else None)
+            assert url_idx is not None
+            if len(urls) > 1:
+                metrics.CDN_SWITCHES.labels(reason="error").inc()
+            continue
+        if switch_to is None:
+            return part_path
+        switches += 1
+        metrics.CDN_SWITCHES.labels(reason="slow").inc()
+        self.logger.debug(
+            _("{}: {} 太慢，切换到 {}").format(part_path.name, host, host_of(urls[switch_to]))
+        )
+        url_idx = switch_to
@@ -0,0 +1,324 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from biliarchiver.i18n import _
+
+LEASE_TTL = 120
+""" 租约有效期（秒）。worker 每 LEASE_TTL / 4 秒续约一次，进程挂掉后租约最多 LEASE_TTL 秒后被其他 worker 回收 """
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lease (
+    bvid TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    acquired_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (bvid, stage)
+);
+CREATE INDEX IF NOT EXISTS lease_owner_idx ON lease (owner);
+CREATE TABLE IF NOT EXISTS done (
+    bvid TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (bvid, stage)
+);
+CREATE TABLE IF NOT EXISTS event (
+    stage TEXT NOT NULL,
+    bvid TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    finished_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS event_finished_idx ON event (finished_at);
+CREATE TABLE IF NOT EXISTS worker (
+    owner TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    PRIMARY KEY (owner, stage)
+);
+"""
+
+
+class LeaseStatus(str, Enum):
+    acquired = "acquired"
+    held = "held"  # 其他 worker 正持有未过期的租约，可能失败，不算完成
+    done = "done"  # 已在本阶段完成
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class StageStats:
+    stage: str
+    workers: int
+    """ 最近 LEASE_TTL 秒内有心跳的 worker 数 """
+    leased: int
+    """ 未过期的租约数（正在处理的 BV） """
+    expired: int
+    """ 已过期、等待回收的租约数 """
+    finished: int
+    failed: int
+    bytes: int
+    window: float
+
+    @property
+    def bvs_per_hour(self) -> float:
+        return self.finished / self.window * 3600
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.window
+
+
+class Coordinator:
+    """
+    多个 biliarchiver down / up 进程（可以在不同机器上）之间分配 BV 的协调器。
+
+    所有 worker 共用一个 SQLite 文件（放在共享存储上即可，本地测试直接指向同一个路径）。
+    处理 BV 前先领取 (bvid, stage) 的租约，后台线程定期续约；
+    进程挂掉后心跳停止，租约过期，其他 worker 领取同一个 BV 时直接接手。
+    每个 BV 处理完成后记一条 event，用于统计整个集群的吞吐。
+
+    不用 WAL：WAL 依赖共享内存，不能跨机器使用，这里用默认的 rollback journal。
+
+    注意：rollback journal 靠文件锁（fcntl）保证互斥，而很多网络文件系统（NFS、SMB/CIFS 等）
+    的文件锁不可靠，两个 worker 可能同时领到同一个 BV，甚至把数据库写坏。
+    跨机器使用时，数据库所在的共享存储必须支持可靠的 POSIX 锁（如开启了 lockd 的 NFSv4）；
+    否则所有 worker 只放在同一台机器上、指向本地磁盘上的同一个文件。
+
+    方法都是同步的，可能等锁最多 60 秒，在事件循环里要放到 executor 中调用。
+    """
+
+    def __init__(
+        self,
+        db_path: Union[Path, str],
+        stage: str,
+        owner: Optional[str] = None,
+        ttl: float = LEASE_TTL,
+    ):
+        self.db_path = Path(db_path).expanduser()
+        self.stage = stage
+        self.owner = owner or default_owner()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._acquired_at: Dict[str, float] = {}
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.db_path, timeout=60, check_same_thread=False, isolation_level=None
+        )
+        self._conn.executescript(_SCHEMA)
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    # ---- worker ----
+
+    def acquire(self, bvid: str) -> LeaseStatus:
+        """
+        领取 bvid 在本阶段的租约。
+        已经被其他 worker 持有（且未过期）时返回 held，已在本阶段完成时返回 done。
+        """
+        now = time.time()
+
+        def take(conn: sqlite3.Connection) -> LeaseStatus:
+            if conn.execute(
+                "SELECT 1 FROM done WHERE bvid = ? AND stage = ?", (bvid, self.stage)
+            ).fetchone():
+                return LeaseStatus.done
+            row = conn.execute(
+                "SELECT owner, expires_at FROM lease WHERE bvid = ? AND stage = ?",
+                (bvid, self.stage),
+            ).fetchone()
+            if row is not None:
+                owner, expires_at = row
+                if owner != self.owner and expires_at > now:
+                    return LeaseStatus.held
+                if owner != self.owner:
+                    print(_("{} 的租约已过期（{}），回收").format(bvid, owner))
+            conn.execute(
+                "INSERT INTO lease (bvid, stage, owner, acquired_at, expires_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (bvid, stage) DO UPDATE SET owner = excluded.owner, "
+                "acquired_at = excluded.acquired_at, expires_at = excluded.expires_at, "
+                "attempts = lease.attempts + 1",
+                (bvid, self.stage, self.owner, now, now + self.ttl),
+            )
+            return LeaseStatus.acquired
+
+        status = self._transaction(take)
+        if status is LeaseStatus.acquired:
+            self._acquired_at[bvid] = now
+        return status
+
+    def release(self, bvid: str, ok: bool, nbytes: int = 0, done: Optional[bool] = None):
+        """
+        处理结束（无论成败）时释放租约。
+        done（默认同 ok）为 True 时 BV 记为本阶段已完成，之后不会再被领取
+        """
+        if done is None:
+            done = ok
+        now = time.time()
+        acquired_at = self._acquired_at.pop(bvid, now)
+
+        def give_back(conn: sqlite3.Connection):
+            conn.execute(
+                "DELETE FROM lease WHERE bvid = ? AND stage = ? AND owner = ?",
+                (bvid, self.stage, self.owner),
+            )
+            if done:
+                conn.execute(
+                    "INSERT OR REPLACE INTO done (bvid, stage, owner, finished_at) VALUES (?, ?, ?, ?)",
+                    (bvid, self.stage, self.owner, now),
+                )
+            conn.execute(
+                "INSERT INTO event (stage, bvid, owner, ok, bytes, seconds, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.stage, bvid, self.owner, int(ok), int(nbytes), now - acquired_at, now),
+            )
+
+        self._transaction(give_back)
+
+    def heartbeat(self) -> int:
+        """ 续约本 worker 持有的所有租约，返回续约的个数 """
+        now = time.time()
+
+        def renew(conn: sqlite3.Connection) -> int:
+            conn.execute(
+                "INSERT INTO worker (owner, stage, started_at, heartbeat_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (owner, stage) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (self.owner, self.stage, now, now),
+            )
+            return conn.execute(
+                "UPDATE lease SET expires_at = ? WHERE owner = ? AND stage = ?",
+                (now + self.ttl, self.owner, self.stage),
+            ).rowcount
+
+        return self._transaction(renew)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.ttl / 4):
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                # 共享存储暂时不可用，下次再试；租约还有 3/4 的有效期
+                print(_("协调器心跳失败：{}").format(e))
+
+    def start(self):
+        """ 注册 worker 并启动后台续约线程 """
+        self.heartbeat()
+        if self._heartbeat_thread is None:
+            self._stop.clear()
+            self._heartbeat_thread = threading.Thread(
+                target=self._heartbeat_loop, name="coordinator_heartbeat", daemon=True
+            )
+            self._heartbeat_thread.start()
+
+    def close(self):
+        """ 停止续约，放弃手上还没释放的租约（不记为失败），让其他 worker 立即可以领取 """
+        self._stop.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+
+        def leave(conn: sqlite3.Connection):
+            conn.execute(
+                "DELETE FROM lease WHERE owner = ? AND stage = ?", (self.owner, self.stage)
+            )
+            conn.execute(
+                "DELETE FROM worker WHERE owner = ? AND stage = ?", (self.owner, self.stage)
+            )
+
+        try:
+            self._transaction(leave)
+        finally:
+            with self._lock:
+                self._conn.close()
+
+    # ---- 管理 / 统计 ----
+
+    def reclaim(self) -> int:
+        """ 删除所有已过期的租约和失联的 worker，返回删除的租约数 """
+        now = time.time()
+
+        def sweep(conn: sqlite3.Connection) -> int:
+            conn.execute("DELETE FROM worker WHERE heartbeat_at < ?", (now - self.ttl,))
+            return conn.execute("DELETE FROM lease WHERE expires_at < ?", (now,)).rowcount
+
+        return self._transaction(sweep)
+
+    def stats(self, window: float = 600) -> List[StageStats]:
+        """ 各阶段最近 window 秒内的吞吐，以及当前的 worker 和租约数 """
+        now = time.time()
+        with self._lock:
+            stages: Dict[str, Dict[str, int]] = {}
+
+            def row(stage: str) -> Dict[str, int]:
+                return stages.setdefault(
+                    stage,
+                    {"workers": 0, "leased": 0, "expired": 0, "finished": 0, "failed": 0, "bytes": 0},
+                )
+
+            for stage, count in self._conn.execute(
+                "SELECT stage, COUNT(*) FROM worker WHERE heartbeat_at >= ? GROUP BY stage",
+                (now - self.ttl,),
+            ):
+                row(stage)["workers"] = count
+            for stage, expired, count in self._conn.execute(
+                "SELECT stage, expires_at < ?, COUNT(*) FROM lease GROUP BY stage, expires_at < ?",
+                (now, now),
+            ):
+                row(stage)["expired" if expired else "leased"] = count
+            for stage, ok, count, nbytes in self._conn.execute(
+                "SELECT stage, ok, COUNT(*), SUM(bytes) FROM event WHERE finished_at >= ? "
+                "GROUP BY stage, ok",
+                (now - window,),
+            ):
+                row(stage)["finished" if ok else "failed"] = count
+                if ok:
+                    row(stage)["bytes"] = nbytes or 0
+        return [
+            StageStats(stage=stage, window=window, **counts)
+            for stage, counts in sorted(stages.items())
+        ]
+
+    def leases(self) -> List[tuple]:
+        """ (bvid, stage, owner, acquired_at, expires_at, attempts) """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT bvid, stage, owner, acquired_at, expires_at, attempts FROM lease "
+                "ORDER BY acquired_at"
+            ).fetchall()
+
+
+def get_coordinator(stage: str, db_path: Optional[str] = None) -> Optional[Coordinator]:
+    """ db_path 为空时读取 config.json 的 coordinator_db；都没有设置时返回 None（单机模式） """
+    if not db_path:
+        from biliarchiver.config import config
+
+        db_path = config.coordinator_db
+    if not db_path:
+        return None
+    return Coordinator(db_path, stage)
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import aiofiles
+
+from biliarchiver.i18n import _
+from biliarchiver.utils import metrics
+from biliarchiver.utils.tracing import span
+
+DANMAKU_PENDING_FILENAME = "_danmaku_pending.json"
+""" 推迟生成 ass 弹幕时写在分P目录里，记录 pb 弹幕和转换参数。以 _ 开头，不会被上传 """
+
+
+def _proto2ass(protobuf_bytes: bytes, width: int, height: int) -> bytes:
+    # 在子进程中运行，必须是模块级函数才能被 pickle
+    from danmakuC.bilibili import proto2ass
+
+    content = proto2ass(protobuf_bytes, width, height, font_size=width / 40)  # type: ignore
+    return (content or "").encode("utf-8")
+
+
+class DanmakuConverter:
+    """
+    pb 弹幕转 ass 是 CPU 密集的，几十万条弹幕的视频在线程里转会和事件循环抢 GIL，拖慢所有下载。
+    这里放进独立的进程池，并用信号量限制同时提交的转换数，排队数可以通过 queued 查看。
+
+    workers 为 0 时退回到默认线程池（旧行为）。
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.queued = 0
+        """ 正在等待转换的弹幕数 """
+        self.running = 0
+        """ 正在转换的弹幕数 """
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.workers > 0 and self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # asyncio.Semaphore 绑定事件循环，down 每次 asyncio.run 都是新的循环
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(max(1, self.workers))
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def convert(self, protobuf_bytes: bytes, width: int, height: int) -> bytes:
+        loop = asyncio.get_running_loop()
+        self.queued += 1
+        dequeued = False
+        try:
+            with span("danmaku.wait"):
+                await self._get_semaphore().acquire()
+            self.queued -= 1
+            dequeued = True
+            self.running += 1
+            try:
+                with span("danmaku.convert", bytes=len(protobuf_bytes)):
+                    return await loop.run_in_executor(
+                        self._get_executor(), _proto2ass, protobuf_bytes, width, height
+                    )
+            finally:
+                self.running -= 1
+                self._get_semaphore().release()
+        finally:
+            if not dequeued:  # 排队时被取消
+                self.queued -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+_converter: Optional[DanmakuConverter] = None
+
+
+def get_danmaku_converter() -> DanmakuConverter:
+    global _converter
+    if _converter is None:
+        from biliarchiver.config import config
+
+        converter = DanmakuConverter(config.danmaku_workers)
+        metrics.DANMAKU_QUEUED.set_function(lambda: converter.queued)
+        metrics.DANMAKU_RUNNING.set_function(lambda: converter.running)
+        _converter = converter
+    return _converter
+
+
+def write_danmaku_pending(
+    video_basepath: Path, pb_filename: str, ass_filename: str, width: int, height: int
+):
+    with open(video_basepath / DANMAKU_PENDING_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(
+            {"pb": pb_filename, "ass": ass_filename, "width": width, "height": height},
+            f,
+            ensure_ascii=False,
+        )
+
+
+def iter_danmaku_pending(videos_dir: Union[Path, str]) -> Iterator[Path]:
+    """ videos/{bvid}-{upper}/{identifier}/_danmaku_pending.json """
+    videos_dir = Path(videos_dir)
+    if not videos_dir.exists():
+        return
+    with os.scandir(videos_dir) as bv_entries:
+        for bv_entry in bv_entries:
+            if not bv_entry.is_dir():
+                continue
+            with os.scandir(bv_entry.path) as part_entries:
+                for part_entry in part_entries:
+                    pending = Path(part_entry.path) / DANMAKU_PENDING_FILENAME
+                    if part_entry.is_dir() and pending.exists():
+                        yield pending
+
+
+async def convert_pending_danmaku(pending_file: Path, converter: DanmakuConverter) -> bool:
+    """
+    把推迟的 pb 弹幕转成 ass，成功后删掉 pending 文件。
+    pb 不存在（没有弹幕）时没什么可转的，同样删掉 pending 文件，否则这个分P永远不会被上传
+    """
+    with open(pending_file, "r", encoding="utf-8") as f:
+        pending = json.load(f)
+    extra_path = pending_file.parent / "extra"
+    pb_path = extra_path / pending["pb"]
+    if not pb_path.exists():
+        print(_("{} 不存在，没有弹幕可转换").format(pb_path))
+        os.remove(pending_file)
+        return True
+    async with aiofiles.open(pb_path, "rb") as f:
+        protobuf_bytes = await f.read()
+    content = await converter.convert(protobuf_bytes, pending["width"], pending["height"])
+    ass_path = extra_path / pending["ass"]
+    tmp_path = ass_path.with_name(ass_path.name + ".tmp")
+    async with aiofiles.open(tmp_path, "wb") as f:
+        await f.write(content)
+    os.replace(tmp_path, ass_path)
+    os.remove(pending_file)
+    return True
@@ -0,0 +1,217 @@
+import heapq
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Set, Union
+
+from biliarchiver.i18n import _
+
+INDEX_FILENAME = "ia_item_exist.idx"
+LOG_FILENAME = "ia_item_exist.log"
+LEGACY_CACHE_DIRNAME = "ia_item_exist_cache"
+
+
+def _iter_lines(path: Path) -> Iterator[bytes]:
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+    except FileNotFoundError:
+        return
+
+
+def _search(mm: mmap.mmap, key: bytes) -> bool:
+    """ 在按字节序排好、\\n 分隔的 mmap 上二分查找整行 """
+    lo, hi = 0, len(mm)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = mm.rfind(b"\n", lo, mid)
+        start = lo if start == -1 else start + 1
+        end = mm.find(b"\n", start, hi)
+        if end == -1:
+            end = hi
+        line = mm[start:end]
+        if line == key:
+            return True
+        if line < key:
+            lo = end + 1
+        else:
+            hi = start
+    return False
+
+
+class IAItemIndex:
+    """
+    已存在于 IA 的 identifier 索引，替代 ia_item_exist_cache/ 下每个 item 一个的 .mark 文件。
+
+    - ia_item_exist.idx：排好序、换行分隔的 identifier，mmap 后二分查找
+    - ia_item_exist.log：新发现的 identifier 追加写入，启动时读进内存，
+      攒够 compact_threshold 个（或调用 compact()）后合并进 .idx
+
+    多进程同时使用时，合并会重新读取 .log，极端情况下丢掉一条也无妨：这只是缓存，下次再联网查一次而已。
+    """
+
+    def __init__(self, index_dir: Union[Path, str], compact_threshold: int = 100_000):
+        self.index_dir = Path(index_dir)
+        self.index_path = self.index_dir / INDEX_FILENAME
+        self.log_path = self.index_dir / LOG_FILENAME
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._index_file = None
+        self._mm: Optional[mmap.mmap] = None
+        self._recent: Set[bytes] = set()
+        self._open()
+
+    def _open(self):
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        if self.index_path.exists() and self.index_path.stat().st_size > 0:
+            self._index_file = open(self.index_path, "rb")
+            self._mm = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._recent = set(_iter_lines(self.log_path))
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            if self._index_file is not None:
+                self._index_file.close()
+                self._index_file = None
+
+    def __contains__(self, identifier: str) -> bool:
+        key = identifier.encode("utf-8")
+        with self._lock:
+            if key in self._recent:
+                return True
+            return self._mm is not None and _search(self._mm, key)
+
+    def add(self, identifier: str):
+        with self._lock:
+            if identifier in self:
+                return
+            with open(self.log_path, "ab") as f:
+                f.write(identifier.encode("utf-8") + b"\n")
+            self._recent.add(identifier.encode("utf-8"))
+            if len(self._recent) >= self.compact_threshold:
+                self.compact()
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            for key in self._merged(set()):
+                yield key.decode("utf-8")
+
+    def _merged(self, extra: Set[bytes]) -> Iterator[bytes]:
+        """ 合并 .idx、.log 和 extra，按序去重 """
+        pending = sorted(self._recent | set(_iter_lines(self.log_path)) | extra)
+        last = None
+        for key in heapq.merge(_iter_lines(self.index_path), pending):
+            if key != last:
+                yield key
+                last = key
+
+    def compact(self, extra: Iterable[bytes] = ()) -> int:
+        """ 把 .log（和 extra）合并进 .idx。返回 .idx 中的条目数 """
+        with self._lock:
+            tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+            count = 0
+            with open(tmp_path, "wb") as f:
+                for key in self._merged(set(extra)):
+                    f.write(key + b"\n")
+                    count += 1
+            self.close()
+            os.replace(tmp_path, self.index_path)
+            with open(self.log_path, "wb"):
+                pass
+            self._open()
+            return count
+
+    def bulk_add(self, identifiers: Iterable[str], batch_size: int = 1_000_000) -> int:
+        """ 批量导入，每 batch_size 个合并一次 .idx 以限制内存。返回新增的条目数 """
+        added = 0
+        batch: Set[bytes] = set()
+        with self._lock:
+            for identifier in identifiers:
+                identifier = identifier.strip()
+                if not identifier or identifier in self:
+                    continue
+                batch.add(identifier.encode("utf-8"))
+                if len(batch) >= batch_size:
+                    added += len(batch)
+                    self.compact(batch)
+                    batch = set()
+            added += len(batch)
+            self.compact(batch)
+        return added
+
+    def import_legacy_cache(self, remove: bool = False) -> int:
+        """ 导入旧版的 ia_item_exist_cache/{identifier}.mark """
+        cache_dir = self.index_dir / LEGACY_CACHE_DIRNAME
+        if not cache_dir.is_dir():
+            return 0
+
+        def iter_marks():
+            with os.scandir(cache_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".mark"):
+                        yield entry.name[: -len(".mark")]
+
+        added = self.bulk_add(iter_marks())
+        if remove:
+            import shutil
+
+            shutil.rmtree(cache_dir)
+        return added
+
+
+def iter_identifiers_from_file(path: Union[Path, str]) -> Iterator[str]:
+    """
+    从本地文件读取 identifier，每行一个。
+    也接受 `ia search --itemlist` 的输出，以及 `ia search` / scrape API 导出的 JSON lines（取 "identifier" 字段）。
+    """
+    import json
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                identifier = json.loads(line).get("identifier")
+                if identifier:
+                    yield identifier
+            else:
+                yield line.split()[0]
+
+
+def iter_identifiers_from_search(query: str) -> Iterator[str]:
+    """ 通过 archive.org 的 scrape API 导出搜索结果中的 identifier """
+    from internetarchive import search_items
+
+    for result in search_items(query, fields=["identifier"]):
+        yield result["identifier"]
+
+
+_ia_indexes: Dict[Path, IAItemIndex] = {}
+_ia_indexes_lock = threading.Lock()
+
+
+def get_ia_item_index(storage_home_dir: Optional[Path] = None) -> IAItemIndex:
+    """ 获取 storage_home_dir 下的索引，首次使用时导入旧版的 .mark 缓存 """
+    if storage_home_dir is None:
+        from biliarchiver.config import config
+
+        storage_home_dir = config.storage_home_dir
+    storage_home_dir = Path(storage_home_dir)
+    with _ia_indexes_lock:
+        if storage_home_dir not in _ia_indexes:
+            is_new = not (storage_home_dir / INDEX_FILENAME).exists()
+            index = IAItemIndex(storage_home_dir)
+            if is_new and (storage_home_dir / LEGACY_CACHE_DIRNAME).is_dir():
+                print(_("首次使用 IA item 索引，正在导入 {} ...").format(LEGACY_CACHE_DIRNAME))
+                count = index.import_legacy_cache()
+                print(_("已导入 {} 个 identifier").format(count))
+            _ia_indexes[storage_home_dir] = index
+        return _ia_indexes[storage_home_dir]
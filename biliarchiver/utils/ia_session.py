@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from internetarchive import ArchiveSession, get_session
+from internetarchive.auth import S3Auth
+from internetarchive.exceptions import AuthenticationError
+from internetarchive.item import Item
+from requests.adapters import HTTPAdapter
+
+IA_USERNAME_TTL = 3600
+""" key 对应的用户名缓存多久（秒） """
+IA_METADATA_TTL = 60
+""" 已存在的 item 的元数据缓存多久（秒）。不存在的 item 不缓存，上传、改元数据后立即失效 """
+IA_POOL_MAXSIZE = 16
+""" 每个 host 保持的连接数下限，实际取 max(它, upload_concurrency * 2) """
+IA_S3_HOST = "s3.us.archive.org"
+
+
+_ia_keys: Dict[str, Tuple[int, Tuple[str, str]]] = {}
+_ia_keys_lock = threading.Lock()
+
+
+def read_ia_keys(keysfile: Union[Path, str]) -> Tuple[str, str]:
+    """Return: tuple(`access_key`, `secret_key`)
+
+    按文件的修改时间缓存，key 文件没变就不再读盘
+    """
+    keysfile = os.path.expanduser(str(keysfile))
+    mtime_ns = os.stat(keysfile).st_mtime_ns
+    with _ia_keys_lock:
+        cached = _ia_keys.get(keysfile)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+
+    with open(keysfile, "r", encoding="utf-8") as f:
+        key_lines = f.readlines()
+
+    access_key = key_lines[0].strip()
+    secret_key = key_lines[1].strip()
+
+    with _ia_keys_lock:
+        _ia_keys[keysfile] = (mtime_ns, (access_key, secret_key))
+    return access_key, secret_key
+
+
+class IASession:
+    """
+    进程内共用的 archive.org 客户端：一个带连接池的 ArchiveSession，加上用户名和 item 元数据的 TTL 缓存。
+
+    internetarchive 的 get_item / get_username 每次调用都新建 session（而且默认带 Connection: close），
+    上传每个分P前的几次查询都要重新 TLS 握手。这里所有查询、上传、改元数据都走同一个 session，
+    up、clean -u、biliarchiver run 和 REST API 的上传共用。requests.Session 的连接池是线程安全的，可以被上传线程池共用。
+    """
+
+    def __init__(self, access_key: str, secret_key: str, pool_maxsize: int = IA_POOL_MAXSIZE):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session: ArchiveSession = get_session(
+            config={"s3": {"access": access_key, "secret": secret_key}},
+            http_adapter_kwargs={"pool_connections": 4, "pool_maxsize": pool_maxsize},
+        )
+        # 保持长连接
+        self.session.headers.pop("Connection", None)
+        # archive.org 上已经挂了带重试的 adapter；S3 由 item.upload 自己重试，这里只放大连接池
+        self.session.mount(
+            f"{self.session.protocol}//{IA_S3_HOST}",
+            HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0),
+        )
+        self._lock = threading.Lock()
+        self._username: Optional[Tuple[float, str]] = None
+        self._metadata: Dict[str, Tuple[float, dict]] = {}
+
+    def username(self) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if self._username is not None and self._username[0] > now:
+                return self._username[1]
+        # 同 internetarchive.get_user_info，只是走共用的 session
+        r = self.session.get(
+            f"{self.session.protocol}//{IA_S3_HOST}",
+            params={"check_auth": 1},
+            auth=S3Auth(self.access_key, self.secret_key),
+            timeout=10,
+        )
+        r.raise_for_status()
+        j = r.json()
+        if j.get("error"):
+            raise AuthenticationError(j.get("error"))
+        username = j.get("username", "")
+        with self._lock:
+            self._username = (now + IA_USERNAME_TTL, username)
+        return username
+
+    def get_item(self, identifier: str, fresh: bool = False) -> Item:
+        """ fresh=True 时忽略缓存（如等待 item 创建、上传后刷新） """
+        now = time.monotonic()
+        if not fresh:
+            with self._lock:
+                cached = self._metadata.get(identifier)
+            if cached is not None and cached[0] > now:
+                return self.session.get_item(identifier, item_metadata=cached[1])
+        item = self.session.get_item(identifier)
+        if item.exists:
+            with self._lock:
+                self._metadata[identifier] = (now + IA_METADATA_TTL, item.item_metadata)
+        else:
+            self.invalidate(identifier)
+        return item
+
+    def invalidate(self, identifier: str):
+        with self._lock:
+            self._metadata.pop(identifier, None)
+
+
+_ia_sessions: Dict[Tuple[str, str], IASession] = {}
+_ia_sessions_lock = threading.Lock()
+
+
+def get_ia_session(keysfile: Union[Path, str, None] = None) -> IASession:
+    """ 按 key 文件里的 key 取进程内共用的 IASession（key 文件换了 key 就换一个 session） """
+    from biliarchiver.config import config
+
+    if keysfile is None:
+        keysfile = config.ia_key_file
+    access_key, secret_key = read_ia_keys(keysfile)
+    with _ia_sessions_lock:
+        key = (access_key, secret_key)
+        if key not in _ia_sessions:
+            _ia_sessions[key] = IASession(
+                access_key,
+                secret_key,
+                pool_maxsize=max(IA_POOL_MAXSIZE, config.upload_concurrency * 2),
+            )
+        return _ia_sessions[key]
@@ -1,8 +1,10 @@
 
+import re
 from io import StringIO
 
 
 BASE58_CHARS = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+BVID_PATTERN = re.compile(f'BV[{BASE58_CHARS}]*')
 
 def human_readable_upper_part_map(string: str, backward: bool):
     ''' 为同一字符串序列的不同大小写形式生成不碰撞的字符串。以便在大小写不敏感的系统中存储同一字符串的不同形式。
@@ -43,10 +45,4 @@ def human_readable_upper_part_map(string: str, backward: bool):
 
 def is_bvid(string: str):
     ''' 判断一个字符串是否是 Base58 的 bv 号 '''
-    if not string.startswith('BV'):
-        return False
-    for char in string:
-        if char not in BASE58_CHARS:
-            return False
-    
-    return True
+    return BVID_PATTERN.fullmatch(string) is not None
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from biliarchiver.utils.danmaku import DANMAKU_PENDING_FILENAME
+
+MANIFEST_FILENAME = "_manifest.json"
+""" 以 _ 开头，上传时会被跳过 """
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class FileDigest:
+    size: int
+    mtime_ns: int
+    md5: str
+    sha1: str
+
+    def matches(self, stat: os.stat_result) -> bool:
+        """ 大小和修改时间都没变，就认为内容没变 """
+        return self.size == stat.st_size and self.mtime_ns == stat.st_mtime_ns
+
+
+class StreamDigest:
+    """ 数据写盘时顺便算 md5 和 sha1：字节已经在内存里，不用之后再把文件读一遍 """
+
+    def __init__(self):
+        self.md5 = hashlib.md5()
+        self.sha1 = hashlib.sha1()
+
+    def update(self, chunk: bytes):
+        self.md5.update(chunk)
+        self.sha1.update(chunk)
+
+    def finish(self, path: Union[Path, str]) -> FileDigest:
+        """ path 写完（改名到位）后调用，记下它此时的大小和修改时间 """
+        stat = os.stat(path)
+        return FileDigest(
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            md5=self.md5.hexdigest(),
+            sha1=self.sha1.hexdigest(),
+        )
+
+
+class PartManifest:
+    """
+    单个分P目录（BiliBili-{bvid}_p{pid}）下各文件的大小、修改时间和摘要，存在 _manifest.json。
+
+    摘要在写文件时顺带算出（分段合并见 utils/resume.py 的 merge_parts，封面、详情、评论见 utils/blobs.py），
+    由 record_digests 记进来。上传时只读这里的记录当 Content-MD5，删除分P时据此释放 blob。
+    没有记录、或大小和修改时间已经变了的文件（如 ffmpeg 合并出的 mp4、之后生成的 ass 弹幕）不带 Content-MD5 上传，不会为此再读一遍文件。
+    """
+
+    def __init__(self, video_basepath: Union[Path, str]):
+        self.video_basepath = Path(video_basepath)
+        self.path = self.video_basepath / MANIFEST_FILENAME
+        self._files: Dict[str, FileDigest] = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._files = {name: FileDigest(**entry) for name, entry in data.get("files", {}).items()}
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            self._files = {}
+
+    def save(self):
+        data = {"files": {name: asdict(digest) for name, digest in sorted(self._files.items())}}
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _key(self, path: Union[Path, str]) -> str:
+        return Path(path).relative_to(self.video_basepath).as_posix()
+
+    def sha1s(self) -> List[str]:
+        return [digest.sha1 for digest in self._files.values()]
+
+    def blob_sha1s(self) -> List[str]:
+        """
+        删除分P前要释放的 blob：清单里所有文件的 sha1（不论这次上传了哪些）。
+        硬链接着、但清单里没有有效记录的文件（如旧版本下载的）只能现算，这类文件只有封面、详情、评论几个
+        """
+        sha1s = set(self.sha1s())
+        for dirpath, _dirnames, filenames in os.walk(self.video_basepath):
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                try:
+                    if os.stat(path).st_nlink <= 1 or self.cached(path) is not None:
+                        continue
+                    digest = StreamDigest()
+                    with open(path, "rb") as f:
+                        while chunk := f.read(HASH_CHUNK_SIZE):
+                            digest.update(chunk)
+                except FileNotFoundError:
+                    continue
+                sha1s.add(digest.sha1.hexdigest())
+        return list(sha1s)
+
+    def cached(self, path: Union[Path, str]) -> Optional[FileDigest]:
+        """ 记录仍然有效时返回它，否则返回 None（不计算） """
+        digest = self._files.get(self._key(path))
+        if digest is not None and digest.matches(os.stat(path)):
+            return digest
+        return None
+
+    def set(self, path: Union[Path, str], digest: FileDigest):
+        self._files[self._key(path)] = digest
+
+    def prune(self):
+        """ 去掉已经不存在的文件（如合并后被删掉的音视频分轨） """
+        self._files = {
+            name: digest
+            for name, digest in self._files.items()
+            if (self.video_basepath / name).exists()
+        }
+
+
+_record_lock = threading.Lock()
+
+
+def record_digests(video_basepath: Union[Path, str], digests: Dict[Union[Path, str], FileDigest]):
+    """
+    把写文件时算好的摘要记进分P的 _manifest.json。
+    同一个分P的音视频合并、封面等可能在不同线程里同时完成，读-改-写整个过程串行
+    """
+    with _record_lock:
+        manifest = PartManifest(video_basepath)
+        for path, digest in digests.items():
+            manifest.set(path, digest)
+        manifest.prune()
+        manifest.save()
+
+
+def verify_part(video_basepath: Union[Path, str]) -> Optional[str]:
+    """
+    biliarchiver run 的校验阶段：确认分P已下载完、弹幕已生成、主视频文件还在。
+    只看元数据，不读文件内容。返回 None 表示通过，否则返回原因
+    """
+    video_basepath = Path(video_basepath)
+    if not (video_basepath / "_downloaded.mark").exists():
+        return "_downloaded.mark not found"
+    if (video_basepath / DANMAKU_PENDING_FILENAME).exists():
+        # 之前 down --defer-danmaku 留下的，先上传会缺 ass，上传后还可能被删掉
+        return f"{DANMAKU_PENDING_FILENAME} found, run biliarchiver danmaku first"
+    file_basename = video_basepath.name.split("-", 1)[-1]
+    media = [video_basepath / f"{file_basename}{suffix}" for suffix in (".mp4", ".flv")]
+    if not any(path.is_file() and path.stat().st_size > 0 for path in media):
+        return f"{file_basename}.mp4/.flv missing or empty"
+    return None
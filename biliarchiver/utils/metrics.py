@@ -0,0 +1,334 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from biliarchiver.i18n import _
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+""" 秒，覆盖从一次 API 请求到一个大分P的下载 / 上传 """
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, **labels) -> "_Metric":
+        assert set(labels) == set(self.labelnames), (self.name, labels)
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            if key not in self._children:
+                self._children[key] = self._new_child()
+            return self._children[key]
+
+    def _new_child(self) -> "_Metric":
+        return type(self)(self.name, self.documentation)
+
+    def _samples(self) -> Iterator[Tuple[str, Tuple[str, ...], str, float]]:
+        """ (后缀, 标签值, 额外标签, 值) """
+        if self.labelnames:
+            with self._lock:
+                children = list(self._children.items())
+            for key, child in children:
+                for suffix, _values, extra, value in child._samples():
+                    yield suffix, key, extra, value
+        else:
+            yield from self._own_samples()
+
+    def _own_samples(self) -> Iterator[Tuple[str, Tuple[str, ...], str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for suffix, labelvalues, extra, value in self._samples():
+            labels = _format_labels(self.labelnames, labelvalues, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def inc(self, amount: float = 1):
+        assert amount >= 0
+        with self._lock:
+            self._value += amount
+
+    def _own_samples(self):
+        yield "", (), "", self._value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """ 导出时才调用 function 取值（如队列长度），不用到处手动 set """
+        self._function = function
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+    def _own_samples(self):
+        value = self._value
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                value = math.nan
+        yield "", (), "", value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # 最后一个是 +Inf
+        self._sum = 0.0
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        begin = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - begin)
+
+    def _own_samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        for bound, count in zip([*self.buckets, math.inf], counts):
+            cumulative += count
+            yield "_bucket", (), f'le="{_format_value(bound)}"', cumulative
+        yield "_sum", (), "", total
+        yield "_count", (), "", cumulative
+
+
+class Registry:
+    """
+    进程内的计数器 / 仪表 / 直方图，以 Prometheus 文本格式导出（不依赖 prometheus_client）。
+
+    指标只在内存里累加，开销可以忽略，所以总是收集；
+    只有设置了 config.json 的 metrics_port（或 down / up 的 --metrics-port）才会开一个本地 HTTP 端口，
+    REST API 则在 /metrics 上导出同一份数据。
+
+    指标只属于当前进程，不跨进程汇总：REST API 的 /metrics 有调度器和上传（在 API 进程里运行）的指标，
+    但没有它启动的 down 子进程的。要采集 down 的指标，每个 down 进程需要用 --metrics-port 各开一个端口，
+    由 Prometheus 分别抓取。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            assert isinstance(metric, cls), name
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics: List[_Metric] = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---- 下载 ----
+BVS = REGISTRY.counter(
+    "biliarchiver_bvs_total", "BV processed, by stage (down/up) and result", ["stage", "result"]
+)
+PARTS = REGISTRY.counter(
+    "biliarchiver_parts_total", "Pages (parts) processed, by stage and result", ["stage", "result"]
+)
+PART_SECONDS = REGISTRY.histogram(
+    "biliarchiver_part_seconds", "Wall time per page, by stage", ["stage"]
+)
+BYTES = REGISTRY.counter(
+    "biliarchiver_bytes_total", "Bytes downloaded from CDN hosts / uploaded to IA", ["stage"]
+)
+CDN_BYTES = REGISTRY.counter(
+    "biliarchiver_cdn_bytes_total", "Bytes streamed per CDN host", ["host"]
+)
+CDN_SWITCHES = REGISTRY.counter(
+    "biliarchiver_cdn_switches_total", "Mid-stream switches away from a slow or failing CDN host", ["reason"]
+)
+STREAM_UNAVAILABLE = REGISTRY.counter(
+    "biliarchiver_stream_unavailable_total",
+    "Candidate video streams rejected by the preflight probe (codec fallback)",
+    ["codec"],
+)
+DOWN_QUEUE_DEPTH = REGISTRY.gauge(
+    "biliarchiver_down_queue_depth", "BVs waiting in the down worker queue"
+)
+DOWN_WORKERS_BUSY = REGISTRY.gauge(
+    "biliarchiver_down_workers_busy", "down workers currently archiving a BV"
+)
+SPACE_RESERVED = REGISTRY.gauge(
+    "biliarchiver_space_reserved_bytes",
+    "Disk space reserved for in-flight pages but not yet written, as of the last admission check",
+)
+DANMAKU_QUEUED = REGISTRY.gauge(
+    "biliarchiver_danmaku_queued", "Danmaku conversions waiting for a worker"
+)
+DANMAKU_RUNNING = REGISTRY.gauge(
+    "biliarchiver_danmaku_running", "Danmaku conversions running"
+)
+# ---- biliarchiver run ----
+PIPELINE_QUEUE_DEPTH = REGISTRY.gauge(
+    "biliarchiver_pipeline_queue_depth", "Pages waiting in front of a biliarchiver run stage", ["stage"]
+)
+PIPELINE_RESIDENCY_SECONDS = REGISTRY.histogram(
+    "biliarchiver_pipeline_residency_seconds",
+    "Time from a page's _downloaded.mark to the end of its upload in biliarchiver run",
+)
+# ---- B 站 API ----
+API_RESPONSES = REGISTRY.counter(
+    "biliarchiver_api_responses_total",
+    "Bilibili API responses by endpoint class and result (ok/throttled/error)",
+    ["endpoint", "result"],
+)
+# ---- REST API ----
+SCHEDULER_VIDEOS = REGISTRY.counter(
+    "biliarchiver_scheduler_videos_total", "Videos finished by the REST scheduler, by result", ["result"]
+)
+SCHEDULER_STAGE_SECONDS = REGISTRY.histogram(
+    "biliarchiver_scheduler_stage_seconds", "Wall time of the down / up subprocess per video, including retries", ["stage"]
+)
+SCHEDULER_PENDING = REGISTRY.gauge(
+    "biliarchiver_scheduler_pending", "Videos waiting in the REST scheduler queue"
+)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: Optional[int] = None, addr: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """ port 为 None 时读取 config.json 的 metrics_port；为 0 时不启动。重复调用只启动一次 """
+    global _server
+    if port is None:
+        from biliarchiver.config import config
+
+        port = config.metrics_port
+    if not port or _server is not None:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    except OSError as e:
+        # 比如 REST API 启动的 down / up 子进程读到同一个 metrics_port
+        print(_("无法在端口 {} 上导出指标：{}").format(port, e))
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics_server", daemon=True).start()
+    print(_("指标已导出到 http://{}:{}/metrics").format(addr, _server.server_port))
+    return _server
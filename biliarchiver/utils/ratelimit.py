@@ -0,0 +1,328 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import httpx
+
+from biliarchiver.i18n import _
+from biliarchiver.utils import metrics
+
+
+class IntervalLimiter:
+    """
+    最简单的限速器：相邻两次 acquire 至少间隔 min_interval 秒。
+
+    每次 acquire 先占一个时间槽再 sleep 到该时间，占槽时没有 await，
+    所以不需要 asyncio.Lock，也不绑定事件循环，可以跨多次 asyncio.run 共享。
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+RATE_LIMITED_HOSTS = {"api.bilibili.com"}
+""" 只限制 B 站官方 API；bilibili_api_proxy 自己负责限速 """
+
+RATE_LIMITED_CODES = {-412, -352, -509, -799}
+""" 请求被拦截 / 风控校验失败 / 请求过于频繁 """
+
+ENDPOINT_CLASSES: List[Tuple[str, str]] = [
+    ("/x/v2/reply", "reply"),
+    ("/x/space", "space"),
+    ("/x/v3/fav", "fav"),
+    ("/medialist", "fav"),
+    ("/x/web-interface/popular", "popular"),
+    ("/x/web-interface/ranking", "popular"),
+    ("/x/web-interface/view", "video"),
+    ("/x/player", "video"),
+]
+""" 按路径前缀划分的端点类别，每类一个令牌桶。其余 API 归入 default """
+
+DEFAULT_RATES: Dict[str, float] = {
+    "reply": 5,
+    "space": 1 / 3,
+    "fav": 1 / 2,
+    "popular": 1 / 3,
+    "video": 4,
+    "default": 4,
+}
+""" 各类别的初始速率（请求/秒），可用 config.json 的 rate_limits 覆盖 """
+
+STATE_FILENAME = "ratelimit.json"
+
+
+def classify_endpoint(url: Union[str, httpx.URL]) -> Optional[str]:
+    """ 返回 url 所属的端点类别，不需要限速的返回 None """
+    parsed = urlparse(str(url))
+    if parsed.hostname not in RATE_LIMITED_HOSTS:
+        return None
+    for prefix, endpoint_class in ENDPOINT_CLASSES:
+        if parsed.path.startswith(prefix):
+            return endpoint_class
+    return "default"
+
+
+def is_rate_limited_response(status_code: int, body: bytes) -> bool:
+    if status_code == 412:
+        return True
+    try:
+        return json.loads(body).get("code") in RATE_LIMITED_CODES
+    except (ValueError, AttributeError):
+        return False
+
+
+class _SharedState:
+    """
+    跨进程共享的桶状态：一个 JSON 文件，读写时用 fcntl.flock 加锁。
+    同一机器上的多个 biliarchiver 进程（down / get / clean）共用一份速率。
+    """
+
+    def __init__(self, path: Path):
+        import fcntl
+
+        self._fcntl = fcntl
+        self.path = path
+        self.lock_path = path.with_name(path.name + ".lock")
+
+    def update(self, name: str, fn: Callable[[dict], dict], default: dict) -> dict:
+        with open(self.lock_path, "a") as lock_file:
+            self._fcntl.flock(lock_file, self._fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        states = json.load(f)
+                except (FileNotFoundError, json.JSONDecodeError):
+                    states = {}
+                state = fn(dict(default, **states.get(name, {})))
+                states[name] = state
+                tmp = self.path.with_name(self.path.name + ".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(states, f)
+                os.replace(tmp, self.path)
+                return state
+            finally:
+                self._fcntl.flock(lock_file, self._fcntl.LOCK_UN)
+
+
+class EndpointBucket:
+    """
+    单个端点类别的令牌桶（GCRA 实现：只需记录下一个可用时间点 tat 和当前速率），
+    速率按 AIMD 调整：成功时加性增加，遇到风控码时减半。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int = 2,
+        shared: Optional[_SharedState] = None,
+    ):
+        self.name = name
+        self.base_rate = rate
+        self.min_rate = rate / 16
+        self.max_rate = rate * 4
+        self.increase = rate / 20
+        self.burst = burst
+        self._shared = shared
+        self._lock = threading.Lock()
+        self._state = {"tat": 0.0, "rate": rate}
+        self.throttled = 0
+        """ 累计遇到风控的次数 """
+
+    def _update(self, fn: Callable[[dict], dict]) -> dict:
+        with self._lock:
+            if self._shared is not None:
+                self._state = self._shared.update(self.name, fn, self._state)
+            else:
+                self._state = fn(dict(self._state))
+            return self._state
+
+    @property
+    def rate(self) -> float:
+        return self._state["rate"]
+
+    @property
+    def shared(self) -> bool:
+        """ 状态在进程间共享时，每次更新都要 flock 并读写文件，不能在事件循环上做 """
+        return self._shared is not None
+
+    def reserve(self) -> float:
+        """ 占用一个令牌，返回需要等待的秒数 """
+        now = time.time()
+        delay = 0.0
+
+        def take(state: dict) -> dict:
+            nonlocal delay
+            interval = 1 / state["rate"]
+            tat = max(state["tat"], now)
+            delay = max(0.0, tat - (self.burst - 1) * interval - now)
+            state["tat"] = tat + interval
+            return state
+
+        self._update(take)
+        return delay
+
+    async def acquire(self):
+        if self.shared:
+            delay = await asyncio.get_running_loop().run_in_executor(None, self.reserve)
+        else:
+            delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self):
+        def increase(state: dict) -> dict:
+            state["rate"] = min(self.max_rate, state["rate"] + self.increase)
+            return state
+
+        self._update(increase)
+
+    def on_throttled(self):
+        self.throttled += 1
+
+        def decrease(state: dict) -> dict:
+            state["rate"] = max(self.min_rate, state["rate"] / 2)
+            # 让出一个完整的间隔，别让排队中的请求继续撞上去
+            state["tat"] = max(state["tat"], time.time()) + 1 / state["rate"]
+            return state
+
+        state = self._update(decrease)
+        print(_("B 站 API 风控 ({})，速率降至 {:.2f} 次/秒").format(self.name, state["rate"]))
+
+
+class RateLimiter:
+    """ 所有 B 站 API 调用共用的限速器，每个端点类别一个桶 """
+
+    def __init__(self, rates: Dict[str, float], state_path: Optional[Path] = None):
+        shared = None
+        if state_path is not None:
+            try:
+                shared = _SharedState(state_path)
+            except ModuleNotFoundError:
+                print(_("当前系统不支持 fcntl，限速状态不会在进程间共享"))
+        self.buckets: Dict[str, EndpointBucket] = {
+            name: EndpointBucket(name, rate, shared=shared) for name, rate in rates.items()
+        }
+
+    def throttled(self) -> int:
+        """ 所有端点累计遇到风控的次数 """
+        return sum(bucket.throttled for bucket in self.buckets.values())
+
+    def bucket_for(self, url: Union[str, httpx.URL]) -> Optional[EndpointBucket]:
+        endpoint_class = classify_endpoint(url)
+        if endpoint_class is None:
+            return None
+        return self.buckets.get(endpoint_class, self.buckets["default"])
+
+    def observe(self, url: Union[str, httpx.URL], status_code: int, body: bytes):
+        bucket = self.bucket_for(url)
+        if bucket is None:
+            return
+        if is_rate_limited_response(status_code, body):
+            bucket.on_throttled()
+            result = "throttled"
+        elif status_code == 200:
+            bucket.on_success()
+            result = "ok"
+        else:
+            result = "error"
+        metrics.API_RESPONSES.labels(endpoint=bucket.name, result=result).inc()
+
+    # ---- httpx ----
+
+    async def _async_request_hook(self, request: httpx.Request):
+        bucket = self.bucket_for(request.url)
+        if bucket is not None:
+            await bucket.acquire()
+
+    async def _async_response_hook(self, response: httpx.Response):
+        bucket = self.bucket_for(response.request.url)
+        if bucket is None:
+            return
+        await response.aread()
+        if bucket.shared:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.observe, response.request.url, response.status_code, response.content
+            )
+        else:
+            self.observe(response.request.url, response.status_code, response.content)
+
+    def _sync_request_hook(self, request: httpx.Request):
+        bucket = self.bucket_for(request.url)
+        if bucket is not None:
+            bucket.acquire_sync()
+
+    def _sync_response_hook(self, response: httpx.Response):
+        if self.bucket_for(response.request.url) is None:
+            return
+        response.read()
+        self.observe(response.request.url, response.status_code, response.content)
+
+    def install(self, client: Union[httpx.AsyncClient, httpx.Client]):
+        """ 给 httpx client 挂上限速的 event hooks（重复调用无害） """
+        if isinstance(client, httpx.AsyncClient):
+            request_hook, response_hook = self._async_request_hook, self._async_response_hook
+        else:
+            request_hook, response_hook = self._sync_request_hook, self._sync_response_hook
+        hooks = client.event_hooks
+        if request_hook in hooks["request"]:
+            return
+        client.event_hooks = {
+            "request": [*hooks["request"], request_hook],
+            "response": [*hooks["response"], response_hook],
+        }
+
+    # ---- requests ----
+
+    def requests_get(self, url: str, **kwargs):
+        """ 限速的 requests.get """
+        import requests
+
+        bucket = self.bucket_for(url)
+        if bucket is not None:
+            bucket.acquire_sync()
+        r = requests.get(url, **kwargs)
+        self.observe(url, r.status_code, r.content)
+        return r
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(key: str = "") -> RateLimiter:
+    """ key 为空时是进程共用的限速器；多账号下载时每个账号（key 见 account_limiter_key）有自己的一份 """
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            from biliarchiver.config import config
+
+            rates = dict(DEFAULT_RATES, **(config.rate_limits or {}))
+            state_path = None
+            if config.rate_limit_shared:
+                config.storage_home_dir.mkdir(parents=True, exist_ok=True)
+                state_filename = f"ratelimit-{key}.json" if key else STATE_FILENAME
+                state_path = config.storage_home_dir / state_filename
+            _rate_limiters[key] = RateLimiter(rates, state_path)
+        return _rate_limiters[key]
+
+
+def install_rate_limiter(client: Union[httpx.AsyncClient, httpx.Client], key: str = ""):
+    get_rate_limiter(key).install(client)
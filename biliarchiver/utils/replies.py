@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import IO, Optional
+
+import httpx
+from bilix.download.utils import req_retry
+
+from biliarchiver.i18n import _
+
+REPLY_MAIN_API = "https://api.bilibili.com/x/v2/reply/main"
+REPLY_SUB_API = "https://api.bilibili.com/x/v2/reply/reply"
+REPLY_PAGE_SIZE = 20
+REPLY_CLOSED_CODE = 12002
+""" 评论区已关闭 """
+REPLIES_SUB_CONCURRENCY = 4
+""" 每个 BV 同时抓取楼中楼的楼层数 """
+REPLIES_SCRATCH_FILENAME = "_replies.jsonl"
+""" 全部评论在 BV 目录下抓取时用的文件名（连同 .partial / .checkpoint.json），抓完后移进 blob 仓库 """
+
+class RepliesCrawler:
+    """
+    抓取一个视频的全部评论（包括楼中楼），流式写入 JSON lines，每行一条 API 返回的原始评论。
+
+    一级评论按时间顺序（mode=2）用 cursor 翻页，每页的楼中楼并发抓取（client 需已挂上限速器）。
+    每抓完一页（含其楼中楼）就记录一次断点：cursor 和输出文件的字节数。
+    中断后从断点继续，先把输出截断到断点处，丢掉没抓完的那一页。
+    内存占用只与单页有关，与评论总数无关。
+
+    一级评论的 "replies" 字段（预览的前几条楼中楼）会被置空，楼中楼以完整的单独行出现。
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        aid: int,
+        output_path: Path,
+        sub_concurrency: int = REPLIES_SUB_CONCURRENCY,
+    ):
+        self.client = client
+        self.aid = aid
+        self.output_path = output_path
+        self.partial_path = output_path.with_name(output_path.name + ".partial")
+        self.checkpoint_path = output_path.with_name(output_path.name + ".checkpoint.json")
+        self.sub_concurrency = sub_concurrency
+
+    async def _get(self, url: str, params: dict) -> Optional[dict]:
+        """
+        返回 data；评论区关闭时返回 None。
+        限速由 client 上的 ratelimit hooks 负责（reply 类别，所有 BV 共享）
+        """
+        r = await req_retry(self.client, url, params=params, follow_redirects=True)
+        r_json = r.json()
+        if r_json["code"] == REPLY_CLOSED_CODE:
+            return None
+        if r_json["code"] != 0:
+            raise ValueError(
+                _("评论获取失败 (aid {}): {} {}").format(self.aid, r_json["code"], r_json.get("message"))
+            )
+        return r_json["data"]
+
+    def _load_checkpoint(self) -> dict:
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            if self.partial_path.exists():
+                return checkpoint
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return {"next": 0, "offset": 0, "count": 0}
+
+    def _save_checkpoint(self, checkpoint: dict):
+        tmp = self.checkpoint_path.with_name(self.checkpoint_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    @staticmethod
+    def _write(f: IO[bytes], reply: dict):
+        f.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    async def crawl(self) -> int:
+        """ 返回评论总条数。完成后输出文件才会出现在 output_path """
+        if self.output_path.exists():
+            return -1
+
+        checkpoint = self._load_checkpoint()
+        if checkpoint["offset"]:
+            print(_("aid {}: 从断点继续抓取评论，已抓取 {} 条").format(self.aid, checkpoint["count"]))
+
+        with open(self.partial_path, "ab") as f:
+            f.truncate(checkpoint["offset"])
+            f.seek(0, os.SEEK_END)
+            count = checkpoint["count"]
+            cursor = checkpoint["next"]
+            sub_semaphore = asyncio.Semaphore(self.sub_concurrency)
+
+            async def crawl_sub_replies(root: dict) -> int:
+                sub_count = 0
+                async with sub_semaphore:
+                    pn = 1
+                    while True:
+                        data = await self._get(
+                            REPLY_SUB_API,
+                            {
+                                "type": 1,
+                                "oid": self.aid,
+                                "root": root["rpid"],
+                                "ps": REPLY_PAGE_SIZE,
+                                "pn": pn,
+                            },
+                        )
+                        replies = (data or {}).get("replies") or []
+                        for reply in replies:
+                            self._write(f, reply)
+                        sub_count += len(replies)
+                        total = ((data or {}).get("page") or {}).get("count", 0)
+                        if not replies or pn * REPLY_PAGE_SIZE >= total:
+                            return sub_count
+                        pn += 1
+
+            while True:
+                data = await self._get(
+                    REPLY_MAIN_API,
+                    {"type": 1, "oid": self.aid, "mode": 2, "next": cursor, "ps": REPLY_PAGE_SIZE},
+                )
+                if data is None:
+                    print(_("aid {}: 评论区已关闭").format(self.aid))
+                    break
+                roots = list(data.get("replies") or [])
+                if cursor == 0:
+                    roots = list(data.get("top_replies") or []) + roots  # 置顶评论只在第一页
+                for root in roots:
+                    self._write(f, dict(root, replies=None))
+                sub_counts = await asyncio.gather(
+                    *(crawl_sub_replies(root) for root in roots if root.get("rcount"))
+                )
+                count += len(roots) + sum(sub_counts)
+
+                page_cursor = data.get("cursor") or {}
+                f.flush()
+                cursor = page_cursor.get("next", 0)
+                self._save_checkpoint({"next": cursor, "offset": f.tell(), "count": count})
+                if page_cursor.get("is_end", True) or not roots:
+                    break
+
+        os.replace(self.partial_path, self.output_path)
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+        return count
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import os
+import re
+from pathlib import Path, PurePath
+from typing import Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+from bilix.download.utils import path_check
+
+from biliarchiver.i18n import _
+from biliarchiver.utils.cdn import RACE_MIN_BYTES, race_mirrors
+from biliarchiver.utils.manifest import StreamDigest, record_digests
+
+RESUME_SUFFIX = ".resume.json"
+MERGING_SUFFIX = ".merging"
+MERGE_CHUNK_SIZE = 1024 * 1024
+
+
+def _upstream_id(url: str) -> str:
+    """
+    用于判断上游资源是否变了。
+    同一条流在不同 CDN 镜像上 host 不同，query 里的签名/过期时间每次请求都会变，所以只比较 path。
+    """
+    return urlparse(url).path
+
+
+class ResumeRecord:
+    """
+    单条媒体流的断点续传记录（sidecar 文件）。
+
+    记录上游 URL、总大小、分段范围以及已完成的分段。
+    bilix 每个分段写入 {name}.{start}-{end}，续传时它会从分段文件现有大小处继续 Range 请求，
+    所以续传前要确认上游没变（否则删掉旧分段从头下载），并用 validate() 检查各分段的大小。
+
+    sidecar 以 _ 开头，上传时会被跳过。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.sidecar = path.with_name(f"_{path.name}{RESUME_SUFFIX}")
+        self.data: Optional[dict] = None
+
+    def load(self) -> Optional[dict]:
+        try:
+            with open(self.sidecar, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.data = None
+        return self.data
+
+    def matches(self, urls: List[str], total: int, ranges: List[Tuple[int, int]]) -> bool:
+        data = self.load()
+        if data is None:
+            return False
+        return (
+            data.get("upstream") == _upstream_id(urls[0])
+            and data.get("total") == total
+            and [tuple(r) for r in data.get("ranges", [])] == ranges
+        )
+
+    def save(self):
+        assert self.data is not None
+        tmp = self.sidecar.with_name(self.sidecar.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.sidecar)
+
+    def start(self, urls: List[str], total: int, ranges: List[Tuple[int, int]]):
+        self.data = {
+            "upstream": _upstream_id(urls[0]),
+            "total": total,
+            "ranges": [list(r) for r in ranges],
+            "done": [],
+        }
+        self.save()
+
+    def mark_done(self, part_range: Tuple[int, int]):
+        assert self.data is not None
+        self.data["done"].append(list(part_range))
+        self.save()
+
+    def part_path(self, part_range: Tuple[int, int]) -> Path:
+        return self.path.with_name(f"{self.path.name}.{part_range[0]}-{part_range[1]}")
+
+    def validate(self, ranges: List[Tuple[int, int]]) -> List[Path]:
+        """
+        续传前检查各分段文件的大小，删掉不可信的，返回被删掉的分段：
+        - 超出自己范围的（比如 bilix 的 merge_files 合并到一半被打断，第一个分段后面已经追加了别的分段）；
+        - 记录为已完成、大小却不等于范围长度的。
+        这样的分段留着会被当成已下载完而跳过，或者在错误的位置继续追加，最终文件内容就错了。
+        """
+        assert self.data is not None
+        done = {tuple(r) for r in self.data.get("done", [])}
+        removed = []
+        for part_range in ranges:
+            part_path = self.part_path(part_range)
+            if not part_path.exists():
+                done.discard(part_range)
+                continue
+            size = os.path.getsize(part_path)
+            expected = part_range[1] - part_range[0] + 1
+            if size > expected or (part_range in done and size != expected):
+                os.remove(part_path)
+                done.discard(part_range)
+                removed.append(part_path)
+        self.data["done"] = [list(r) for r in ranges if r in done]
+        self.save()
+        return removed
+
+    def downloaded_bytes(self) -> int:
+        return sum(os.path.getsize(p) for p in self.part_files())
+
+    def part_files(self) -> List[Path]:
+        pattern = re.compile(re.escape(self.path.name) + r"\.\d+-\d+$")
+        if not self.path.parent.exists():
+            return []
+        return [
+            self.path.parent / name
+            for name in os.listdir(self.path.parent)
+            if pattern.match(name)
+        ]
+
+    def discard(self):
+        """ 上游变了（或者没有记录），删掉旧的分段文件，从头下载 """
+        for part_file in self.part_files():
+            os.remove(part_file)
+        self.remove()
+
+    @property
+    def merging_path(self) -> Path:
+        """ 合并用的临时文件，以 _ 开头，残留时也不会被上传 """
+        return self.path.with_name(f"_{self.path.name}{MERGING_SUFFIX}")
+
+    def remove(self):
+        try:
+            os.remove(self.sidecar)
+        except FileNotFoundError:
+            pass
+
+
+async def get_file_resumable(
+    self, url_or_urls: Union[str, Iterable[str]], path: Union[Path, str], task_id=None
+) -> Path:
+    """
+    替换 bilix 的 BaseDownloaderPart.get_file：
+    下载前核对 sidecar 记录，上游 URL 和大小都没变就保留已下载的分段，通过 Range 请求继续下载。
+    """
+    path = Path(path)
+    urls = [url_or_urls] if isinstance(url_or_urls, str) else [url for url in url_or_urls]
+    upper = task_id is not None and self.progress.tasks[task_id].fields.get('upper', None)
+
+    if not path.is_dir():
+        exist, path = path_check(path)
+        if exist:
+            if not upper:
+                self.logger.info(f'[green]已存在[/green] {path.name}')
+            return path
+
+    total, req_filename = await self._pre_req(urls)
+
+    if path.is_dir():
+        file_name = req_filename if req_filename else PurePath(urlparse(urls[0]).path).name
+        path /= file_name
+        exist, path = path_check(path)
+        if exist:
+            if not upper:
+                self.logger.info(f'[green]已存在[/green] {path.name}')
+            return path
+
+    part_length = total // self.part_concurrency
+    ranges: List[Tuple[int, int]] = []
+    for i in range(self.part_concurrency):
+        start = i * part_length
+        end = (i + 1) * part_length - 1 if i < self.part_concurrency - 1 else total - 1
+        ranges.append((start, end))
+
+    if total >= RACE_MIN_BYTES:
+        # 大文件先让各镜像赛跑，分段下载时按评分挑最快的 host
+        await race_mirrors(self.client, urls)
+
+    record = ResumeRecord(path)
+    if record.merging_path.exists():
+        # 上次合并中途被打断，分段文件都还在，重新合并即可
+        os.remove(record.merging_path)
+    if record.matches(urls, total, ranges):
+        for part_path in record.validate(ranges):
+            print(_("{}: 分段 {} 大小不对，重新下载").format(path.name, part_path.name))
+        print(_("{}: 继续上次未完成的下载 ({}/{} bytes)").format(
+            path.name, record.downloaded_bytes(), total
+        ))
+    else:
+        if record.data is not None or record.part_files():
+            print(_("{}: 上游资源已变化，重新下载").format(path.name))
+        record.discard()
+        record.start(urls, total, ranges)
+
+    if task_id is not None:
+        await self.progress.update(
+            task_id,
+            total=self.progress.tasks[task_id].total + total if self.progress.tasks[task_id].total else total)
+    else:
+        task_id = await self.progress.add_task(description=path.name, total=total)
+
+    async def _get_part(part_range: Tuple[int, int]) -> Path:
+        part_path = await self._get_file_part(urls, path=path, part_range=part_range, task_id=task_id)
+        record.mark_done(part_range)
+        return part_path
+
+    file_list = await asyncio.gather(*[_get_part(r) for r in ranges])
+    await asyncio.get_running_loop().run_in_executor(
+        None, merge_parts, file_list, path, record.merging_path
+    )
+    record.remove()
+    if not upper:
+        await self.progress.update(task_id, visible=False)
+        self.logger.info(f"[cyan]已完成[/cyan] {path.name}")
+    return path
+
+
+def merge_parts(file_list: List[Path], path: Path, merging_path: Path):
+    """
+    替代 bilix 的 merge_files（它直接往第一个分段后面追加，中途被打断就留下超长的分段）：
+    先拼到临时文件，完整写完后原子地改名为 path，最后才删除分段。任何时候被打断，分段文件都是完整的。
+    拼接时顺带算出摘要记进分P的 _manifest.json，上传时不用再读一遍
+    """
+    digest = StreamDigest()
+    with open(merging_path, "wb") as out:
+        for part_path in file_list:
+            with open(part_path, "rb") as f:
+                while chunk := f.read(MERGE_CHUNK_SIZE):
+                    digest.update(chunk)
+                    out.write(chunk)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(merging_path, path)
+    record_digests(path.parent, {path: digest.finish(path)})
+    for part_path in file_list:
+        os.remove(part_path)
+
+
+def clean_unfinished_outputs(video_basepath: Path, file_basename: str) -> List[str]:
+    """
+    合并（ffmpeg combine/concat）中途被打断时，最终的 mp4/flv 可能只写了一半，而 bilix 看到它存在就会跳过。
+    如果还有中间文件（{file_basename}-v / -a / -0.flv ...）残留，说明合并没完成，删掉最终文件让它重新合并。
+    已下载的中间文件和分段文件保留，用于续传。
+    """
+    if not video_basepath.exists():
+        return []
+    names = os.listdir(video_basepath)
+    has_intermediate = any(name.startswith(f"{file_basename}-") for name in names)
+    removed = []
+    if has_intermediate:
+        for suffix in (".mp4", ".flv"):
+            name = f"{file_basename}{suffix}"
+            if name in names:
+                os.remove(video_basepath / name)
+                removed.append(name)
+    return removed
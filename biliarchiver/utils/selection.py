@@ -0,0 +1,167 @@
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from bilix.sites.bilibili import api
+
+from biliarchiver.i18n import _
+from biliarchiver.utils import metrics
+from biliarchiver.utils.storage import estimate_stream_size
+
+DEFAULT_CODECS = ["dvh", "hev", "avc"]
+""" dvh->hev->avc。不选 av0 ，毕竟目前没几个设备能拖得动 """
+
+
+@dataclass
+class SelectionPolicy:
+    """
+    dash 视频流的选择策略，对应 config.json 中的 "selection"，也可以在 down 时逐项覆盖。
+
+    按 codecs 的顺序逐个编码尝试，同一编码内从高画质往低画质找第一个满足所有限制的流。
+    都不满足时退而求其次，选允许的编码中估算体积最小的。
+    默认不设任何限制，等同于原来的 dvh->hev->avc 取最高画质。
+    """
+
+    codecs: List[str] = field(default_factory=lambda: list(DEFAULT_CODECS))
+    max_height: Optional[int] = None
+    """ 最高分辨率（高度，如 1080） """
+    max_bytes_per_minute: Optional[int] = None
+    """ 音视频合计每分钟最多多少字节 """
+    max_bytes_per_bv: Optional[int] = None
+    """ 整个 BV 的音视频合计最多多少字节，按各分P时长分摊 """
+
+    @classmethod
+    def from_dict(cls, d: Optional[Dict[str, Any]]) -> "SelectionPolicy":
+        d = d or {}
+        known = {f.name for f in fields(cls)}
+        unknown = set(d) - known
+        if unknown:
+            raise ValueError(_("未知的 selection 配置项: {}").format(", ".join(sorted(unknown))))
+        policy = cls(**d)
+        if not policy.codecs:
+            raise ValueError(_("selection.codecs 不能为空"))
+        return policy
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    def override(self, **kwargs) -> "SelectionPolicy":
+        """ 用非 None 的参数覆盖，返回新的策略 """
+        return replace(self, **{k: v for k, v in kwargs.items() if v is not None})
+
+    def page_byte_caps(
+        self, page_count: int, page_durations: Optional[Sequence[int]] = None
+    ) -> List[Optional[int]]:
+        """ 把 max_bytes_per_bv 按时长（拿不到时长就平均）分给各分P """
+        if self.max_bytes_per_bv is None:
+            return [None] * page_count
+        if page_durations and len(page_durations) == page_count and sum(page_durations) > 0:
+            total = sum(page_durations)
+            return [int(self.max_bytes_per_bv * dur / total) for dur in page_durations]
+        return [self.max_bytes_per_bv // page_count] * page_count
+
+    def estimate_size(self, dash: api.Dash, video: api.Media) -> int:
+        """ 选中该视频流后，音视频合计的估算大小（bilix 总是取第一条音频） """
+        audio = dash.audios[0] if dash.audios else None
+        size = estimate_stream_size(video, dash.duration)
+        if audio is not None:
+            size += estimate_stream_size(audio, dash.duration)
+        return size
+
+    def _fits(self, dash: api.Dash, video: api.Media, byte_cap: Optional[int]) -> bool:
+        if self.max_height is not None and (video.height or 0) > self.max_height:
+            return False
+        size = self.estimate_size(dash, video)
+        if self.max_bytes_per_minute is not None and dash.duration > 0:
+            if size / (dash.duration / 60) > self.max_bytes_per_minute:
+                return False
+        if byte_cap is not None and size > byte_cap:
+            return False
+        return True
+
+    def rank_videos(
+        self,
+        dash: api.Dash,
+        byte_cap: Optional[int] = None,
+        codecs: Optional[List[str]] = None,
+    ) -> List[api.Media]:
+        """
+        按偏好排列允许的编码下的所有视频流：
+        先是满足限制的（按 codecs 顺序，同一编码内画质从高到低），再是不满足的（估算体积从小到大）
+        """
+        codecs = codecs or self.codecs
+        fitting: List[api.Media] = []
+        others: List[api.Media] = []
+        for codec in codecs:
+            for media in dash.videos:  # bilix 按画质从高到低排列
+                if not media.codec or not media.codec.startswith(codec):
+                    continue
+                if self._fits(dash, media, byte_cap):
+                    fitting.append(media)
+                else:
+                    others.append(media)
+        others.sort(key=lambda media: self.estimate_size(dash, media))
+        return fitting + others
+
+    def _codec_family(self, media: api.Media) -> str:
+        """ media 属于 codecs 里的哪一项（codecs 里是前缀，如 "hev" 对应 "hev1.1.6.L150.90"） """
+        for codec in self.codecs:
+            if media.codec and media.codec.startswith(codec):
+                return codec
+        return media.codec or ""
+
+    def _report_unfit(self, dash: api.Dash, media: api.Media, byte_cap: Optional[int]):
+        if not self._fits(dash, media, byte_cap):
+            print(
+                _("没有满足选择策略的视频流，选用最小的 \"{}\" \"{}\"").format(
+                    media.codec, media.quality
+                )
+            )
+
+    def choose_video(
+        self,
+        dash: api.Dash,
+        byte_cap: Optional[int] = None,
+        codecs: Optional[List[str]] = None,
+    ) -> Optional[api.Media]:
+        """
+        byte_cap: 该分P的字节上限（来自 page_byte_caps）
+        codecs: 临时覆盖编码顺序
+        """
+        ranked = self.rank_videos(dash, byte_cap, codecs)
+        if not ranked:
+            return None
+        self._report_unfit(dash, ranked[0], byte_cap)
+        return ranked[0]
+
+    async def choose_available_video(
+        self,
+        dash: api.Dash,
+        probe: Callable[[api.Media], Awaitable[bool]],
+        byte_cap: Optional[int] = None,
+    ) -> Optional[api.Media]:
+        """
+        同 choose_video，但先用 probe 探测，跳过实际拿不到的流（如一些老视频的 hevc 资源不存在），
+        在写入任何数据之前就确定编码。
+        所有流都探测失败时（更可能是网络问题）退回 choose_video 的结果，交给下载时的重试处理。
+
+        缺资源时通常整个编码都缺，所以一个编码的流探测失败后，直接跳到下一个编码，
+        不再逐个探测该编码的低画质流。
+        """
+        ranked = self.rank_videos(dash, byte_cap)
+        if not ranked:
+            return None
+        unavailable_codecs = set()
+        for media in ranked:
+            codec = self._codec_family(media)
+            if codec in unavailable_codecs:
+                continue
+            if await probe(media):
+                break
+            print(_("\"{}\" 编码的视频流不可用（\"{}\"），尝试下一个编码").format(media.codec, media.quality))
+            metrics.STREAM_UNAVAILABLE.labels(codec=media.codec).inc()
+            unavailable_codecs.add(codec)
+        else:
+            print(_("所有候选视频流都探测失败，仍按选择策略下载"))
+            media = ranked[0]
+        self._report_unfit(dash, media, byte_cap)
+        return media
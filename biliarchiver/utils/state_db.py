@@ -0,0 +1,291 @@
+import os
+import sqlite3
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from biliarchiver.i18n import _
+
+STATE_DB_FILENAME = "state.db"
+
+
+class BVState(str, Enum):
+    downloading = "downloading"  # 已开始下载，还没有 _all_downloaded.mark
+    downloaded = "downloaded"  # _all_downloaded.mark
+
+
+class PartState(str, Enum):
+    downloaded = "downloaded"  # _downloaded.mark
+    uploaded = "uploaded"  # _uploaded.mark
+    deleted = "deleted"  # 上传后本地文件已删除（delete_after_upload）
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bv (
+    bvid TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    spam INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bv_state_idx ON bv (state, spam);
+CREATE TABLE IF NOT EXISTS part (
+    bvid TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (bvid, pid)
+);
+CREATE INDEX IF NOT EXISTS part_state_idx ON part (state, bvid);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class StateDB:
+    """
+    记录每个 BV 及其分P 生命周期状态的 SQLite 数据库 (WAL)。
+
+    .mark 文件仍然照常写入（兼容旧版本和其他工具），这里是它们的索引：
+    down / up -a / clean 查询这里，而不是对整个 videos 目录做 exists() / iterdir()。
+    """
+
+    def __init__(self, db_path: Union[Path, str]):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.db_path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _transaction(self, statements: List[tuple]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    if params and isinstance(params[0], (list, tuple)):
+                        self._conn.executemany(sql, params)
+                    else:
+                        self._conn.execute(sql, params)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # ---- meta ----
+
+    def get_meta(self, key: str) -> Optional[str]:
+        rows = self._execute("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def set_meta(self, key: str, value: str):
+        self._execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    # ---- 写入 ----
+
+    def set_bv_state(self, bvid: str, state: BVState):
+        self._execute(
+            "INSERT INTO bv (bvid, state, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (bvid) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+            (bvid, state.value, time.time()),
+        )
+
+    def set_bv_spam(self, bvid: str, spam: bool = True):
+        """
+        只更新已有的 BV。没有记录的（如还没 import_tree）不插入：
+        插入时不知道它的下载状态，写成 downloading 会让 down 以为它没下完。
+        _spam.mark 照常写入，之后 import_tree 会读到它
+        """
+        self._execute(
+            "UPDATE bv SET spam = ?, updated_at = ? WHERE bvid = ?",
+            (int(spam), time.time(), bvid),
+        )
+
+    def set_part_state(self, bvid: str, pid: int, state: PartState):
+        self._execute(
+            "INSERT INTO part (bvid, pid, state, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (bvid, pid) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+            (bvid, int(pid), state.value, time.time()),
+        )
+
+    def forget_bv(self, bvid: str):
+        """ 本地的 BV 文件夹被整个删掉时调用 """
+        self._transaction(
+            [
+                ("DELETE FROM part WHERE bvid = ?", (bvid,)),
+                ("DELETE FROM bv WHERE bvid = ?", (bvid,)),
+            ]
+        )
+
+    # ---- 查询 ----
+
+    def bv_state(self, bvid: str) -> Optional[BVState]:
+        rows = self._execute("SELECT state FROM bv WHERE bvid = ?", (bvid,))
+        return BVState(rows[0][0]) if rows else None
+
+    def is_bv_downloaded(self, bvid: str) -> bool:
+        return self.bv_state(bvid) == BVState.downloaded
+
+    def is_bv_spam(self, bvid: str) -> bool:
+        rows = self._execute("SELECT spam FROM bv WHERE bvid = ?", (bvid,))
+        return bool(rows and rows[0][0])
+
+    def part_states(self, bvid: str) -> Dict[int, PartState]:
+        rows = self._execute("SELECT pid, state FROM part WHERE bvid = ?", (bvid,))
+        return {pid: PartState(state) for pid, state in rows}
+
+    def bvids(self, state: BVState, spam: Optional[bool] = None) -> List[str]:
+        if spam is None:
+            rows = self._execute("SELECT bvid FROM bv WHERE state = ?", (state.value,))
+        else:
+            rows = self._execute(
+                "SELECT bvid FROM bv WHERE state = ? AND spam = ?",
+                (state.value, int(spam)),
+            )
+        return [row[0] for row in rows]
+
+    def bvids_pending_upload(self, include_spam: bool = False) -> List[str]:
+        """ 已下载完成、但还有分P没上传的 BV """
+        sql = (
+            "SELECT DISTINCT bv.bvid FROM part JOIN bv ON bv.bvid = part.bvid "
+            "WHERE part.state = ? AND bv.state = ?"
+        )
+        if not include_spam:
+            sql += " AND bv.spam = 0"
+        rows = self._execute(
+            sql, (PartState.downloaded.value, BVState.downloaded.value)
+        )
+        return [row[0] for row in rows]
+
+    def bvids_with_local_parts(self) -> List[str]:
+        """ 已下载完成、且本地还有分P文件夹（没有在上传后删除）的 BV """
+        rows = self._execute(
+            "SELECT DISTINCT bv.bvid FROM part JOIN bv ON bv.bvid = part.bvid "
+            "WHERE part.state != ? AND bv.state = ?",
+            (PartState.deleted.value, BVState.downloaded.value),
+        )
+        return [row[0] for row in rows]
+
+    # ---- 导入 ----
+
+    def import_tree(self, videos_dir: Union[Path, str]) -> int:
+        """
+        从已有的 videos 目录（.mark 文件）导入状态。返回导入的 BV 数。
+        文件夹已经不存在的 BV 从状态库删掉，这样被手动删除的 BV 会重新下载
+        """
+        videos_dir = Path(videos_dir)
+        if not videos_dir.exists():
+            return 0
+
+        now = time.time()
+        bv_rows = []
+        part_rows = []
+        with os.scandir(videos_dir) as bv_entries:
+            for bv_entry in bv_entries:
+                if not bv_entry.is_dir() or "-" not in bv_entry.name:
+                    continue
+                bvid = bv_entry.name.split("-")[0]
+                if not bvid.startswith("BV"):
+                    continue
+
+                bv_files = set()
+                part_dirs = []
+                with os.scandir(bv_entry.path) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            part_dirs.append(entry)
+                        else:
+                            bv_files.add(entry.name)
+
+                bv_state = (
+                    BVState.downloaded
+                    if "_all_downloaded.mark" in bv_files
+                    else BVState.downloading
+                )
+                bv_rows.append(
+                    (bvid, bv_state.value, int("_spam.mark" in bv_files), now)
+                )
+                for part_dir in part_dirs:
+                    # BiliBili-{bvid}_p{pid}
+                    pid = part_dir.name.split("_")[-1][1:]
+                    if not pid.isdigit():
+                        continue
+                    part_files = set(os.listdir(part_dir.path))
+                    if "_uploaded.mark" in part_files or "_uploaded.mark" in bv_files:
+                        part_state = PartState.uploaded
+                    elif "_downloaded.mark" in part_files:
+                        part_state = PartState.downloaded
+                    else:
+                        continue
+                    part_rows.append((bvid, int(pid), part_state.value, now))
+
+        seen = {row[0] for row in bv_rows}
+        missing = [
+            (bvid,) for (bvid,) in self._execute("SELECT bvid FROM bv") if bvid not in seen
+        ]
+        statements = []
+        if missing:
+            statements.append(("DELETE FROM part WHERE bvid = ?", missing))
+            statements.append(("DELETE FROM bv WHERE bvid = ?", missing))
+        if bv_rows:
+            statements.append(
+                (
+                    "INSERT INTO bv (bvid, state, spam, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (bvid) DO UPDATE SET state = excluded.state, "
+                    "spam = excluded.spam, updated_at = excluded.updated_at",
+                    bv_rows,
+                )
+            )
+        if part_rows:
+            statements.append(
+                (
+                    "INSERT INTO part (bvid, pid, state, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (bvid, pid) DO UPDATE SET state = excluded.state, "
+                    "updated_at = excluded.updated_at",
+                    part_rows,
+                )
+            )
+        if statements:
+            self._transaction(statements)
+        self.set_meta("imported_at", str(int(now)))
+        return len(bv_rows)
+
+
+_state_dbs: Dict[Path, StateDB] = {}
+_state_dbs_lock = threading.Lock()
+
+
+def get_state_db(storage_home_dir: Optional[Path] = None) -> StateDB:
+    """ 获取（并在首次使用时从现有的 .mark 文件导入）storage_home_dir 下的状态库 """
+    if storage_home_dir is None:
+        from biliarchiver.config import config
+
+        storage_home_dir = config.storage_home_dir
+    db_path = Path(storage_home_dir) / STATE_DB_FILENAME
+    with _state_dbs_lock:
+        if db_path not in _state_dbs:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            state_db = StateDB(db_path)
+            if state_db.get_meta("imported_at") is None:
+                print(_("首次使用状态库，正在从已有的 .mark 文件导入..."))
+                count = state_db.import_tree(Path(storage_home_dir) / "videos")
+                print(_("已导入 {} 个 BV 的状态").format(count))
+            _state_dbs[db_path] = state_db
+        return _state_dbs[db_path]
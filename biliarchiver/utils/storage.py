@@ -1,10 +1,15 @@
 
+import asyncio
 import ctypes
 import os
 import platform
-from typing import Union
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, Tuple, Union
 from pathlib import Path
 
+from biliarchiver.i18n import _
+from biliarchiver.utils.tracing import span
+
 
 def get_free_space(path: Union[Path,str]) -> int:
     """Return folder/drive free space (in bytes)."""
@@ -19,3 +24,115 @@ def get_free_space(path: Union[Path,str]) -> int:
     else:
         st = os.statvfs(path)
         return st.f_bavail * st.f_frsize
+
+
+MERGE_FACTOR = 2.0
+""" 合并（ffmpeg combine）时音视频分轨和合并后的文件同时存在，峰值占用约为流大小的两倍 """
+
+
+def estimate_stream_size(media, duration: int) -> int:
+    """ 估算单条媒体流的大小（bytes）。dash 流用 bandwidth(bps) * duration(s)，durl 资源直接用 size """
+    bandwidth = getattr(media, "bandwidth", None)
+    if bandwidth and duration:
+        return int(bandwidth * duration / 8)
+    return getattr(media, "size", None) or 0
+
+
+def estimate_download_size(medias: Iterable, duration: int) -> int:
+    """ 估算下载并合并这些流的峰值磁盘占用 """
+    return int(
+        sum(estimate_stream_size(media, duration) for media in medias if media is not None)
+        * MERGE_FACTOR
+    )
+
+
+def get_dir_size(path: Union[Path, str]) -> int:
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass  # 下载/合并过程中文件可能随时被删掉
+    return total
+
+
+class InsufficientSpaceError(RuntimeError):
+    pass
+
+
+class SpaceBudget:
+    """
+    为并发下载的分P预留磁盘空间。
+
+    每个分P开始下载前按估算大小预留，完成（或出错）后释放。
+    剩余空间扣掉所有预留中尚未落盘的部分（估算大小 - 目录当前大小）后，
+    仍高于 min_free_bytes 才放行，否则等其他分P释放；没有可等的则抛出 InsufficientSpaceError。
+
+    统计目录大小要遍历目录，wait_for 把它放到 executor 里，不卡住事件循环；
+    reserve 的检查和登记由 _admission 串行，两个分P不会基于同一份剩余空间同时放行。
+    """
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+        min_free_bytes: int,
+        poll_interval: float = 5,
+    ):
+        self.path = Path(path)
+        self.min_free_bytes = min_free_bytes
+        self.poll_interval = poll_interval
+        self._reservations: Dict[int, Tuple[Path, int]] = {}
+        self._next_id = 0
+        self._released = asyncio.Event()
+        self._admission = asyncio.Lock()
+        self.last_outstanding = 0
+        """ 最近一次 outstanding() 的结果，给指标用，抓取时不用遍历目录 """
+
+    def outstanding(self) -> int:
+        """ 已预留但还没写到磁盘上的字节数 """
+        self.last_outstanding = sum(
+            max(0, size - get_dir_size(directory))
+            for directory, size in list(self._reservations.values())
+        )
+        return self.last_outstanding
+
+    def headroom(self) -> int:
+        return get_free_space(self.path) - self.outstanding() - self.min_free_bytes
+
+    async def wait_for(self, size: int):
+        """ 等到放得下 size bytes 为止 """
+        loop = asyncio.get_running_loop()
+        while True:
+            headroom = await loop.run_in_executor(None, self.headroom)
+            if size <= headroom:
+                return
+            if not self._reservations:
+                raise InsufficientSpaceError(
+                    _("剩余空间不足：需要 {} MiB，可用 {} MiB（已扣除保留的 {} GiB）").format(
+                        size // 1024 // 1024,
+                        max(0, headroom) // 1024 // 1024,
+                        self.min_free_bytes // 1024 // 1024 // 1024,
+                    )
+                )
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    @asynccontextmanager
+    async def reserve(self, directory: Union[Path, str], size: int):
+        with span("down.space_wait", bytes=size):
+            async with self._admission:
+                await self.wait_for(size)
+                reservation_id = self._next_id
+                self._next_id += 1
+                self._reservations[reservation_id] = (Path(directory), size)
+        try:
+            yield
+        finally:
+            del self._reservations[reservation_id]
+            if not self._reservations:
+                self.last_outstanding = 0
+            self._released.set()
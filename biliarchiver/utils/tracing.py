@@ -0,0 +1,213 @@
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import math
+import os
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+TRACE_MAX_BYTES = 64 * 1024 * 1024
+TRACE_BACKUP_COUNT = 5
+INHERITED_ATTRS = ("bvid", "pid")
+""" 子 span 自动继承父 span 的这些属性，ffmpeg 合并等深处的步骤也能按 BV 归类 """
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "attrs", "start")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: dict):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        inherited = {k: parent.attrs[k] for k in INHERITED_ATTRS if parent is not None and k in parent.attrs}
+        self.attrs = dict(inherited, **attrs)
+        self.start = time.time()
+
+    def set(self, **attrs):
+        """ 补充执行中才知道的属性，如编码、字节数 """
+        self.attrs.update(attrs)
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "biliarchiver_current_span", default=None
+)
+
+
+class Tracer:
+    """
+    轻量的耗时追踪：每个步骤一个 span，结束时写一行 JSON 到滚动的日志文件。
+
+    span 之间的父子关系通过 contextvars 传递，asyncio 任务会自动继承创建它时的当前 span。
+    用 logging 的 RotatingFileHandler 写文件，线程安全，文件到 TRACE_MAX_BYTES 后轮转。
+    RotatingFileHandler 不能跨进程共用一个文件（两个进程各自轮转会互相覆盖、丢记录），
+    所以每个进程写自己的 {stem}.{pid}{suffix}（见 process_trace_file），trace-report 再把它们合起来读。
+    """
+
+    def __init__(self, path: Union[Path, str, None]):
+        self.path = Path(path).expanduser() if path else None
+        self._logger: Optional[logging.Logger] = None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                process_trace_file(self.path),
+                maxBytes=TRACE_MAX_BYTES,
+                backupCount=TRACE_BACKUP_COUNT,
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger = logging.getLogger(f"biliarchiver.tracing.{self.path}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.handlers = [handler]
+
+    @property
+    def enabled(self) -> bool:
+        return self._logger is not None
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        span = Span(name, _current_span.get(), attrs)
+        if not self.enabled:
+            yield span
+            return
+        token = _current_span.set(span)
+        status = "ok"
+        try:
+            yield span
+        except BaseException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            self._emit(span, status)
+
+    def _emit(self, span: Span, status: str):
+        assert self._logger is not None
+        end = time.time()
+        self._logger.info(
+            json.dumps(
+                {
+                    "name": span.name,
+                    "ts": span.start,
+                    "dur": end - span.start,
+                    "status": status,
+                    "span": span.span_id,
+                    "parent": span.parent_id,
+                    "pid": os.getpid(),
+                    "attrs": span.attrs,
+                },
+                ensure_ascii=False,
+                default=str,
+            )
+        )
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """ 第一次调用时读取 config.json 的 trace_file；没有设置时返回不记录任何东西的 Tracer """
+    global _tracer
+    if _tracer is None:
+        from biliarchiver.config import config
+
+        _tracer = Tracer(config.trace_file or None)
+    return _tracer
+
+
+def set_trace_file(path: Optional[str]):
+    """ 命令行的 --trace-file 覆盖 config.json """
+    global _tracer
+    if path:
+        _tracer = Tracer(path)
+
+
+def span(name: str, **attrs):
+    return get_tracer().span(name, **attrs)
+
+
+def traced(name: str):
+    """ 给协程函数加 span 的装饰器（参数不记录；需要属性时在函数里用 span） """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ---- trace-report ----
+
+
+def process_trace_file(path: Path, pid: Optional[int] = None) -> Path:
+    """ trace.jsonl -> trace.{pid}.jsonl """
+    return path.with_name(f"{path.stem}.{pid or os.getpid()}{path.suffix}")
+
+
+def trace_files(path: Union[Path, str]) -> List[Path]:
+    """ 各进程的文件（见 process_trace_file）和它们轮转出的 .1 .. .N，按修改时间从旧到新 """
+    path = Path(path).expanduser()
+    if not path.parent.is_dir():
+        return []
+    pattern = re.compile(
+        rf"{re.escape(path.stem)}\.\d+{re.escape(path.suffix)}(\.\d+)?$"
+    )
+    paths = [p for p in path.parent.iterdir() if pattern.match(p.name) and p.is_file()]
+    if path.is_file():
+        # 以前所有进程共用的单个文件
+        paths.append(path)
+    return sorted(paths, key=lambda p: p.stat().st_mtime)
+
+
+def iter_spans(paths: Iterable[Path]) -> Iterator[dict]:
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 进程被杀时可能只写了半行
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """ 最近秩法 """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(spans: Iterable[dict]) -> Dict[str, Dict[str, float]]:
+    durations: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    nbytes: Dict[str, int] = {}
+    for s in spans:
+        name = s["name"]
+        durations.setdefault(name, []).append(s["dur"])
+        if s.get("status", "ok") != "ok":
+            errors[name] = errors.get(name, 0) + 1
+        size = (s.get("attrs") or {}).get("bytes")
+        if isinstance(size, int):
+            nbytes[name] = nbytes.get(name, 0) + size
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "total": sum(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "max": values[-1],
+            "bytes": nbytes.get(name, 0),
+        }
+    return summary
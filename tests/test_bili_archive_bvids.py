@@ -0,0 +1,9 @@
+from biliarchiver.cli_tools.bili_archive_bvids import account_limiter_key
+
+
+def test_account_limiter_key_differs_for_same_named_cookies(tmp_path):
+    a = tmp_path / "a" / "cookies.txt"
+    b = tmp_path / "b" / "cookies.txt"
+    assert account_limiter_key(a) != account_limiter_key(b)
+    assert account_limiter_key(a) == account_limiter_key(tmp_path / "b" / ".." / "a" / "cookies.txt")
+    assert account_limiter_key(a).startswith("cookies-")
@@ -0,0 +1,17 @@
+import asyncio
+
+import pytest
+
+from biliarchiver import _biliarchiver_upload_bvid
+from biliarchiver._biliarchiver_upload_bvid import UploadResult
+from biliarchiver.rest_api.bilivid import BiliVideo, VideoStatus
+
+
+@pytest.mark.parametrize(
+    "result, retcode",
+    [(UploadResult.uploaded, 0), (UploadResult.skipped, 2), (UploadResult.deferred, 2)],
+)
+def test_up_retcode_reflects_upload_result(monkeypatch, result, retcode):
+    monkeypatch.setattr(_biliarchiver_upload_bvid, "upload_bvid", lambda *args, **kwargs: result)
+    video = BiliVideo("BV1xx411c7mD", VideoStatus.uploading)
+    assert asyncio.run(video.up()) == retcode
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import threading
+
+from biliarchiver.cli_tools.utils import aiter_bvids, bvids_may_block, iter_bvids
+
+BVIDS = ["BV1xx411c7mD", "BV1GJ411x7h7", "BV1uv411q7Mv"]
+
+
+def test_iter_bvids_long_inline_list_is_not_a_path():
+    # 太长的列表当成路径会 ENAMETOOLONG
+    bvids = " ".join(BVIDS * 200)
+    assert [entry.bvid for entry in iter_bvids(bvids)] == BVIDS * 200
+    assert not bvids_may_block(bvids)
+
+
+def test_aiter_bvids_reads_fifo_without_blocking_the_loop(tmp_path):
+    fifo = tmp_path / "bvids.fifo"
+    os.mkfifo(fifo)
+    assert bvids_may_block(str(fifo))
+    release = threading.Event()
+
+    def writer():
+        with open(fifo, "w", encoding="utf-8") as f:
+            f.write(BVIDS[0] + "\n")
+            f.flush()
+            release.wait(5)
+            f.write("\n".join(BVIDS[1:]) + "\n")
+
+    threading.Thread(target=writer, daemon=True).start()
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+                if ticks == 5:
+                    release.set()
+
+        ticker_task = asyncio.create_task(ticker())
+        got = [entry.bvid async for entry in aiter_bvids(iter_bvids(str(fifo)), True)]
+        ticker_task.cancel()
+        return got, ticks
+
+    got, ticks = asyncio.run(main())
+    assert got == BVIDS
+    # 读线程在等 FIFO 时，事件循环还在跑
+    assert ticks >= 5
@@ -0,0 +1,31 @@
+from biliarchiver.cli_tools.utils import BVidEntry, BVidsCheckpoint
+from biliarchiver.utils.coordinator import Coordinator, LeaseStatus
+
+
+def test_acquire_distinguishes_held_and_done(tmp_path):
+    db = tmp_path / "coordinator.db"
+    a = Coordinator(db, "down", owner="a")
+    b = Coordinator(db, "down", owner="b")
+    try:
+        assert a.acquire("BV1xx411c7mD") is LeaseStatus.acquired
+        assert b.acquire("BV1xx411c7mD") is LeaseStatus.held
+        a.release("BV1xx411c7mD", ok=True)
+        assert b.acquire("BV1xx411c7mD") is LeaseStatus.done
+    finally:
+        a.close()
+        b.close()
+
+
+def test_checkpoint_does_not_pass_bvids_skipped_for_other_workers(tmp_path):
+    bvids_file = tmp_path / "bvids.txt"
+    bvids_file.write_text("BV1xx411c7mD\nBV1GJ411x7h7\nBV1uv411q7Mv\n", encoding="utf-8")
+    checkpoint = BVidsCheckpoint(tmp_path / "checkpoint.json", str(bvids_file))
+    first = checkpoint.dispatched(BVidEntry("BV1xx411c7mD", 0, 13))
+    second = checkpoint.dispatched(BVidEntry("BV1GJ411x7h7", 13, 26))
+    third = checkpoint.dispatched(BVidEntry("BV1uv411q7Mv", 26, 39))
+    checkpoint.finished(first)
+    # 其他 worker 正在处理第二个，可能失败
+    checkpoint.skipped(second)
+    checkpoint.finished(third)
+    assert checkpoint.offset() == 13
+    assert checkpoint.load() == 13
@@ -0,0 +1,19 @@
+import asyncio
+
+from biliarchiver.utils.danmaku import (
+    DANMAKU_PENDING_FILENAME,
+    convert_pending_danmaku,
+    write_danmaku_pending,
+)
+
+
+def test_pending_without_pb_is_resolved(tmp_path):
+    part_dir = tmp_path / "BiliBili-BV1xx411c7mD_p1"
+    (part_dir / "extra").mkdir(parents=True)
+    write_danmaku_pending(part_dir, "BV1xx411c7mD_p1.pb", "BV1xx411c7mD_p1.ass", 1920, 1080)
+    pending_file = part_dir / DANMAKU_PENDING_FILENAME
+
+    # pb 不存在时用不到转换器
+    assert asyncio.run(convert_pending_danmaku(pending_file, converter=None)) is True
+    assert not pending_file.exists()
+    assert not (part_dir / "extra" / "BV1xx411c7mD_p1.ass").exists()
@@ -0,0 +1,82 @@
+import hashlib
+
+from biliarchiver.utils.blobs import BlobStore
+from biliarchiver.utils.danmaku import DANMAKU_PENDING_FILENAME
+from biliarchiver.utils.manifest import MANIFEST_FILENAME, PartManifest, record_digests, verify_part
+from biliarchiver.utils.resume import merge_parts
+
+
+def _downloaded_part(tmp_path):
+    part_dir = tmp_path / "BiliBili-BV1xx411c7mD_p1"
+    part_dir.mkdir()
+    (part_dir / "BV1xx411c7mD_p1.mp4").write_bytes(b"\0" * 16)
+    (part_dir / "_downloaded.mark").touch()
+    return part_dir
+
+
+def test_verify_part_passes_downloaded_part(tmp_path):
+    part_dir = _downloaded_part(tmp_path)
+    assert verify_part(part_dir) is None
+    # 校验只看元数据，不读文件算摘要
+    assert not (part_dir / MANIFEST_FILENAME).exists()
+
+
+def test_verify_part_fails_part_with_pending_danmaku(tmp_path):
+    part_dir = _downloaded_part(tmp_path)
+    (part_dir / DANMAKU_PENDING_FILENAME).write_text("{}", encoding="utf-8")
+    assert DANMAKU_PENDING_FILENAME in verify_part(part_dir)
+
+
+def test_merge_parts_records_digest(tmp_path):
+    part_dir = tmp_path / "BiliBili-BV1xx411c7mD_p1"
+    part_dir.mkdir()
+    path = part_dir / "BV1xx411c7mD_p1-v.m4s"
+    chunks = [b"a" * 10, b"b" * 20]
+    file_list = []
+    for i, chunk in enumerate(chunks):
+        part_path = part_dir / f"{path.name}.{i}"
+        part_path.write_bytes(chunk)
+        file_list.append(part_path)
+
+    merge_parts(file_list, path, part_dir / f"{path.name}.merging")
+
+    digest = PartManifest(part_dir).cached(path)
+    assert digest is not None
+    assert digest.md5 == hashlib.md5(b"".join(chunks)).hexdigest()
+
+    # 文件被改过后记录失效，不会拿旧摘要去上传
+    path.write_bytes(b"changed")
+    assert PartManifest(part_dir).cached(path) is None
+
+
+def test_blob_digests_recorded_for_each_part(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    data = b"{}\n" * 100
+    sha1s = []
+    for pid in (1, 2):
+        extra = tmp_path / f"BiliBili-BV1xx411c7mD_p{pid}" / "extra"
+        extra.mkdir(parents=True)
+        dest = extra / f"BV1xx411c7mD_p{pid}.replies.jsonl"
+        record_digests(extra.parent, {dest: store.write(data, dest)})
+        digest = PartManifest(extra.parent).cached(dest)
+        assert digest.md5 == hashlib.md5(data).hexdigest()
+        sha1s.append(digest.sha1)
+    assert sha1s[0] == sha1s[1]
+    assert store.path_of(sha1s[0]).stat().st_nlink == 3
+
+
+def test_blob_sha1s_cover_unrecorded_linked_files(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    part_dir = tmp_path / "BiliBili-BV1xx411c7mD_p1"
+    extra = part_dir / "extra"
+    extra.mkdir(parents=True)
+    info = extra / "BV1xx411c7mD_p1.info.json"
+    cover = extra / "BV1xx411c7mD_p1.jpg"
+    record_digests(part_dir, {info: store.write(b"{}", info)})
+    store.write(b"cover", cover)  # 旧版本下载的，清单里没有记录
+    (part_dir / "BV1xx411c7mD_p1.mp4").write_bytes(b"\0" * 16)
+
+    sha1s = PartManifest(part_dir).blob_sha1s()
+    assert sorted(sha1s) == sorted(
+        [hashlib.sha1(b"{}").hexdigest(), hashlib.sha1(b"cover").hexdigest()]
+    )
@@ -0,0 +1,25 @@
+import asyncio
+import threading
+
+from biliarchiver.utils.ratelimit import EndpointBucket, _SharedState
+
+
+def test_shared_bucket_updates_off_the_event_loop(tmp_path, monkeypatch):
+    shared = _SharedState(tmp_path / "ratelimit.json")
+    update_threads = []
+    update = shared.update
+
+    def recording_update(*args):
+        update_threads.append(threading.get_ident())
+        return update(*args)
+
+    monkeypatch.setattr(shared, "update", recording_update)
+    bucket = EndpointBucket("video", rate=100, shared=shared)
+
+    async def main():
+        await bucket.acquire()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    assert update_threads and loop_thread not in update_threads
+    assert (tmp_path / "ratelimit.json").exists()
@@ -0,0 +1,31 @@
+from biliarchiver.utils.blobs import BlobStore
+from biliarchiver.utils.replies import REPLIES_SCRATCH_FILENAME
+from biliarchiver.cli_tools.clean_command import clean_replies_scratch
+
+
+def test_adopt_moves_scratch_into_store(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    scratch = tmp_path / REPLIES_SCRATCH_FILENAME
+    scratch.write_bytes(b"{}\n" * 10)
+    blob, digest = store.adopt(scratch)
+    assert not scratch.exists()
+    assert blob.read_bytes() == b"{}\n" * 10
+    assert blob.name == digest.sha1.hexdigest()
+
+
+def test_clean_keeps_checkpoint_of_downloading_bv(tmp_path):
+    done = tmp_path / "BV1xx411c7mD-a"
+    downloading = tmp_path / "BV1xx411c7mE-a"
+    for bv_dir in (done, downloading):
+        bv_dir.mkdir()
+        (bv_dir / REPLIES_SCRATCH_FILENAME).touch()
+        (bv_dir / f"{REPLIES_SCRATCH_FILENAME}.partial").touch()
+        (bv_dir / f"{REPLIES_SCRATCH_FILENAME}.checkpoint.json").touch()
+
+    clean_replies_scratch(tmp_path, {"BV1xx411c7mE"})
+
+    assert list(done.iterdir()) == []
+    assert sorted(p.name for p in downloading.iterdir()) == [
+        f"{REPLIES_SCRATCH_FILENAME}.checkpoint.json",
+        f"{REPLIES_SCRATCH_FILENAME}.partial",
+    ]
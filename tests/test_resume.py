@@ -0,0 +1,66 @@
+import os
+
+from biliarchiver.utils.resume import ResumeRecord, merge_parts
+
+URL = "https://upos-sz-mirrorcos.bilivideo.com/upgcxcode/00/00/1/1-1-30080.m4s?e=1"
+RANGES = [(0, 9), (10, 19), (20, 29)]
+CONTENT = bytes(range(30))
+
+
+def _write_parts(record: ResumeRecord):
+    for start, end in RANGES:
+        record.part_path((start, end)).write_bytes(CONTENT[start : end + 1])
+
+
+def test_validate_after_interrupted_bilix_merge(tmp_path):
+    path = tmp_path / "BV1xx_p1-v.mp4"
+    record = ResumeRecord(path)
+    record.start([URL], len(CONTENT), RANGES)
+    _write_parts(record)
+    for part_range in RANGES:
+        record.mark_done(part_range)
+
+    # 模拟 bilix merge_files 在追加完第二个分段、删掉它之后被打断
+    first, second, third = (record.part_path(r) for r in RANGES)
+    with open(first, "ab") as f:
+        f.write(second.read_bytes())
+    os.remove(second)
+
+    assert ResumeRecord(path).matches([URL], len(CONTENT), RANGES)
+    removed = record.validate(RANGES)
+
+    assert removed == [first]
+    assert not first.exists() and not second.exists()
+    assert third.read_bytes() == CONTENT[20:30]
+    # 只有完整的第三段还算已完成
+    assert ResumeRecord(path).load()["done"] == [[20, 29]]
+
+
+def test_validate_drops_short_part_marked_done(tmp_path):
+    path = tmp_path / "BV1xx_p1-a.m4a"
+    record = ResumeRecord(path)
+    record.start([URL], len(CONTENT), RANGES)
+    _write_parts(record)
+    record.mark_done(RANGES[0])
+    record.part_path(RANGES[0]).write_bytes(CONTENT[:5])
+    # 未完成的分段可以比范围短，留着续传
+    record.part_path(RANGES[1]).write_bytes(CONTENT[10:15])
+
+    removed = record.validate(RANGES)
+
+    assert removed == [record.part_path(RANGES[0])]
+    assert record.part_path(RANGES[1]).exists()
+
+
+def test_merge_parts_is_atomic(tmp_path):
+    path = tmp_path / "BV1xx_p1-v.mp4"
+    record = ResumeRecord(path)
+    _write_parts(record)
+    file_list = [record.part_path(r) for r in RANGES]
+
+    merge_parts(file_list, path, record.merging_path)
+
+    assert path.read_bytes() == CONTENT
+    assert not record.merging_path.exists()
+    assert not any(p.exists() for p in file_list)
+
@@ -0,0 +1,67 @@
+import asyncio
+
+from bilix.sites.bilibili import api
+
+from biliarchiver.utils.selection import SelectionPolicy
+
+MiB = 1024 * 1024
+
+
+def _media(codec: str, height: int, quality: str, size: int) -> api.Media:
+    return api.Media(
+        base_url=f"https://upos.example/{codec}-{height}.m4s",
+        codec=codec,
+        height=height,
+        width=height * 16 // 9,
+        quality=quality,
+        size=size,
+    )
+
+
+def _dash() -> api.Dash:
+    # bilix 按画质从高到低排列
+    videos = [
+        _media("hev1.1.6.L150.90", 2160, "4K", 400 * MiB),
+        _media("avc1.640034", 2160, "4K", 800 * MiB),
+        _media("hev1.1.6.L120.90", 1080, "1080P", 100 * MiB),
+        _media("avc1.640032", 1080, "1080P", 200 * MiB),
+        _media("hev1.1.6.L120.90", 720, "720P", 50 * MiB),
+        _media("avc1.640028", 720, "720P", 100 * MiB),
+    ]
+    return api.Dash(duration=600, videos=videos, audios=[], video_formats={}, audio_formats={})
+
+
+def test_rank_videos_prefers_codec_then_quality():
+    ranked = SelectionPolicy().rank_videos(_dash())
+    assert [(m.codec[:3], m.height) for m in ranked] == [
+        ("hev", 2160), ("hev", 1080), ("hev", 720),
+        ("avc", 2160), ("avc", 1080), ("avc", 720),
+    ]
+
+
+def test_rank_videos_puts_unfit_streams_last_smallest_first():
+    ranked = SelectionPolicy(max_height=1080).rank_videos(_dash())
+    assert [(m.codec[:3], m.height) for m in ranked] == [
+        ("hev", 1080), ("hev", 720), ("avc", 1080), ("avc", 720),
+        ("hev", 2160), ("avc", 2160),
+    ]
+
+
+def test_choose_available_video_skips_codec_after_first_failure():
+    probed = []
+
+    async def probe(media: api.Media) -> bool:
+        probed.append((media.codec[:3], media.height))
+        return not media.codec.startswith("hev")
+
+    media = asyncio.run(SelectionPolicy().choose_available_video(_dash(), probe))
+    assert (media.codec[:3], media.height) == ("avc", 2160)
+    assert probed == [("hev", 2160), ("avc", 2160)]
+
+
+def test_choose_available_video_falls_back_when_everything_fails():
+    async def probe(media: api.Media) -> bool:
+        return False
+
+    media = asyncio.run(SelectionPolicy().choose_available_video(_dash(), probe))
+    assert (media.codec[:3], media.height) == ("hev", 2160)
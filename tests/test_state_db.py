@@ -0,0 +1,40 @@
+from biliarchiver.utils.state_db import BVState, StateDB
+
+
+def test_set_bv_spam_does_not_create_unknown_bv(tmp_path):
+    db = StateDB(tmp_path / "state.db")
+    try:
+        db.set_bv_spam("BV1xx411c7mD")
+        assert db.bv_state("BV1xx411c7mD") is None
+        assert not db.is_bv_spam("BV1xx411c7mD")
+    finally:
+        db.close()
+
+
+def test_set_bv_spam_keeps_state_of_known_bv(tmp_path):
+    db = StateDB(tmp_path / "state.db")
+    try:
+        db.set_bv_state("BV1xx411c7mD", BVState.downloaded)
+        db.set_bv_spam("BV1xx411c7mD")
+        assert db.bv_state("BV1xx411c7mD") is BVState.downloaded
+        assert db.is_bv_spam("BV1xx411c7mD")
+        db.set_bv_spam("BV1xx411c7mD", False)
+        assert not db.is_bv_spam("BV1xx411c7mD")
+    finally:
+        db.close()
+
+
+def test_import_tree_forgets_bv_whose_folder_is_gone(tmp_path):
+    videos_dir = tmp_path / "videos"
+    bv_dir = videos_dir / "BV1xx411c7mD-a"
+    (bv_dir / "BiliBili-BV1xx411c7mD_p1").mkdir(parents=True)
+    (bv_dir / "BiliBili-BV1xx411c7mD_p1" / "_downloaded.mark").touch()
+    (bv_dir / "_all_downloaded.mark").touch()
+    db = StateDB(tmp_path / "state.db")
+    try:
+        db.set_bv_state("BV1xx411c7mE", BVState.downloaded)  # 文件夹已被手动删除
+        assert db.import_tree(videos_dir) == 1
+        assert db.is_bv_downloaded("BV1xx411c7mD")
+        assert db.bv_state("BV1xx411c7mE") is None
+    finally:
+        db.close()
@@ -0,0 +1,32 @@
+import asyncio
+
+from biliarchiver.utils import storage, tracing
+from biliarchiver.utils.storage import SpaceBudget
+from biliarchiver.utils.tracing import Tracer
+
+MiB = 1024 * 1024
+
+
+def test_reserve_admits_one_page_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "get_free_space", lambda path: 150 * MiB)
+    monkeypatch.setattr(tracing, "_tracer", Tracer(None))
+
+    async def main():
+        budget = SpaceBudget(tmp_path, min_free_bytes=0, poll_interval=0.05)
+        admitted = []
+        release = asyncio.Event()
+
+        async def page(name: str):
+            async with budget.reserve(tmp_path / name, 100 * MiB):
+                admitted.append(name)
+                await release.wait()
+
+        tasks = [asyncio.create_task(page(name)) for name in ("p1", "p2")]
+        await asyncio.sleep(0.2)
+        # 两个分P共 200 MiB，只放得下一个；另一个要等前一个释放
+        assert len(admitted) == 1
+        release.set()
+        await asyncio.gather(*tasks)
+        assert sorted(admitted) == ["p1", "p2"]
+
+    asyncio.run(main())
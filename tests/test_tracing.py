@@ -0,0 +1,22 @@
+from biliarchiver.utils.tracing import Tracer, iter_spans, process_trace_file, trace_files
+
+
+def test_each_process_writes_its_own_trace_file(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = Tracer(path)
+    with tracer.span("down.bv", bvid="BV1xx411c7mD"):
+        pass
+    assert process_trace_file(path).exists()
+    assert not path.exists()
+
+    # 另一个进程写的文件和它轮转出的旧文件
+    other = process_trace_file(path, pid=1)
+    other.write_text(process_trace_file(path).read_text(encoding="utf-8"), encoding="utf-8")
+    other.with_name(f"{other.name}.1").write_text("", encoding="utf-8")
+    (tmp_path / "trace.jsonl.tmp").write_text("", encoding="utf-8")
+
+    paths = trace_files(path)
+    assert sorted(p.name for p in paths) == sorted(
+        [process_trace_file(path).name, other.name, f"{other.name}.1"]
+    )
+    assert [s["name"] for s in iter_spans(paths)] == ["down.bv", "down.bv"]
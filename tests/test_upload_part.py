@@ -0,0 +1,23 @@
+from biliarchiver._biliarchiver_upload_bvid import _upload_part
+from biliarchiver.utils.danmaku import DANMAKU_PENDING_FILENAME
+
+
+def test_part_with_pending_danmaku_is_not_uploaded(tmp_path):
+    local_identifier = "BiliBili-BV1xx411c7mD_p1"
+    part_dir = tmp_path / local_identifier
+    part_dir.mkdir()
+    (part_dir / "_downloaded.mark").touch()
+    (part_dir / DANMAKU_PENDING_FILENAME).write_text("{}", encoding="utf-8")
+
+    # ia=None：走到查询 IA 之前就应该返回
+    finished = _upload_part(
+        "BV1xx411c7mD",
+        local_identifier,
+        videos_basepath=tmp_path,
+        upper_part="a",
+        ia=None,
+        update_existing=False,
+        collection="opensource_movies",
+    )
+    assert finished is False
+    assert not (part_dir / "_uploaded.mark").exists()